@@ -107,6 +107,18 @@ def run():
   use_mock_data = get_env_var('USE_MOCK_DATA', False, var_type=bool)
   reload_files  = get_env_var('RELOAD_FILES',  True,  var_type=bool)
 
+  # Options for the ETL manager
+  etl_options = {
+    'loader':           get_env_var('TABLE_LOADER', can_be_none=True),
+    'workers':          get_env_var('ETL_WORKERS', 1, var_type=int),
+    'rebuild_indexes':  get_env_var('REBUILD_INDEXES', False, var_type=bool),
+    'shadow_load':      get_env_var('SHADOW_LOAD',     False, var_type=bool),
+    'snapshot_release': get_env_var('SNAPSHOT_RELEASE',         can_be_none=True),
+    'restore_release':  get_env_var('RESTORE_SNAPSHOT_RELEASE', can_be_none=True),
+    'resume':           get_env_var('RESUME', False, var_type=bool),
+    'download_workers': get_env_var('ETL_DOWNLOAD_WORKERS', 8, var_type=int),
+  }
+
   # Parse database operation
   try:
     db_op = DbOp[DATABASE_OPERATION]
@@ -120,7 +132,7 @@ def run():
   text = ""
 
   try:
-    execute_operation(app, db, db_op, species=species, reload_files=reload_files)
+    execute_operation(app, db, db_op, species=species, reload_files=reload_files, **etl_options)
     text = text + f"\n\nStatus: OK"
     text = text + f"\nOperation: {db_op.name}"
     text = text + f"\nOperation ID: {OPERATION_ID}"
@@ -139,6 +151,14 @@ def run():
   elapsed = "{:2f}".format(time.perf_counter() - start)
   text = text + f"\nProcessed in {elapsed} seconds."
   text = text + f"\nMock Data: { 'yes' if use_mock_data else 'no' }. (Production should NOT use mock data.)"
+  text = text + f"\nTable Loader: { etl_options['loader'] or 'default' }"
+  text = text + f"\nETL Workers: { etl_options['workers'] }"
+  text = text + f"\nRebuild Indexes: { 'yes' if etl_options['rebuild_indexes'] else 'no' }"
+  text = text + f"\nShadow Load: { 'yes' if etl_options['shadow_load'] else 'no' }"
+  text = text + f"\nSnapshot Release: { etl_options['snapshot_release'] or 'n/a' }"
+  text = text + f"\nRestored From Snapshot: { etl_options['restore_release'] or 'n/a' }"
+  text = text + f"\nResumed: { 'yes' if etl_options['resume'] else 'no' }"
+  text = text + f"\nDownload Workers: { etl_options['download_workers'] }"
 
   log_filepath = "/google/logs/output"
   try:
@@ -3,7 +3,7 @@ from caendr.services.cloud.postgresql import health_database_status
 from caendr.services.logger import logger
 
 from caendr.models.datastore import Species
-from caendr.models.sql import DbOp, WormbaseGene, WormbaseGeneSummary, Strain, StrainAnnotatedVariant, PhenotypeDatabase, PhenotypeMetadata
+from caendr.models.sql import DbOp, WormbaseGene, WormbaseGeneSummary, Strain, StrainAlias, StrainAnnotatedVariant, PhenotypeDatabase, PhenotypeMetadata
 from caendr.services.sql.db import backup_external_db
 from caendr.services.sql.etl import ETLManager
 
@@ -11,29 +11,41 @@ from seed_trait_files import populate_andersenlab_trait_files
 
 
 
-def execute_operation(app, db, db_op: DbOp, species=None, reload_files=True):
+def execute_operation(app, db, db_op: DbOp, species=None, reload_files=True, **etl_options):
   logger.info(f'Executing {db_op.name}...')
 
   if db_op == DbOp.DROP_AND_POPULATE_ALL_TABLES:
-    drop_and_populate_all_tables(app, db, species, reload_files=reload_files)
+    drop_and_populate_all_tables(app, db, species, reload_files=reload_files, **etl_options)
 
   elif db_op == DbOp.DROP_AND_POPULATE_STRAINS:
-    drop_and_populate_strains(app, db, species, reload_files=reload_files)
+    drop_and_populate_strains(app, db, species, reload_files=reload_files, **etl_options)
 
   elif db_op == DbOp.DROP_AND_POPULATE_WORMBASE_GENES:
-    drop_and_populate_wormbase_genes(app, db, species, reload_files=reload_files)
+    drop_and_populate_wormbase_genes(app, db, species, reload_files=reload_files, **etl_options)
 
   elif db_op == DbOp.DROP_AND_POPULATE_STRAIN_ANNOTATED_VARIANTS:
-    drop_and_populate_strain_annotated_variants(app, db, species, reload_files=reload_files)
+    drop_and_populate_strain_annotated_variants(app, db, species, reload_files=reload_files, **etl_options)
 
   elif db_op == DbOp.DROP_AND_POPULATE_PHENOTYPE_DB:
-    drop_and_populate_phenotype_db(app, db, species, reload_files=reload_files)
+    drop_and_populate_phenotype_db(app, db, species, reload_files=reload_files, **etl_options)
 
   elif db_op == DbOp.DROP_AND_POPULATE_PHENOTYPE_METADATA:
-    drop_and_populate_phenotype_metadata(app, db, species, reload_files=reload_files)
+    drop_and_populate_phenotype_metadata(app, db, species, reload_files=reload_files, **etl_options)
 
   elif db_op == DbOp.DROP_AND_POPULATE_PHENOTYPES:
-    drop_and_populate_phenotypes(app, db, species, reload_files=reload_files)
+    drop_and_populate_phenotypes(app, db, species, reload_files=reload_files, **etl_options)
+
+  elif db_op == DbOp.SYNC_WORMBASE_GENES:
+    sync_tables(app, db, [WormbaseGeneSummary, WormbaseGene], species, reload_files=reload_files, **etl_options)
+
+  elif db_op == DbOp.SYNC_STRAIN_ANNOTATED_VARIANTS:
+    sync_tables(app, db, [StrainAnnotatedVariant], species, reload_files=reload_files, **etl_options)
+
+  elif db_op == DbOp.SYNC_PHENOTYPES:
+    sync_tables(app, db, [PhenotypeMetadata, PhenotypeDatabase], species, reload_files=reload_files, **etl_options)
+
+  elif db_op == DbOp.SYNC_ALL_TABLES:
+    sync_all_tables(app, db, species, reload_files=reload_files, **etl_options)
 
   elif db_op == DbOp.POPULATE_PHENOTYPES_DATASTORE:
     populate_andersenlab_trait_files()
@@ -47,30 +59,31 @@ def execute_operation(app, db, db_op: DbOp, species=None, reload_files=True):
     os.environ["USE_MOCK_DATA"] = "1"
     os.environ["MODULE_DB_OPERATIONS_CONNECTION_TYPE"] = "memory"
     logger.info("Using MOCK DATA")
-    drop_and_populate_all_tables(app, db, species)
+    drop_and_populate_all_tables(app, db, species, **etl_options)
 
 
 
-def drop_and_populate_strains(app, db, species, reload_files=True):
+def drop_and_populate_strains(app, db, species, reload_files=True, **etl_options):
 
   # Initialize ETL Manager
-  etl_manager = ETLManager(app, db, reload_files=reload_files)
+  etl_manager = ETLManager(app, db, reload_files=reload_files, **etl_options)
 
   # Drop relevant tables
-  etl_manager.clear_tables( Strain, species_list=species )
+  etl_manager.clear_tables( Strain, StrainAlias, species_list=species )
 
   # Fetch and load data using ETL Manager
-  etl_manager.load_tables( Strain, species_list=species )
+  # Strain aliases are built from the strain table, so must be loaded after it
+  etl_manager.load_tables( Strain, StrainAlias, species_list=species )
 
 
-def drop_and_populate_wormbase_genes(app, db, species, reload_files=True):
+def drop_and_populate_wormbase_genes(app, db, species, reload_files=True, **etl_options):
 
   # Print operation & species info
   spec_strings = [ f'{key} (wb_ver = {val.wb_ver})' for key, val in Species.all().items() if (species is None or key in species) ]
   logger.info(f'Dropping and populating wormbase genes. Species list: [ {", ".join(spec_strings)} ]')
 
   # Initialize ETL Manager
-  etl_manager = ETLManager(app, db, reload_files=reload_files)
+  etl_manager = ETLManager(app, db, reload_files=reload_files, **etl_options)
 
   # Drop relevant tables
   logger.info(f"Dropping tables...")
@@ -83,14 +96,14 @@ def drop_and_populate_wormbase_genes(app, db, species, reload_files=True):
   # etl_manager.load_orthologs(db)
 
 
-def drop_and_populate_strain_annotated_variants(app, db, species, reload_files=True):
+def drop_and_populate_strain_annotated_variants(app, db, species, reload_files=True, **etl_options):
 
   # Print operation & species info
   spec_strings = [ f'{key} (release_sva = {val.release_sva})' for key, val in Species.all().items() if (species is None or key in species) ]
   logger.info(f'Dropping and populating strain annotated variants. Species list: [ {", ".join(spec_strings)} ]')
 
   # Initialize ETL Manager
-  etl_manager = ETLManager(app, db, reload_files=reload_files)
+  etl_manager = ETLManager(app, db, reload_files=reload_files, **etl_options)
 
   # Drop relevant table
   logger.info(f"Dropping table...")
@@ -100,15 +113,41 @@ def drop_and_populate_strain_annotated_variants(app, db, species, reload_files=T
   logger.info("Loading strain annotated variants...")
   etl_manager.load_tables(StrainAnnotatedVariant, species_list=species)
 
+  # Log the query plan for a sample interval query, to check that it uses the composite index
+  explain_strain_annotated_variant_intervals(db, species)
+
+
+def explain_strain_annotated_variant_intervals(db, species, interval_size=1_000_000):
+  '''
+    Log the query plan for an interval query over the start of the first chromosome of each species.
+    Query plans can only be explained in PostgreSQL, so this is skipped for other databases (e.g. mock data).
+  '''
+  if db.engine.dialect.name != 'postgresql':
+    logger.info(f'Skipping interval query plan for database dialect "{db.engine.dialect.name}".')
+    return
+
+  for name, spec in Species.all().items():
+    if species is not None and name not in species:
+      continue
 
-def drop_and_populate_phenotype_db(app, db, species, reload_files=True):
+    # Pick a chromosome with variants for this species
+    first = StrainAnnotatedVariant.query.filter_by(species_name=name).first()
+    if first is None:
+      continue
+
+    interval = {'chrom': first.chrom, 'start': 0, 'stop': interval_size}
+    plan = StrainAnnotatedVariant.explain_interval_query(interval, species=spec)
+    logger.info(f'Query plan for {name} interval {first.chrom}:0-{interval_size}:\n' + '\n'.join(plan))
+
+
+def drop_and_populate_phenotype_db(app, db, species, reload_files=True, **etl_options):
 
   # Print operation & species info
   spec_strings = [ f'{key} (release_sva = {val.release_sva})' for key, val in Species.all().items() if (species is None or key in species) ]
   logger.info(f'Dropping and populating phenotype database. Species list: [ {", ".join(spec_strings)} ]')
 
   # Initialize ETL Manager
-  etl_manager = ETLManager(app, db, reload_files=reload_files)
+  etl_manager = ETLManager(app, db, reload_files=reload_files, **etl_options)
 
   # Drop relevant table
   logger.info(f"Dropping table...")
@@ -118,14 +157,14 @@ def drop_and_populate_phenotype_db(app, db, species, reload_files=True):
   logger.info("Loading phenotypes...")
   etl_manager.load_tables(PhenotypeDatabase, species_list=species)
 
-def drop_and_populate_phenotype_metadata(app, db, species, reload_files=True):
+def drop_and_populate_phenotype_metadata(app, db, species, reload_files=True, **etl_options):
 
   # Print operation & species info
   spec_strings = [ f'{key} (release_sva = {val.release_sva})' for key, val in Species.all().items() if (species is None or key in species) ]
   logger.info(f'Dropping and populating phenotype metadata. Species list: [ {", ".join(spec_strings)} ]')
 
   # Initialize ETL Manager
-  etl_manager = ETLManager(app, db, reload_files=reload_files)
+  etl_manager = ETLManager(app, db, reload_files=reload_files, **etl_options)
 
   # Drop relevant table
   logger.info(f"Dropping table...")
@@ -135,14 +174,14 @@ def drop_and_populate_phenotype_metadata(app, db, species, reload_files=True):
   logger.info("Loading phenotypes...")
   etl_manager.load_tables(PhenotypeMetadata, species_list=species)
 
-def drop_and_populate_phenotypes(app, db, species, reload_files=True):
+def drop_and_populate_phenotypes(app, db, species, reload_files=True, **etl_options):
 
   # Print operation & species info
   spec_strings = [ f'{key} (release_sva = {val.release_sva})' for key, val in Species.all().items() if (species is None or key in species) ]
   logger.info(f'Dropping and populating phenotypes. Species list: [ {", ".join(spec_strings)} ]')
 
   # Initialize ETL Manager
-  etl_manager = ETLManager(app, db, reload_files=reload_files)
+  etl_manager = ETLManager(app, db, reload_files=reload_files, **etl_options)
 
   # Drop relevant table
   logger.info(f"Dropping table...")
@@ -153,20 +192,20 @@ def drop_and_populate_phenotypes(app, db, species, reload_files=True):
   etl_manager.load_tables(PhenotypeMetadata, PhenotypeDatabase, species_list=species)
 
 
-def drop_and_populate_all_tables(app, db, species, reload_files=True):
+def drop_and_populate_all_tables(app, db, species, reload_files=True, **etl_options):
 
   # Print operation & species info
   spec_strings = [ f'{key} (wb_ver = {val.wb_ver}, release_sva = {val.release_sva})' for key, val in Species.all().items() if (species is None or key in species) ]
   logger.info(f'Dropping and populating all tables. Species list: [ {", ".join(spec_strings)} ]')
 
   logger.info("[1/8] Downloading databases...eta ~0:15")
-  etl_manager = ETLManager(app, db, reload_files=reload_files)
+  etl_manager = ETLManager(app, db, reload_files=reload_files, **etl_options)
 
   logger.info("[2/8] Dropping tables...eta ~0:01")
   etl_manager.clear_tables(species_list=species)
 
   logger.info("[3/8] Load Strains...eta ~0:24")
-  etl_manager.load_tables(Strain, species_list=species)
+  etl_manager.load_tables(Strain, StrainAlias, species_list=species)
 
   logger.info("[4/8] Load genes summary...eta ~3:15")
   etl_manager.load_tables(WormbaseGeneSummary, species_list=species)
@@ -190,3 +229,39 @@ def drop_and_populate_all_tables(app, db, species, reload_files=True):
   logger.info("[8/8] Load Phenotype Metadata...")
   # etl_manager.load_phenotype_db(db, species)
   etl_manager.load_tables(PhenotypeMetadata, species_list=species)
+
+
+
+def sync_tables(app, db, tables, species, reload_files=True, **etl_options):
+
+  # Print operation & species info
+  logger.info(f'Syncing tables [{", ".join([ t.__tablename__ for t in tables ])}]. Species list: {species or "all"}')
+
+  # Initialize ETL Manager
+  etl_manager = ETLManager(app, db, reload_files=reload_files, **etl_options)
+
+  # Reload only the species whose source files have changed
+  changed = etl_manager.sync_tables(*tables, species_list=species)
+  logger.info(f'Reloaded species: [{", ".join(changed)}]')
+
+
+def sync_all_tables(app, db, species, reload_files=True, **etl_options):
+
+  # Print operation & species info
+  spec_strings = [ f'{key} (wb_ver = {val.wb_ver}, release_sva = {val.release_sva})' for key, val in Species.all().items() if (species is None or key in species) ]
+  logger.info(f'Syncing all tables. Species list: [ {", ".join(spec_strings)} ]')
+
+  etl_manager = ETLManager(app, db, reload_files=reload_files, **etl_options)
+
+  # Sync each group of dependent tables in turn
+  logger.info("[1/4] Sync Strains...")
+  etl_manager.sync_tables(Strain, StrainAlias, species_list=species)
+
+  logger.info("[2/4] Sync genes...")
+  etl_manager.sync_tables(WormbaseGeneSummary, WormbaseGene, species_list=species)
+
+  logger.info("[3/4] Sync Strains Annotated Variants...")
+  etl_manager.sync_tables(StrainAnnotatedVariant, species_list=species)
+
+  logger.info("[4/4] Sync Phenotypes...")
+  etl_manager.sync_tables(PhenotypeMetadata, PhenotypeDatabase, species_list=species)
@@ -37,7 +37,7 @@ from caendr.services.database_operation import get_db_op_form_options
 from caendr.services.indel_primer import get_indel_primer_chrom_choices
 from caendr.services.markdown import get_content_type_form_options
 from caendr.models.datastore import User, Species, DatasetRelease, TraitFile
-from caendr.api.strain import query_strains
+from caendr.api.strain import resolve_isotypes
 from base.forms.validators import (validate_duplicate_strain, 
                                    validate_duplicate_isotype, 
                                    validate_row_length, 
@@ -301,7 +301,8 @@ class TraitData(HiddenField):
 
     # Resolve isotypes and insert as second column
     try:
-      df = df.assign(ISOTYPE=[query_strains(x, resolve_isotype=True) for x in df.STRAIN])
+      isotypes = resolve_isotypes(df.STRAIN)
+      df = df.assign(ISOTYPE=[ isotypes.get(x) for x in df.STRAIN ])
       isotype_col = df.pop("ISOTYPE")
       df.insert(1, "ISOTYPE", isotype_col)
       logger.info(df)
@@ -209,4 +209,9 @@ def list_reports(ReportClass: Type[ReportEntity], user: User = None, filter_errs
 
   # Get list of reports and filter by date
   reports = ReportClass.query_ds(safe=not filter_errs, ignore_errs=filter_errs, filters=filters)
+
+  # If reports from all users were requested, look up all their owners at once
+  if not user:
+    ReportClass.prefetch_users(reports)
+
   return ReportClass.sort_by_created_date(reports, reverse=True)
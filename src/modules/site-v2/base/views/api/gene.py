@@ -2,7 +2,7 @@ from flask import request, Blueprint
 from caendr.services.logger import logger
 from extensions import cache
 
-from caendr.api.gene import search_genes, search_homologs, get_gene, remove_prefix, gene_symbol_sort_key
+from caendr.api.gene import search_genes, search_homologs, get_gene, remove_prefix
 from caendr.utils.json import jsonify_request
 from caendr.models.datastore import Species
 
@@ -49,9 +49,8 @@ def api_search_genes(query=""):
   if not query:
     return None
 
-  # Otherwise, apply the search, sort by gene symbol, and return the first 10 results
-  gene_results = search_genes(query, species=species, limit=None)
-  return sorted( gene_results, key=lambda x: gene_symbol_sort_key(x['gene_symbol']) )[:10]
+  # Otherwise, apply the search and return the first 10 results (exact matches first, then shortest names first)
+  return search_genes(query, species=species, limit=10)
 
 
 # @api_gene_bp.route('/search/<string:query>')
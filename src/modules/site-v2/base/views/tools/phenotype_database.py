@@ -155,7 +155,7 @@ def get_zhang_traits_json():
       data = query.offset(start).limit(length).from_self().\
         join(PhenotypeMetadata.phenotype_values).all()
 
-    json_data = [ trait.to_json_with_values() for trait in data ]
+    json_data = PhenotypeMetadata.to_json_with_values_many(data)
 
     filtered_records = query.count()
 
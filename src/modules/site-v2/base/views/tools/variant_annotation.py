@@ -1,16 +1,16 @@
 import json
 from caendr.services.logger import logger
-import pandas as pd
 
 from flask import (render_template,
                     url_for,
                     request,
                     redirect,
-                    make_response,
                     jsonify,
                     flash,
                     abort,
-                    Blueprint)
+                    Blueprint,
+                    Response,
+                    stream_with_context)
 from extensions import cache
 from base.forms import VBrowserForm
 
@@ -21,6 +21,7 @@ from caendr.models.sql import StrainAnnotatedVariant
 from caendr.services.dataset_release import get_latest_dataset_release_version
 from caendr.utils.bio import parse_chrom_interval, parse_chrom_position
 from caendr.utils.constants import CHROM_INTERVAL_REGEX
+from caendr.utils.data import get_file_format
 
 
 variant_annotation_bp = Blueprint(
@@ -80,7 +81,6 @@ def variant_annotation():
 
 @variant_annotation_bp.route('/query/interval',                       methods=['POST'])
 @variant_annotation_bp.route('/query/interval/<string:species_name>', methods=['POST'])
-@cache.memoize(60*60)
 def query_interval(species_name=None):
 
   # Extract the query
@@ -103,9 +103,23 @@ def query_interval(species_name=None):
     logger.warn(ex)
     return jsonify({})
 
-  # Run the query and return the results
-  data = StrainAnnotatedVariant.run_interval_query(interval, species=species)
-  return jsonify(data)
+  # Get the requested page of results
+  # The cursor is taken from the previous page, and the page size is capped by the model
+  cursor    = payload.get('cursor')
+  page_size = payload.get('page_size')
+  try:
+    if cursor is not None:
+      StrainAnnotatedVariant.decode_cursor(cursor, interval)
+    if page_size is not None:
+      page_size = int(page_size)
+  except (TypeError, ValueError) as ex:
+    logger.warn(ex)
+    return abort(400)
+
+  # Run the query and stream the results, so large pages aren't held in memory
+  # Streamed responses can't be memoized, so this view isn't cached
+  data = StrainAnnotatedVariant.stream_interval_page(interval, species=species, cursor=cursor, page_size=page_size)
+  return Response(stream_with_context(data), mimetype='application/json')
 
 
 
@@ -140,22 +154,42 @@ def query_position(species_name=None):
 
 
 
-@variant_annotation_bp.route('/download/csv', methods=['POST'])
-def download_csv():
+@variant_annotation_bp.route('/download/<string:species_name>/<string:file_ext>', methods=['GET'])
+def download_file(species_name, file_ext):
+  """
+    Export the results of an interval or position query as a CSV/TSV file.
 
-  # Load columns from StrainAnnotatedVariant class
-  columns = [ col['id'] for col in StrainAnnotatedVariant.get_column_details() ]
+    The query is given by the `query` argument, as either an interval or a position.
+    If the `gzip` argument is set, the file is compressed.
+  """
 
+  # Get the species from the URL
   try:
-    data = request.data
-    pd_obj = pd.read_json(data)
-    csv = pd_obj.to_csv(index=False, sep=",", columns=columns)
-
-    res = make_response(csv)
-    res.headers["Content-Disposition"] = "attachment; filename=variant_annotation_data.csv"
-    res.headers["Content-Type"] = "text/csv"
-    return res
-
-  except Exception as err:
-    logger.error(err)
-    return make_response(jsonify({ "message": "CSV download failed." }), 500)
+    species = Species.from_name(species_name, from_url=True)
+  except NotFoundError:
+    return abort(404)
+
+  # Get file settings from the extension, rejecting bad extensions
+  file_format = get_file_format(file_ext, valid_formats=['csv', 'tsv'])
+  if file_format is None:
+    return abort(404)
+
+  # Parse the query as an interval or a position, showing an error on the page if it's neither
+  query = request.args.get('query', '')
+  try:
+    db_query = StrainAnnotatedVariant.get_interval_query(parse_chrom_interval(query), species=species)
+  except ValueError:
+    try:
+      db_query = StrainAnnotatedVariant.get_position_query(parse_chrom_position(query), species=species)
+    except ValueError as ex:
+      logger.warn(ex)
+      return redirect(url_for('variant_annotation.variant_annotation', download_err=True))
+
+  # Stream the rows straight from the database into the file
+  compress = bool(request.args.get('gzip'))
+  data = StrainAnnotatedVariant.stream_download_file(db_query, file_ext=file_ext, compress=compress)
+
+  filename = f'{species.name}_{query}_sva.{file_ext}' + ('.gz' if compress else '')
+  resp = Response(stream_with_context(data), mimetype='application/gzip' if compress else file_format['mimetype'])
+  resp.headers['Content-Disposition'] = f'attachment; filename={filename}'
+  return resp
@@ -1,75 +1,111 @@
+import bisect
+import heapq
+import threading
+import time
+from collections import defaultdict
+
 from flask import request, Blueprint
-from caendr.models.sql import Homolog, WormbaseGeneSummary
+from caendr.models.sql import EtlSourceFile, Homolog, WormbaseGeneSummary
 
-from sqlalchemy import and_, or_, func
+from sqlalchemy import and_, func
+from caendr.services.cloud.postgresql import db
 from caendr.services.logger import logger
+from caendr.utils.env import get_env_var
 
 
-def gene_symbol_sort_key(key):
-    """
-      Helper function to map a gene symbol for a more natural sort.
-      Use e.g. as the key for 'sorted'.
+# Whether to serve gene & homolog searches from an in-memory index (see GeneSearchIndex), instead of querying the database each time
+USE_GENE_SEARCH_INDEX = get_env_var('USE_GENE_SEARCH_INDEX', False, var_type=bool)
 
-      If the symbol has the format '{symbol}-{number}-...', will split on dashes
-      and map to a list [ '{symbol}', int({number}), ... ].
-      Otherwise, wraps the full string key in a list.
+# How often to check whether the gene tables have been reloaded since the index was built, in seconds
+GENE_SEARCH_INDEX_TTL = get_env_var('GENE_SEARCH_INDEX_TTL', 60, var_type=int)
 
-      TODO: This function is not perfect -- fails to naturally sort genes with a
-      mixed-alphanum second item, e.g. 'lin-15A'.
 
-      Args:
-        key (str): A gene symbol
+def escape_like(query: str, escape: str = '\\'):
+  """
+    Escape the wildcard characters in a string, so it can be matched literally in a LIKE pattern.
+  """
+  return query.replace(escape, escape * 2).replace('%', escape + '%').replace('_', escape + '_')
 
-      Returns:
-        A list used as a sorting key for the gene symbol.
-    """
-    x = key.split('-')
-    try:
-      return [ x[0], int(x[1]), *x[2:] ]
-    except:
-      return [ key ]
+
+def rank_genes(query: str, species: str = None, limit: int = 10):
+  """
+    Find genes whose locus, sequence name, or gene ID starts with a query string (ignoring case).
+    Genes are ranked by their best matching name: exact matches first, then shorter names (so e.g. unc-2 comes before unc-10).
+
+    Runs a separate prefix query on each name column, so each can be served by its lower(...) expression index
+    (see WormbaseGeneSummary), then merges and ranks the results in Python. Each query is ordered by the same key
+    as the final ranking (see `rank_gene_name`), so the top results overall are never cut off by the limit.
+
+    Args:
+      query (str): Query string
+      species (str, optional): Limit query to one species. If not provided, will query all species.
+      limit (int, optional): Number of results to return. If not provided, returns all matches.
+
+    Returns:
+      results (list): List of WormbaseGeneSummary objects.
+  """
+  query   = query.lower()
+  pattern = escape_like(query) + '%'
+
+  genes = {}
+  for col in [ WormbaseGeneSummary.locus, WormbaseGeneSummary.sequence_name, WormbaseGeneSummary.gene_id ]:
+    search = func.lower(col).like(pattern, escape='\\')
+
+    # If provided, add requirement that species matches
+    if species is not None:
+      search = and_( search, func.lower(WormbaseGeneSummary.species_name) == species )
+
+    # Order names by code point, as Python does, rather than by the database's locale
+    name_order = func.lower(col)
+    if db.engine.dialect.name == 'postgresql':
+      name_order = name_order.collate('C')
+
+    column_query = WormbaseGeneSummary.query.filter(search).order_by( func.length(col), name_order, WormbaseGeneSummary.gene_id )
+    if limit:
+      column_query = column_query.limit(limit)
+
+    # Keep the best rank for each gene, across all its matching names
+    for gene in column_query:
+      rank = rank_gene_name(getattr(gene, col.key).lower(), query, gene.gene_id)
+      if gene.id not in genes or rank < genes[gene.id][0]:
+        genes[gene.id] = ( rank, gene )
+
+  results = [ gene for _, gene in sorted(genes.values(), key=lambda g: g[0]) ]
+  return results[:limit] if limit else results
+
+
+def rank_gene_name(name: str, query: str, gene_id: str):
+  """
+    Sort key for a gene name matching a (lowercase) search query: exact matches first, then shorter names, then alphabetical.
+    The gene ID breaks ties, so genes with the same name are always returned in the same order.
+  """
+  return ( name != query, len(name), name, gene_id or '' )
 
 
 def get_gene(query: str):
   """Lookup a single gene
 
     Lookup gene in the wormbase summary gene table.
+    Returns an exact match if one exists, otherwise a gene that starts with the query.
 
     Args:
         query (str): Query string
 
     Returns:
-        result (dict): List of dictionaries describing the homolog.
+        result (WormbaseGeneSummary): The best matching gene, or None if no genes match.
   """
 
   # Extract query value from request or function argument
   query = request.args.get('query', query).lower()
 
-  # First identify exact match
-  result = WormbaseGeneSummary.query.filter(
-    or_(
-      func.lower(WormbaseGeneSummary.locus)         == query,
-      func.lower(WormbaseGeneSummary.sequence_name) == query,
-      func.lower(WormbaseGeneSummary.gene_id)       == query
-    )
-  ).first()
-
-  # If no exact match found, search for gene that starts with query
-  if not result:
-    result = WormbaseGeneSummary.query.filter(
-      or_(
-        func.lower(WormbaseGeneSummary.locus).startswith(query),
-        func.lower(WormbaseGeneSummary.sequence_name).startswith(query),
-        func.lower(WormbaseGeneSummary.gene_id).startswith(query)
-      )
-    ).first()
-
-  return result
+  results = rank_genes(query, limit=1)
+  return results[0] if results else None
 
 
 def search_genes(query: str, species: str = None, limit: int = 10):
   """
   Query genes in the wormbase summary gene table.
+  Exact matches are returned first, followed by genes that start with the query, shortest names first.
 
   Args:
       query (str): Query string
@@ -79,27 +115,11 @@ def search_genes(query: str, species: str = None, limit: int = 10):
   Returns:
       results (list): List of dictionaries with gene results.
   """
+  index = GeneSearchIndex.get()
+  if index is not None:
+    return index.search_genes(query, species=species, limit=limit)
 
-  # Initialize search to match gene info with query
-  search = or_(
-    func.lower(WormbaseGeneSummary.locus).startswith(query),
-    func.lower(WormbaseGeneSummary.sequence_name).startswith(query),
-    func.lower(WormbaseGeneSummary.gene_id).startswith(query)
-  )
-
-  # If provided, add requirement that species matches
-  if species is not None:
-    search = and_( search, func.lower(WormbaseGeneSummary.species_name) == species )
-
-  # Create the main query
-  query = WormbaseGeneSummary.query.filter(search)
-
-  # If a limit is provided, apply it
-  if limit:
-    query = query.limit(limit)
-
-  # Map to JSON and return
-  return [ x.to_json() for x in query.all() ]
+  return [ x.to_json() for x in rank_genes(query, species=species, limit=limit) ]
 
 
 def search_homologs(query: str, species: str = None):
@@ -119,6 +139,11 @@ def search_homologs(query: str, species: str = None):
   # Extract query value from request or function argument
   query = request.args.get('query', query).lower()
 
+  # Use the in-memory index, if enabled
+  index = GeneSearchIndex.get()
+  if index is not None:
+    return index.search_homologs(query, species=species, limit=10)
+
   # Initialize search to match gene info with query
   search = (func.lower(Homolog.homolog_gene)).startswith(query)
 
@@ -191,3 +216,204 @@ def remove_prefix(val: str, prefix: str):
     return val[ len(prefix): ]
   else:
     return val
+
+
+
+#
+# In-memory search index
+#
+
+class PrefixIndex():
+  """
+    Index of (name, value) pairs for prefix lookups.
+
+    Names are lowercased and sorted once, so all the names starting with a given prefix form a contiguous range,
+    which is found with two binary searches.
+  """
+
+  def __init__(self, entries):
+    entries = sorted(( (name.lower(), value) for name, value in entries if name ), key=lambda entry: entry[0])
+    self._names  = [ name  for name, _  in entries ]
+    self._values = [ value for _, value in entries ]
+
+  def __len__(self):
+    return len(self._names)
+
+  def search(self, prefix: str):
+    """
+      Get the (name, value) pairs whose name starts with the given (lowercase) prefix, in order of name.
+    """
+    start = bisect.bisect_left(self._names, prefix)
+    end   = bisect.bisect_left(self._names, prefix + '\U0010ffff', lo=start)
+    return zip(self._names[start:end], self._values[start:end])
+
+
+class GeneSearchIndex():
+  """
+    In-memory copy of the gene & homolog names used for autocomplete, split by species,
+    so searches can be answered without querying the database.
+
+    The gene tables only change when they're reloaded, so the index is built on first use and kept until the
+    tables change (see `get_version`), which is checked at most once every GENE_SEARCH_INDEX_TTL seconds.
+    Searches are also memoized, since the same prefixes are requested over and over while typing.
+
+    Enabled with the USE_GENE_SEARCH_INDEX environment variable. If the index is disabled or can't be built,
+    `get` returns None, and the database should be queried instead.
+  """
+
+  # Tables the index is built from that are loaded by the ETL
+  TABLES = [ WormbaseGeneSummary.__tablename__ ]
+
+  # Maximum number of search results to memoize before starting over
+  MAX_MEMOIZED = 10000
+
+  # The current index, shared by all threads in this process
+  _current    = None
+  _checked_at = None
+  _lock       = threading.Lock()
+
+
+  def __init__(self, version, genes, homologs):
+    self.version   = version
+    self._genes    = genes
+    self._homologs = homologs
+    self._results  = {}
+
+
+  def __repr__(self):
+    return f'<Gene search index ({ sum(map(len, self._genes.values())) } gene names, { sum(map(len, self._homologs.values())) } homolog names)>'
+
+
+  @classmethod
+  def get_version(cls):
+    """
+      Get a stamp identifying the current contents of the tables in the index.
+
+      The gene summary table is stamped by its last ETL load (see EtlSourceFile). The homolog table isn't loaded
+      through the ETL, so it has no load records, and is stamped by its row count & highest ID instead.
+    """
+    etl_version = db.session.query( func.max(EtlSourceFile.loaded_on), func.count() ) \
+      .filter( EtlSourceFile.table_name.in_(cls.TABLES) ) \
+      .one()
+    homolog_version = db.session.query( func.count(Homolog.id), func.max(Homolog.id) ).one()
+    return ( *etl_version, *homolog_version )
+
+
+  @classmethod
+  def get(cls):
+    """
+      Get the current index, (re)building it if it hasn't been built yet or the gene tables have changed since.
+      Returns None if the index is disabled, or couldn't be built.
+    """
+    if not USE_GENE_SEARCH_INDEX:
+      return None
+
+    # Use the current index until it's due to be checked again
+    if cls._current is not None and time.monotonic() - cls._checked_at < GENE_SEARCH_INDEX_TTL:
+      return cls._current
+
+    with cls._lock:
+
+      # Another thread may have checked the index while this one was waiting for the lock
+      if cls._current is not None and time.monotonic() - cls._checked_at < GENE_SEARCH_INDEX_TTL:
+        return cls._current
+
+      try:
+        version = cls.get_version()
+        if cls._current is None or cls._current.version != version:
+          cls._current = cls.build(version)
+        cls._checked_at = time.monotonic()
+      except Exception as ex:
+        logger.error(f'Could not build gene search index, falling back to database queries: {ex}')
+        return None
+
+    return cls._current
+
+
+  @classmethod
+  def build(cls, version):
+    """
+      Load the gene & homolog names from the database into a new index.
+    """
+    start = time.perf_counter()
+
+    # Index genes by each of their names, storing the JSON for each gene
+    genes = defaultdict(list)
+    for gene in WormbaseGeneSummary.query.yield_per(10000):
+      entry = ( gene.id, gene.gene_id, gene.to_json() )
+      for name in (gene.locus, gene.sequence_name, gene.gene_id):
+        genes[ (gene.species_name or '').lower() ].append(( name, entry ))
+
+    # Index homologs by homolog gene name, skipping any that aren't linked to a gene (these can't be unnested)
+    homologs = defaultdict(list)
+    for homolog in Homolog.query.yield_per(10000):
+      if homolog.__gene_summary__ is None:
+        continue
+      species_name = (homolog.species_name or '').lower()
+      homologs[species_name].append(( homolog.homolog_gene, homolog.unnest().to_json() ))
+
+    index = cls(
+      version,
+      genes    = { species_name: PrefixIndex(entries) for species_name, entries in genes.items()    },
+      homologs = { species_name: PrefixIndex(entries) for species_name, entries in homologs.items() },
+    )
+    logger.info(f'Built {index} in {time.perf_counter() - start:.2f}s')
+    return index
+
+
+  def __memoize(self, key, compute):
+    if key not in self._results:
+      if len(self._results) >= self.MAX_MEMOIZED:
+        self._results = {}
+      self._results[key] = compute()
+    return list(self._results[key])
+
+
+  def __get_species_indexes(self, indexes, species: str = None):
+    if species is None:
+      return indexes.values()
+    return [ indexes[species] ] if species in indexes else []
+
+
+  def search_genes(self, query: str, species: str = None, limit: int = 10):
+    """
+      Find genes whose locus, sequence name, or gene ID starts with a query string (ignoring case),
+      ranked the same way as `rank_genes`.
+    """
+    query = query.lower()
+
+    def _search():
+
+      # Get the best rank for each matching gene, across all its names
+      ranks = {}
+      for index in self.__get_species_indexes(self._genes, species):
+        for name, (id, gene_id, record) in index.search(query):
+          rank = rank_gene_name(name, query, gene_id)
+          if id not in ranks or rank < ranks[id][0]:
+            ranks[id] = ( rank, record )
+
+      if limit:
+        ranked = heapq.nsmallest(limit, ranks.values(), key=lambda r: r[0])
+      else:
+        ranked = sorted(ranks.values(), key=lambda r: r[0])
+      return [ record for _, record in ranked ]
+
+    return self.__memoize(('genes', query, species, limit), _search)
+
+
+  def search_homologs(self, query: str, species: str = None, limit: int = 10):
+    """
+      Find homologs whose homolog gene name starts with a query string (ignoring case), in order of name.
+    """
+    query = query.lower()
+
+    def _search():
+      results = []
+      for index in self.__get_species_indexes(self._homologs, species):
+        for _, record in index.search(query):
+          if limit and len(results) >= limit:
+            return results
+          results.append(record)
+      return results
+
+    return self.__memoize(('homologs', query, species, limit), _search)
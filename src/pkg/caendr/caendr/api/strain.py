@@ -1,19 +1,24 @@
 import pandas as pd
 import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, FrozenSet, Iterable, Optional
 
 from caendr.services.logger import logger
-from sqlalchemy import or_
 from flask import request
 from datetime import timedelta
 
 from caendr.models.datastore import Species
 from caendr.models.error import BadRequestError
-from caendr.models.sql import Strain
+from caendr.models.sql import EtlSourceFile, Strain, StrainAlias
 from caendr.services.cloud.postgresql import db, rollback_on_error
 from caendr.services.cloud.storage import get_blob, download_blob_to_file, upload_blob_from_file, get_google_storage_credentials, generate_blob_uri, BlobURISchema
 from caendr.utils.data import unique_id
 from caendr.utils.env import get_env_var
 
+from sqlalchemy import func
+
 MODULE_IMG_THUMB_GEN_SOURCE_PATH = get_env_var('MODULE_IMG_THUMB_GEN_SOURCE_PATH', as_template=True)
 MODULE_SITE_BUCKET_PHOTOS_NAME   = get_env_var('MODULE_SITE_BUCKET_PHOTOS_NAME')
 MODULE_SITE_BUCKET_PRIVATE_NAME  = get_env_var('MODULE_SITE_BUCKET_PRIVATE_NAME')
@@ -21,6 +26,9 @@ MODULE_SITE_BUCKET_PRIVATE_NAME  = get_env_var('MODULE_SITE_BUCKET_PRIVATE_NAME'
 BAM_BAI_DOWNLOAD_SCRIPT_NAME     = get_env_var('BAM_BAI_DOWNLOAD_SCRIPT_NAME', as_template=True)
 BAM_BAI_PREFIX                   = get_env_var('BAM_BAI_PREFIX', as_template=True)
 
+# How often to check whether the ETL has reloaded the strain tables since the name registry was built, in seconds
+STRAIN_NAME_REGISTRY_TTL         = get_env_var('STRAIN_NAME_REGISTRY_TTL', 60, var_type=int)
+
 # TODO: This is still here so functions that haven't been updated will still work.
 bam_prefix = 'bam/c_elegans'
 
@@ -53,16 +61,13 @@ def query_strains(
   if release_version:
     query = query.filter(Strain.release <= release_version)
 
+  # Look up a single strain by its current or previous name
   if strain_name or resolve_isotype:
-    query = query.filter(
-      or_(
-        Strain.previous_names.like(f"%{strain_name},%"),
-        Strain.previous_names.like(f"%,{strain_name},"),
-        Strain.previous_names.like(f"%{strain_name}"),
-        Strain.previous_names == strain_name,
-        Strain.strain == strain_name
-      )
-    ).first()
+    if species is not None and species not in Species.all().keys():
+      raise BadRequestError(f'Unrecognized species ID "{species}".')
+    if resolve_isotype:
+      return resolve_isotypes([ strain_name ], species=species, release_version=release_version).get(strain_name)
+    return resolve_strain_names([ strain_name ], species=species, release_version=release_version).get(strain_name)
 
   elif isotype_name:
     query = query.filter(Strain.isotype == isotype_name)
@@ -87,21 +92,165 @@ def query_strains(
     query = query.all()
 
   if all_strain_names:
-    previous_strain_names = sum([x.previous_names.split(",") for x in query if x.previous_names], [])
+    previous_strain_names = [ name for x in query if x.previous_names for name in x.previous_names.split(",") ]
     results = [x.strain for x in query] + previous_strain_names
     return results
 
-  if resolve_isotype:
-    if query:
-      # LSJ1/LSJ2 prev. N2; So N2 needs to be specific.
-      if strain_name == 'N2':
-        return 'N2'
-      return query.isotype
-      
-  
   return query
 
 
+@rollback_on_error
+def resolve_strain_names(strain_names: Iterable[str], species: str = None, release_version = None) -> Dict[str, Strain]:
+  """
+    Resolve a list of strain names to their strains in a single query, using the strain alias table.
+    Names may be current or previous strain names.
+
+    If a name is the current name of one strain and a previous name of others (e.g. N2, which LSJ1 & LSJ2
+    were previously called), it resolves to the strain currently using it.
+
+    Returns a dict mapping each name that could be resolved to its Strain object.
+  """
+  strain_names = set( name for name in strain_names if isinstance(name, str) and name )
+  if not strain_names:
+    return {}
+
+  query = db.session.query(StrainAlias.alias, StrainAlias.is_current, Strain) \
+    .join(Strain, Strain.strain == StrainAlias.strain) \
+    .filter(StrainAlias.alias.in_(strain_names))
+
+  if species is not None:
+    query = query.filter(StrainAlias.species_name == species)
+  if release_version:
+    query = query.filter(Strain.release <= release_version)
+
+  # Prefer strains currently using the name over those that used to
+  results = {}
+  for alias, is_current, strain in query:
+    if is_current or alias not in results:
+      results[alias] = strain
+  return results
+
+
+def resolve_isotypes(strain_names: Iterable[str], species: str = None, release_version = None) -> Dict[str, Optional[str]]:
+  """
+    Resolve a list of strain names (current or previous) to their isotypes in a single query.
+    Returns a dict mapping each name that could be resolved to its isotype.
+  """
+  return {
+    name: strain.isotype
+      for name, strain in resolve_strain_names(strain_names, species=species, release_version=release_version).items()
+  }
+
+
+
+class StrainNameRegistry():
+  """
+    In-memory set of every valid strain name for each species -- current names, previous names, and isotypes --
+    for checking large numbers of names (e.g. every line of an uploaded file) without querying the database.
+
+    Matches the names returned by `query_strains(all_strain_names=True)` and `get_distinct_isotypes`:
+    current & previous names of strains with an isotype and no issues, plus every isotype name.
+
+    The strain tables only change when the ETL reloads them, so the registry is built on first use and kept until the
+    ETL records a new load (see EtlSourceFile), which is checked at most once every STRAIN_NAME_REGISTRY_TTL seconds.
+  """
+
+  # Tables the registry is built from
+  TABLES = [ Strain.__tablename__, StrainAlias.__tablename__ ]
+
+  # The current registry, shared by all threads in this process
+  _current    = None
+  _checked_at = None
+  _lock       = threading.Lock()
+
+
+  def __init__(self, version, names: Dict[str, FrozenSet[str]]):
+    self.version = version
+    self._names  = names
+    self._all    = frozenset().union(*names.values())
+
+
+  def __repr__(self):
+    return f'<Strain name registry ({ len(self._all) } names, { len(self._names) } species)>'
+
+
+  @classmethod
+  def get_version(cls):
+    """
+      Get a stamp identifying the last ETL load of the tables in the registry.
+    """
+    return tuple(
+      db.session.query( func.max(EtlSourceFile.loaded_on), func.count() )
+        .filter( EtlSourceFile.table_name.in_(cls.TABLES) )
+        .one()
+    )
+
+
+  @classmethod
+  @rollback_on_error
+  def get(cls) -> 'StrainNameRegistry':
+    """
+      Get the current registry, (re)building it if it hasn't been built yet or the ETL has loaded the strain tables since.
+    """
+
+    # Use the current registry until it's due to be checked again
+    if cls._current is not None and time.monotonic() - cls._checked_at < STRAIN_NAME_REGISTRY_TTL:
+      return cls._current
+
+    with cls._lock:
+
+      # Another thread may have checked the registry while this one was waiting for the lock
+      if cls._current is not None and time.monotonic() - cls._checked_at < STRAIN_NAME_REGISTRY_TTL:
+        return cls._current
+
+      version = cls.get_version()
+      if cls._current is None or cls._current.version != version:
+        cls._current = cls.build(version)
+      cls._checked_at = time.monotonic()
+
+    return cls._current
+
+
+  @classmethod
+  def build(cls, version):
+    """
+      Load the strain names from the database into a new registry.
+    """
+    start = time.perf_counter()
+
+    query = Strain.query.with_entities(
+      Strain.species_name, Strain.strain, Strain.previous_names, Strain.isotype, Strain.issues,
+    )
+
+    names = defaultdict(set)
+    for species_name, strain, previous_names, isotype, issues in query:
+      if isotype is None:
+        continue
+      names[species_name].add(isotype)
+      if issues is False:
+        names[species_name].add(strain)
+        names[species_name].update( Strain.split_previous_names(previous_names) )
+
+    registry = cls(version, { species_name: frozenset(species_names) for species_name, species_names in names.items() })
+    logger.info(f'Built {registry} in {time.perf_counter() - start:.2f}s')
+    return registry
+
+
+  def get_names(self, species: str = None) -> FrozenSet[str]:
+    """
+      Get the set of valid strain names for a species, or across all species if none is given.
+    """
+    if species is None:
+      return self._all
+    return self._names.get(species, frozenset())
+
+
+  def contains(self, name: str, species: str = None) -> bool:
+    """
+      Check whether a name is a valid strain name for a species, or for any species if none is given.
+    """
+    return name in self.get_names(species)
+
 @rollback_on_error
 def get_strains(known_origin=False, issues=False):
   """
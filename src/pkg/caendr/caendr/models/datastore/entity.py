@@ -6,7 +6,7 @@ from google.cloud import datastore
 from caendr.services.logger import logger
 
 from caendr.models.error import NonUniqueEntity, NotFoundError
-from caendr.services.cloud.datastore import get_ds_entity, save_ds_entity, query_ds_entities
+from caendr.services.cloud.datastore import get_ds_entity, get_ds_entities, save_ds_entity, query_ds_entities, ds_identity_map
 from caendr.utils.tokens import TokenizedString
 
 
@@ -463,14 +463,30 @@ class Entity(object):
     if cls is Entity:
       raise TypeError(f'Cannot run method "get_ds" on {cls.__name__}. Please run with subclass instead.')
 
-    # Query datastore using this class's kind and the provided name
-    match = get_ds_entity(cls.kind, name)
-
-    # If a match was found, initialize an Entity object from it
-    if match is not None:
-      e = cls(name, safe=safe)
-      if e._exists:
-        return e
+    # Initialize an Entity object from the datastore using this class's kind and the provided name
+    e = cls(name, safe=safe)
+    if e._exists:
+      return e
 
     if not silent:
       raise NotFoundError(cls, {'name': name})
+
+
+  @classmethod
+  def get_many(cls, names, safe=False):
+    '''
+      Get the Entities from datastore with the matching names, fetching them all in as few requests as possible.
+      Returns a dict mapping each name that exists to its Entity object.
+    '''
+
+    # Ensure this is being run on a subclass of Entity, not Entity itself
+    if cls is Entity:
+      raise TypeError(f'Cannot run method "get_many" on {cls.__name__}. Please run with subclass instead.')
+
+    # Fetch all the matches at once, then initialize an Entity object from each
+    # The identity map stores the fetched values, so the constructor can use them instead of fetching each one again
+    with ds_identity_map():
+      matches = get_ds_entities(cls.kind, names)
+      entities = { name: cls(name, safe=safe) for name in matches }
+
+    return { name: e for name, e in entities.items() if e._exists }
@@ -246,6 +246,14 @@ class PhenotypeReport(ReportEntity, HashableEntity):
 
   @property
   def trait_files(self) -> Tuple[TraitFile]:
+
+    # If neither trait file is cached yet, fetch both at once
+    trait_ids = ( getattr(self, '_trait_1_id', ''), getattr(self, '_trait_2_id', '') )
+    if all(trait_ids) and getattr(self, '_trait_1_file', None) is None and getattr(self, '_trait_2_file', None) is None:
+      files = TraitFile.get_many(trait_ids)
+      self._trait_1_file = files.get(self._trait_1_id)
+      self._trait_2_file = files.get(self._trait_2_id)
+
     if self['trait_2'] is None:
       return self['trait_1'],
     return self['trait_1'], self['trait_2']
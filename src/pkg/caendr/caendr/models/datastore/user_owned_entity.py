@@ -36,6 +36,32 @@ class UserOwnedEntity(Entity):
     return UserOwnedEntity.__user_cache[username]['val']
 
 
+  @staticmethod
+  def prefetch_users(entities):
+    '''
+      Fetch the users for a list of entities all at once, and add them to this class's cache.
+      Use before looking up the user of each entity in a list, so each lookup doesn't need its own request.
+    '''
+    curr_time = time()
+    usernames = { e['username'] for e in entities if e is not None and e['username'] is not None }
+
+    # Only fetch the users that aren't cached already
+    to_fetch = []
+    for username in usernames:
+      cached_val = UserOwnedEntity.__user_cache.get(username)
+      if cached_val is None or cached_val['age'] + USER_OWNED_ENTITY_CACHE_AGE_SECONDS < curr_time:
+        to_fetch.append(username)
+    if not to_fetch:
+      return
+
+    users = User.get_many(to_fetch)
+    for username in to_fetch:
+      UserOwnedEntity.__user_cache[username] = {
+        'age': curr_time,
+        'val': users.get(username),
+      }
+
+
   def __new__(cls, *args, **kwargs):
     if cls is UserOwnedEntity:
       raise TypeError(f"Class '{cls.__name__}' should never be instantiated directly -- subclasses should be used instead.")
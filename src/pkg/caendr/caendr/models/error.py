@@ -139,11 +139,12 @@ class DuplicateTaskError(InternalError):
 
 class DataFormatError(InternalError):
   description = "Error parsing data with expected format"
-  def __init__(self, msg, line: int=None, full_msg_body: str=None, full_msg_link: str=None):
+  def __init__(self, msg, line: int=None, full_msg_body: str=None, full_msg_link: str=None, errors: list=None):
     self.msg  = msg.strip()
     self.line = line
     self.full_msg_body = full_msg_body
     self.full_msg_link = full_msg_link
+    self.errors = errors or [ self ]
     super().__init__()
 
 class DataValidationError(InternalError):
@@ -298,3 +299,8 @@ class ForeignResourceUndefinedError(InternalError):
       species_name = species
     self.description = f'Foreign resource template {resource_id} ({resource_type}) is not defined for species {species_name}'
     super().__init__()
+
+class SnapshotNotFoundError(InternalError):
+  def __init__(self, table_name, species_name, release, reason):
+    self.description = f'Cannot restore table {table_name} for species {species_name} from snapshot "{release}": {reason}'
+    super().__init__()
@@ -43,6 +43,20 @@ REQUIRED_RESOURCES: Dict[DbOp, List[ForeignResourceTemplate]] = {
     *WormbaseGeneSummaryConfig.all_resources,
     *StrainAnnotatedVariantConfig.all_resources,
   ],
+  DbOp.SYNC_WORMBASE_GENES: [
+    *WormbaseGeneConfig.all_resources,
+    *WormbaseGeneSummaryConfig.all_resources,
+  ],
+  DbOp.SYNC_STRAIN_ANNOTATED_VARIANTS: [
+    *StrainAnnotatedVariantConfig.all_resources,
+  ],
+  DbOp.SYNC_PHENOTYPES: [],
+  DbOp.SYNC_ALL_TABLES: [
+    *StrainConfig.all_resources,
+    *WormbaseGeneConfig.all_resources,
+    *WormbaseGeneSummaryConfig.all_resources,
+    *StrainAnnotatedVariantConfig.all_resources,
+  ],
   DbOp.POPULATE_PHENOTYPES_DATASTORE: [
     # TODO: Should this actually check for every single file specified in the datastore? Can it flag & skip some files?
   ],
@@ -1,5 +1,3 @@
-import csv
-
 # Parent Class & Models
 from .job_pipeline                 import JobPipeline
 from caendr.models.datastore       import HeritabilityReport
@@ -13,7 +11,6 @@ from caendr.models.status          import JobStatus
 from caendr.services.validate      import validate_file, NumberValidator, StrainValidator, TraitValidator
 from caendr.utils.data             import get_delimiter_from_filepath
 from caendr.utils.env              import get_env_var
-from caendr.utils.file             import get_file_hash
 from caendr.utils.local_files      import LocalUploadFile
 
 from caendr.services.cloud.storage import download_blob_as_dataframe, BlobURISchema
@@ -72,32 +69,21 @@ class HeritabilityPipeline(JobPipeline):
     # Get the file format & delimiter
     delimiter = get_delimiter_from_filepath(local_file.local_path, valid_file_extensions=valid_file_extensions)
 
-    # Validate each line in the file
-    # Will raise an error if any problems are found, otherwise silently passes
-    validate_file(local_file, cls.column_validators(data), delimiter=delimiter, unique_rows=True)
+    # Validate the file, summarizing it in the same pass
+    # Small files are checked as whole columns, and larger ones are streamed line by line
+    # Will raise an error if any problems are found
+    summary = validate_file(local_file, cls.column_validators(data), delimiter=delimiter, unique_rows=True)
 
     # Extra validation - check that five or more unique strains are provided
-    unique_strains = set()
-
-    # Open the file, skipping the header line
-    with open(local_file, 'r') as f:
-      csv_reader = csv.reader(f, delimiter=delimiter)
-      next(csv_reader)
-
-      # Track all unique strain vals in a set
-      for line in csv_reader:
-        unique_strains.add(line[1])
-        csv_row = line
-
-    # Raise an error if not enough strains were found
-    if len(unique_strains) < 5:
+    if summary.columns[1].num_unique < 5:
       raise DataFormatError("The heritability data contain fewer than five unique strains. Please be sure to measure trait values for at least five wild strains in at least three independent assays.")
 
-    # Compute hash from file
-    data_hash = get_file_hash(local_file, length=32)
+    # Get hash of file
+    data_hash = summary.get_hash(length=32)
 
     # Extract trait from table data
-    data['trait'] = csv_row[2]
+    # All rows have the same trait name, as checked by the TraitValidator
+    data['trait'] = summary.columns[2].last_value
 
     return {
       'props': data,
@@ -1,5 +1,3 @@
-import csv
-
 # Parent Class & Models
 from .job_pipeline                 import JobPipeline
 from caendr.models.datastore       import NemascanReport
@@ -12,7 +10,6 @@ from caendr.services.cloud.storage import BlobURISchema
 from caendr.services.validate      import validate_file, NumberValidator, StrainValidator
 from caendr.utils.data             import get_delimiter_from_filepath
 from caendr.utils.env              import get_env_var
-from caendr.utils.file             import get_file_hash
 from caendr.utils.local_files      import LocalUploadFile
 
 
@@ -75,18 +72,16 @@ class NemascanPipeline(JobPipeline):
     # Get the file format & delimiter
     delimiter = get_delimiter_from_filepath(local_file.local_path, valid_file_extensions=valid_file_extensions)
 
-    # Validate each line in the file
-    # Will raise an error if any problems are found, otherwise silently passes
-    validate_file(local_file, cls.column_validators(data), delimiter=delimiter, unique_rows=True)
+    # Validate the file, summarizing it in the same pass
+    # Small files are checked as whole columns, and larger ones are streamed line by line
+    # Will raise an error if any problems are found
+    summary = validate_file(local_file, cls.column_validators(data), delimiter=delimiter, unique_rows=True)
 
-    # Compute hash from file
-    data_hash = get_file_hash(local_file, length=32)
+    # Get hash of file
+    data_hash = summary.get_hash(length=32)
 
-    # Open the file and extract the trait name from the header row
-    with open(local_file, 'r') as f:
-      csv_reader = csv.reader(f, delimiter=delimiter)
-      header_row = next(csv_reader)
-      data['trait'] = header_row[1]
+    # Extract the trait name from the header row
+    data['trait'] = summary.headers[1]
 
     return {
       'props': data,
@@ -1,3 +1,4 @@
+import pandas as pd
 from scipy import stats
 
 # Parent Class & Models
@@ -8,7 +9,7 @@ from caendr.models.datastore       import PhenotypeReport
 from caendr.models.error           import DataValidationError, EmptyReportDataError, EmptyReportResultsError
 from caendr.models.status          import JobStatus
 from caendr.models.trait           import Trait
-from caendr.utils.data             import dataframe_cols_to_dict, get_object_hash, keyset_intersection, center_and_scale_data
+from caendr.utils.data             import get_object_hash, keyset_intersection, center_and_scale_data
 
 
 
@@ -118,22 +119,16 @@ class PhenotypePipeline(JobPipeline):
     if data is None:
       raise EmptyReportResultsError(self.report.id)
 
-    # Convert dataframes to dicts, mapping strain column to trait value column
-    data_dicts = tuple(map( Trait.dataframe_to_dict, data ))
-
-    # Get the list of strains in both datasets by taking the intersection of their key sets
-    # Convert back to a list because sets ~technically~ don't have a defined order -- we want to make sure
-    # the list of strains is the same each time we use it
-    data_keys = list( keyset_intersection(*data_dicts) )
-
-    # Filter each dataset down to just the strains in the overlapping set, in the same order computed above
-    data_vals = tuple([
-      [ d[strain] for strain in data_keys ] for d in data_dicts
-    ])
+    # Line up the values of each trait by strain, keeping only the strains measured for every trait
+    # Values are queried as floats with missing measurements already skipped, so they can be used as-is
+    values = pd.concat(
+      [ df.set_index('strain_name')['trait_value'] for df in data ], axis=1, join='inner', keys=range(len(data))
+    )
+    data_keys = list(values.index)
 
     # Pre-processing: mean-center and scale the data
     data_vals = tuple(
-      center_and_scale_data(d) for d in data_vals
+      center_and_scale_data(values[col].to_numpy()) for col in values.columns
     )
 
     # Zip the trait values together with the strain names, to get the full dataset array
@@ -3,13 +3,17 @@ from .database_operation import DbOp
 from .homolog import Homolog
 from .strain_annotated_variant import StrainAnnotatedVariant
 from .strain import Strain
+from .strain_alias import StrainAlias
 from .wormbase_gene import WormbaseGene
 from .wormbase_gene_summary import WormbaseGeneSummary
 from .phenotype import PhenotypeDatabase
 from .phenotype_metadata import PhenotypeMetadata
+from .etl_source_file import EtlSourceFile
+from .etl_checkpoint import EtlCheckpoint
 
 ALL_SQL_TABLES = [
   Strain,
+  StrainAlias,
   WormbaseGene,
   WormbaseGeneSummary,
   StrainAnnotatedVariant,
@@ -13,6 +13,10 @@ class DbOp(Enum):
   DROP_AND_POPULATE_PHENOTYPE_METADATA        = 'DROP_AND_POPULATE_PHENOTYPE_METADATA'
   DROP_AND_POPULATE_PHENOTYPES                = 'DROP_AND_POPULATE_PHENOTYPES'
   DROP_AND_POPULATE_ALL_TABLES                = 'DROP_AND_POPULATE_ALL_TABLES'
+  SYNC_WORMBASE_GENES                         = 'SYNC_WORMBASE_GENES'
+  SYNC_STRAIN_ANNOTATED_VARIANTS              = 'SYNC_STRAIN_ANNOTATED_VARIANTS'
+  SYNC_PHENOTYPES                             = 'SYNC_PHENOTYPES'
+  SYNC_ALL_TABLES                             = 'SYNC_ALL_TABLES'
   POPULATE_PHENOTYPES_DATASTORE               = 'POPULATE_PHENOTYPES_DATASTORE'
   TEST_ECHO                                   = 'TEST_ECHO'
   TEST_MOCK_DATA                              = 'TEST_MOCK_DATA'
@@ -34,6 +38,10 @@ class DbOp(Enum):
       DbOp.DROP_AND_POPULATE_PHENOTYPE_METADATA:        'Rebuild Phenotype Metadata table from datastore TraitFile entities',
       DbOp.DROP_AND_POPULATE_PHENOTYPES:                'Rebuild all Phenotype trait tables from datastore',
       DbOp.DROP_AND_POPULATE_ALL_TABLES:                'Rebuild All Tables',
+      DbOp.SYNC_WORMBASE_GENES:                         'Sync wormbase gene tables for species whose source files changed',
+      DbOp.SYNC_STRAIN_ANNOTATED_VARIANTS:              'Sync Strain Annotated Variant table for species whose .csv.gz file changed',
+      DbOp.SYNC_PHENOTYPES:                             'Sync Phenotype trait tables for species whose trait files changed',
+      DbOp.SYNC_ALL_TABLES:                             'Sync All Tables for species whose source files changed',
       DbOp.POPULATE_PHENOTYPES_DATASTORE:               'Create / update datastore trait file records from Google Sheet',
       DbOp.TEST_ECHO:                                   'Test ETL - Echo',
       DbOp.TEST_MOCK_DATA:                              'Test ETL - Mock Data',
@@ -0,0 +1,21 @@
+from caendr.services.cloud.postgresql import db
+from caendr.models.sql.dict_serializable import DictSerializable
+
+class EtlCheckpoint(DictSerializable, db.Model):
+  """
+      Bookkeeping table for the ETL. Records how much of each table has been loaded for a given species,
+      so an interrupted load can be resumed instead of starting over.
+  """
+  table_name = db.Column(db.String(), primary_key=True)
+  species_name = db.Column(db.String(20), primary_key=True)
+  checksum = db.Column(db.String(), nullable=True)
+  batches_loaded = db.Column(db.Integer(), nullable=False, default=0)
+  rows_loaded = db.Column(db.Integer(), nullable=False, default=0)
+  completed = db.Column(db.Boolean(), nullable=False, default=False)
+  updated_on = db.Column(db.DateTime(), nullable=False)
+
+  __tablename__ = 'etl_checkpoint'
+
+
+  def __repr__(self):
+    return f"ETL checkpoint: {self.table_name} -- {self.species_name} -- {self.rows_loaded} rows ({'complete' if self.completed else 'in progress'})"
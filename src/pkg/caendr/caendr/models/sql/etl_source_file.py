@@ -0,0 +1,19 @@
+from caendr.services.cloud.postgresql import db
+from caendr.models.sql.dict_serializable import DictSerializable
+
+class EtlSourceFile(DictSerializable, db.Model):
+  """
+      Bookkeeping table for the ETL. Records the checksum of each source file that was loaded
+      into a table for a given species, so sync operations can skip inputs that haven't changed.
+  """
+  table_name = db.Column(db.String(), primary_key=True)
+  species_name = db.Column(db.String(20), primary_key=True)
+  resource_id = db.Column(db.String(), primary_key=True)
+  checksum = db.Column(db.String(), nullable=True)
+  loaded_on = db.Column(db.DateTime(), nullable=False)
+
+  __tablename__ = 'etl_source_file'
+
+
+  def __repr__(self):
+    return f"ETL source file: {self.table_name} -- {self.species_name} -- {self.resource_id} ({self.checksum})"
@@ -11,4 +11,10 @@ class PhenotypeDatabase(DictSerializable, db.Model):
   strain_name = db.Column(db.String(), primary_key=True)
   trait_value = db.Column(db.Float())
 
-  __tablename__ = 'phenotype_db'
\ No newline at end of file
+  __tablename__ = 'phenotype_db'
+
+  # Lookups by (trait_name, strain_name) are covered by the primary key
+  # This index supports range & aggregate queries over the values of a single trait
+  __table_args__ = (
+    db.Index('ix_phenotype_db_trait_name_trait_value', trait_name, trait_value),
+  )
@@ -1,5 +1,8 @@
+from collections import defaultdict
+
 from caendr.services.cloud.postgresql import db
 from caendr.models.sql.dict_serializable import DictSerializable
+from caendr.models.sql.phenotype import PhenotypeDatabase
 
 class PhenotypeMetadata(DictSerializable, db.Model):
   """
@@ -42,7 +45,23 @@ class PhenotypeMetadata(DictSerializable, db.Model):
     """
       Converts PhenotypeMetadata instance to JSON in the joined queries
     """
-    json_trait = self.to_json()
-    phenotype_values = [ v.to_json() for v in self.phenotype_values ]
-    json_trait['phenotype_values'] = phenotype_values
-    return json_trait
\ No newline at end of file
+    return PhenotypeMetadata.to_json_with_values_many([ self ])[0]
+
+  @staticmethod
+  def to_json_with_values_many(traits):
+    """
+      Converts a list of PhenotypeMetadata instances to JSON, including the values of each trait.
+      The values of all the traits are fetched in a single query, selecting just the value columns
+      (rather than loading each trait's values as model objects).
+    """
+    values = defaultdict(list)
+    trait_names = [ trait.trait_name_caendr for trait in traits ]
+    if len(trait_names):
+      query = db.session.query( PhenotypeDatabase.trait_name, PhenotypeDatabase.strain_name, PhenotypeDatabase.trait_value ) \
+        .filter( PhenotypeDatabase.trait_name.in_(trait_names) )
+      for trait_name, strain_name, trait_value in query:
+        values[trait_name].append({ 'trait_name': trait_name, 'strain_name': strain_name, 'trait_value': trait_value })
+
+    return [
+      { **trait.to_json(), 'phenotype_values': values[trait.trait_name_caendr] } for trait in traits
+    ]
\ No newline at end of file
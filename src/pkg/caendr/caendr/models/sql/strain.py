@@ -53,6 +53,15 @@ class Strain(DictSerializable, db.Model):
   def sort_by_strain(arr):
     return sorted(arr, key=Strain.to_sortable_strain)
 
+  @staticmethod
+  def split_previous_names(previous_names):
+    """
+      Split a comma-separated previous_names value into a list of names, skipping blanks and duplicates.
+    """
+    if not previous_names:
+      return []
+    return list(dict.fromkeys( name.strip() for name in previous_names.split(',') if name.strip() ))
+
 
   @classmethod
   def get_column_names_ordered(cls):
@@ -0,0 +1,19 @@
+from caendr.services.cloud.postgresql import db
+from caendr.models.sql.dict_serializable import DictSerializable
+
+class StrainAlias(DictSerializable, db.Model):
+  """
+      Lookup table of every name a strain is known by -- its current name, and each of its previous names --
+      so strain names can be resolved with an index lookup instead of searching the comma-separated
+      previous_names column of the strain table. Built by the ETL from the strain table.
+  """
+  alias = db.Column(db.String(), primary_key=True)
+  strain = db.Column(db.String(25), primary_key=True)
+  species_name = db.Column(db.String(20), index=True)
+  is_current = db.Column(db.Boolean(), nullable=False)
+
+  __tablename__ = 'strain_alias'
+
+
+  def __repr__(self):
+    return f"Strain alias: {self.alias} -- {self.strain} ({'current' if self.is_current else 'previous'} name)"
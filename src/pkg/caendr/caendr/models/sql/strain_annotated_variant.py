@@ -1,10 +1,13 @@
+import base64
+import json
 import pandas as pd
-from sqlalchemy import and_
+from itertools import islice
+from sqlalchemy import and_, or_
 
 from caendr.services.cloud.postgresql import db
 from caendr.models.sql.dict_serializable import DictSerializable
 from caendr.utils.bio  import parse_chrom_interval, parse_chrom_position
-from caendr.utils.data import convert_query_to_data_table
+from caendr.utils.data import convert_query_to_data_table, stream_rows_as_column_json, stream_rows_as_download_file
 
 class StrainAnnotatedVariant(DictSerializable, db.Model):
   """
@@ -38,6 +41,17 @@ class StrainAnnotatedVariant(DictSerializable, db.Model):
   __tablename__ = 'strain_annotated_variants'
   __gene_summary__ = db.relationship("WormbaseGeneSummary", backref='strain_annotated_variants', lazy='joined')
 
+  # Interval queries filter on all three of these columns, so a single composite index lets them run as one range scan
+  # (rather than combining the single-column indexes). The single-column indexes are kept for queries without a species.
+  __table_args__ = (
+    db.Index('ix_strain_annotated_variants_species_name_chrom_pos', species_name, chrom, pos),
+  )
+
+
+  # Number of variants returned by a single page of an interval query, and the hard cap on what a client can request
+  DEFAULT_PAGE_SIZE = 1000
+  MAX_PAGE_SIZE     = 10000
+
 
   # List of columns to be checked by default
   _column_default_list = [
@@ -101,7 +115,10 @@ class StrainAnnotatedVariant(DictSerializable, db.Model):
 
 
   @classmethod
-  def run_interval_query(cls, interval, species=None):
+  def get_interval_query(cls, interval, species=None):
+    """
+      Construct the query object for all variants within an interval, optionally restricted to a single species.
+    """
 
     # If interval was passed as a string, parse into a dict
     # Otherwise, it should already be a dict with the right structure
@@ -115,11 +132,139 @@ class StrainAnnotatedVariant(DictSerializable, db.Model):
       StrainAnnotatedVariant.pos < interval['stop'],
     ) )
 
-    return cls.__run_query(query, species=species)
+    return cls.__filter_species(query, species=species)
 
 
   @classmethod
-  def run_position_query(cls, position, species=None):
+  def run_interval_query(cls, interval, species=None):
+    return cls.__run_query(cls.get_interval_query(interval, species=species))
+
+
+  @classmethod
+  def stream_interval_page(cls, interval, species=None, cursor=None, page_size=None, batch_size=1000):
+    """
+      Run one page of an interval query, yielding the result as a JSON object in chunks of text:
+        {
+          "data":            { column: [ values ] },
+          "cursor":          cursor for the next page, or null if this is the last page,
+          "estimated_total": estimated number of variants in the full interval (first page only; may be null),
+        }
+
+      Variants are ordered by (pos, species_name, id), and pages are selected with a keyset condition on those columns,
+      so each page is a range scan that starts where the previous one ended. The primary key is (id, species_name),
+      so the species is needed to break ties between variants at the same position when no species is given.
+      The page size is capped at MAX_PAGE_SIZE, so no single request can pull an entire chromosome.
+    """
+    if isinstance(interval, str):
+      interval = parse_chrom_interval(interval)
+    page_size = max(1, min(int(page_size or cls.DEFAULT_PAGE_SIZE), cls.MAX_PAGE_SIZE))
+
+    # Estimate the size of the full result when the first page is requested
+    estimated_total = cls.estimate_interval_count(interval, species=species) if cursor is None else None
+
+    # Select one extra row, to determine whether there is another page
+    # The species is selected after the output columns, since it's needed for the cursor
+    columns = StrainAnnotatedVariant.get_column_names()
+    query = cls.get_interval_query(interval, species=species)
+    if cursor is not None:
+      pos, species_name, id = cls.decode_cursor(cursor, interval)
+      query = query.filter( or_(
+        StrainAnnotatedVariant.pos > pos,
+        and_( StrainAnnotatedVariant.pos == pos, StrainAnnotatedVariant.species_name > species_name ),
+        and_( StrainAnnotatedVariant.pos == pos, StrainAnnotatedVariant.species_name == species_name, StrainAnnotatedVariant.id > id ),
+      ) )
+    query = query \
+      .with_entities(*[ getattr(StrainAnnotatedVariant, col) for col in columns ], StrainAnnotatedVariant.species_name) \
+      .order_by(StrainAnnotatedVariant.pos, StrainAnnotatedVariant.species_name, StrainAnnotatedVariant.id) \
+      .limit(page_size + 1) \
+      .yield_per(batch_size)
+
+    # Keep track of the last row in the page as it's streamed, to build the cursor for the next page
+    rows = iter(query)
+    last = {}
+    def page():
+      for row in islice(rows, page_size):
+        last['row'] = row
+        yield row[:-1]
+
+    yield '{"data":'
+    yield from stream_rows_as_column_json(page(), columns, fill_value='')
+
+    next_cursor = None
+    if next(rows, None) is not None:
+      row = dict(zip([ *columns, 'species_name' ], last['row']))
+      next_cursor = cls.encode_cursor(row['chrom'], row['pos'], row['species_name'], row['id'])
+
+    yield f',"cursor":{ json.dumps(next_cursor) },"estimated_total":{ json.dumps(estimated_total) }}}'
+
+
+  @staticmethod
+  def encode_cursor(chrom, pos, species_name, id):
+    """
+      Encode the position of a variant as an opaque cursor string for paginated queries.
+    """
+    return base64.urlsafe_b64encode( json.dumps([ chrom, pos, species_name, id ]).encode() ).decode()
+
+
+  @staticmethod
+  def decode_cursor(cursor, interval):
+    """
+      Decode a cursor string into the (pos, species_name, id) of the last variant in the previous page.
+      Raises a ValueError if the cursor is malformed, or doesn't belong to the given interval.
+    """
+    try:
+      chrom, pos, species_name, id = json.loads( base64.urlsafe_b64decode(cursor.encode()) )
+      pos, species_name, id = int(pos), str(species_name), int(id)
+    except (AttributeError, TypeError, ValueError) as ex:
+      raise ValueError(f'Invalid query cursor "{cursor}".') from ex
+
+    if chrom != interval['chrom']:
+      raise ValueError(f'Query cursor for chromosome {chrom} does not match interval on chromosome {interval["chrom"]}.')
+    return pos, species_name, id
+
+
+  @classmethod
+  def estimate_interval_count(cls, interval, species=None):
+    """
+      Estimate the number of variants in an interval from the PostgreSQL planner statistics, without running the query.
+      Returns None for other databases.
+    """
+    if db.engine.dialect.name != 'postgresql':
+      return None
+
+    query = cls.get_interval_query(interval, species=species).with_entities(StrainAnnotatedVariant.id)
+    plan = cls.__explain(query, 'EXPLAIN (FORMAT JSON)')[0]
+
+    # Depending on the driver, the JSON plan may or may not already be parsed
+    if isinstance(plan, str):
+      plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+  @classmethod
+  def explain_interval_query(cls, interval, species=None, analyze=True):
+    """
+      Get the query plan PostgreSQL uses for an interval query, as a list of lines.
+
+      With `analyze`, the query is actually run, and the plan includes timings and buffer usage.
+      Used to check that interval queries are served by a single range scan over the composite index.
+    """
+    query = cls.get_interval_query(interval, species=species)
+    return cls.__explain(query, 'EXPLAIN (ANALYZE, BUFFERS)' if analyze else 'EXPLAIN')
+
+
+  @classmethod
+  def __explain(cls, query, prefix):
+    statement = query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+    with db.engine.connect() as conn:
+      return [ row[0] for row in conn.execute(f'{prefix} {statement}') ]
+
+
+  @classmethod
+  def get_position_query(cls, position, species=None):
+    """
+      Construct the query object for all variants at a single position, optionally restricted to a single species.
+    """
 
     # If position was passed as a string, parse into a dict
     # Otherwise, it should already be a dict with the right structure
@@ -132,18 +277,43 @@ class StrainAnnotatedVariant(DictSerializable, db.Model):
       StrainAnnotatedVariant.pos   == position['pos'],
     ) )
 
-    return cls.__run_query(query, species=species)
+    return cls.__filter_species(query, species=species)
 
 
   @classmethod
-  def __run_query(cls, query, species=None):
+  def run_position_query(cls, position, species=None):
+    return cls.__run_query(cls.get_position_query(position, species=species))
+
+
+  @classmethod
+  def stream_download_file(cls, query, file_ext='csv', compress=False, batch_size=1000):
+    """
+      Export the results of an interval or position query as a CSV/TSV file, yielding the file in chunks of bytes.
+      Rows are read in order of position using a server-side cursor (where supported), and written out as they arrive.
+    """
+    columns = [ col['id'] for col in StrainAnnotatedVariant.get_column_details() ]
+    rows = query \
+      .with_entities(*[ getattr(StrainAnnotatedVariant, col) for col in columns ]) \
+      .order_by(StrainAnnotatedVariant.pos, StrainAnnotatedVariant.id) \
+      .yield_per(batch_size)
+
+    yield from stream_rows_as_download_file(rows, columns, file_ext=file_ext, compress=compress)
 
-    # Get the list of column names
-    columns = StrainAnnotatedVariant.get_column_names()
+
+  @classmethod
+  def __filter_species(cls, query, species=None):
 
     # If a species was provided, use it to refine the query
     if species:
       query = query.filter( StrainAnnotatedVariant.species_name == species.name )
+    return query
+
+
+  @classmethod
+  def __run_query(cls, query):
+
+    # Get the list of column names
+    columns = StrainAnnotatedVariant.get_column_names()
 
     # Convert query into a DataFrame
     data_frame = convert_query_to_data_table(query, columns=columns)
@@ -27,6 +27,14 @@ class WormbaseGeneSummary(DictSerializable, db.Model):
   __tablename__ = "wormbase_gene_summary"
   __gene_id_constraint__ = db.UniqueConstraint(gene_id)
 
+  # Gene searches match the lowercased name columns by prefix (`lower(col) LIKE 'query%'`), which the plain indexes can't serve.
+  # The text_pattern_ops operator class lets PostgreSQL use these expression indexes for prefix matches in any locale.
+  __table_args__ = (
+    db.Index('ix_wormbase_gene_summary_lower_locus',         func.lower(locus).label('lower_locus'),                 postgresql_ops={'lower_locus':         'text_pattern_ops'}),
+    db.Index('ix_wormbase_gene_summary_lower_sequence_name', func.lower(sequence_name).label('lower_sequence_name'), postgresql_ops={'lower_sequence_name': 'text_pattern_ops'}),
+    db.Index('ix_wormbase_gene_summary_lower_gene_id',       func.lower(gene_id).label('lower_gene_id'),             postgresql_ops={'lower_gene_id':       'text_pattern_ops'}),
+  )
+
   @hybrid_property
   def interval(self):
     return f"{self.chrom}:{self.start}-{self.end}"    
@@ -44,3 +52,40 @@ class WormbaseGeneSummary(DictSerializable, db.Model):
     result = cls.query.filter(or_(cls.locus == query, cls.sequence_name == query)).first()
     if result:
       return result.gene_id
+
+  @classmethod
+  def get_gene_id_lookup(cls, species_name=None):
+    """
+        Load a mapping from locus names & transcript IDs to wormbase gene IDs with a single query,
+        so many genes can be resolved in memory instead of one query each (see resolve_gene_id).
+
+        species_name - if provided, only load genes for this species
+        output - a dict of names to wormbase gene IDs
+
+        Example:
+        WormbaseGeneSummary.get_gene_id_lookup('c_elegans')['pot-2'] --> WBGene00010195
+    """
+    query = db.session.query(cls.gene_id, cls.locus, cls.sequence_name)
+    if species_name is not None:
+      query = query.filter(cls.species_name == species_name)
+
+    lookup = {}
+    for gene_id, locus, sequence_name in query:
+      for name in (locus, sequence_name):
+        if name:
+          lookup.setdefault(name, gene_id)
+    return lookup
+
+  @classmethod
+  def get_gene_ids(cls, species_name=None):
+    """
+        Load the set of all wormbase gene IDs with a single query, so many genes can be checked in memory.
+        Unlike get_gene_id_lookup, includes genes with no locus or transcript ID.
+
+        species_name - if provided, only load genes for this species
+        output - a set of wormbase gene IDs
+    """
+    query = db.session.query(cls.gene_id)
+    if species_name is not None:
+      query = query.filter(cls.species_name == species_name)
+    return { gene_id for gene_id, in query }
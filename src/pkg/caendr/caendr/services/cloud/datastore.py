@@ -1,4 +1,11 @@
+import copy
 import json
+from contextlib  import contextmanager
+from contextvars import ContextVar
+from typing      import Dict, Iterable, Optional
+
+from flask import g, has_request_context
+
 from caendr.services.logger import logger
 from caendr.utils.json import dump_json
 
@@ -6,15 +13,70 @@ from google.cloud import datastore
 
 dsClient = datastore.Client()
 
+# Maximum number of keys the datastore accepts in a single lookup
+MAX_GET_MULTI = 1000
+
+
+# Identity map for code running outside of a request, if one has been opened with `ds_identity_map`
+_identity_map: ContextVar[Optional[dict]] = ContextVar('ds_identity_map', default=None)
+
+
+def get_identity_map() -> Optional[dict]:
+  '''
+    Get the map of entities already fetched in the current request, keyed by (kind, name).
+    Entities that were looked up but don't exist are stored as None.
+
+    Within a request, the map lasts until the end of the request. Outside of one, returns None
+    unless a map has been opened with `ds_identity_map`.
+  '''
+  if has_request_context():
+    if 'ds_identity_map' not in g:
+      g.ds_identity_map = {}
+    return g.ds_identity_map
+  return _identity_map.get()
+
+
+@contextmanager
+def ds_identity_map():
+  '''
+    Context manager to make sure the same entity isn't fetched twice within the block, e.g. when running outside of a request.
+    If a map already exists (e.g. for the current request), it's used as-is.
+  '''
+  existing = get_identity_map()
+  if existing is not None:
+    yield existing
+    return
+
+  token = _identity_map.set({})
+  try:
+    yield _identity_map.get()
+  finally:
+    _identity_map.reset(token)
+
+
+def _forget_ds_entity(kind, name):
+  ''' Remove an entity from the identity map, so the next lookup fetches it again '''
+  identity_map = get_identity_map()
+  if identity_map is not None:
+    identity_map.pop((kind, name), None)
+
+
+def _forget_ds_kind(kind):
+  ''' Remove all entities of a kind from the identity map '''
+  identity_map = get_identity_map()
+  if identity_map is not None:
+    for key in [ key for key in identity_map if key[0] == kind ]:
+      del identity_map[key]
+
+
 def delete_ds_entity_by_ref(kind, id):
   key = dsClient.key(kind, id)
   dsClient.delete(key)
+  _forget_ds_entity(kind, id)
 
 
-def get_ds_entity(kind, name):
-  ''' Returns item by kind and name from google datastore '''
-  result = dsClient.get(dsClient.key(kind, name))
-  logger.debug(f"get: {kind} - {name}")
+def _parse_ds_entity(result):
+  ''' Convert a datastore entity to a dict of its fields, parsing JSON fields and dropping empty ones '''
   try:
     result_out = {'_exists': True}
     for k, v in result.items():
@@ -28,6 +90,52 @@ def get_ds_entity(kind, name):
     return None
 
 
+def get_ds_entity(kind, name):
+  ''' Returns item by kind and name from google datastore '''
+  identity_map = get_identity_map()
+
+  # Only fetch each entity once per request
+  if identity_map is not None and (kind, name) in identity_map:
+    return copy.deepcopy(identity_map[(kind, name)])
+
+  result = dsClient.get(dsClient.key(kind, name))
+  logger.debug(f"get: {kind} - {name}")
+  result_out = _parse_ds_entity(result)
+
+  if identity_map is not None:
+    identity_map[(kind, name)] = copy.deepcopy(result_out)
+  return result_out
+
+
+def get_ds_entities(kind, names: Iterable[str]) -> Dict[str, dict]:
+  '''
+    Returns items by kind and name from google datastore, looking up all names in as few requests as possible.
+    Returns a dict mapping each name that exists to its item.
+  '''
+  identity_map = get_identity_map()
+  names = list(dict.fromkeys( name for name in names if name ))
+
+  # Only fetch entities that haven't been fetched in this request yet
+  results = {}
+  if identity_map is not None:
+    results = { name: identity_map[(kind, name)] for name in names if (kind, name) in identity_map }
+  to_fetch = [ name for name in names if name not in results ]
+
+  # Fetch the remaining entities in batches, noting any that don't exist
+  for i in range(0, len(to_fetch), MAX_GET_MULTI):
+    batch = to_fetch[i : i + MAX_GET_MULTI]
+    found = dsClient.get_multi([ dsClient.key(kind, name) for name in batch ])
+    logger.debug(f"get_multi: {kind} - {len(found)} of {len(batch)} found")
+
+    batch_results = { name: None for name in batch }
+    batch_results.update({ result.key.name: _parse_ds_entity(result) for result in found })
+    if identity_map is not None:
+      identity_map.update({ (kind, name): result for name, result in batch_results.items() })
+    results.update(batch_results)
+
+  return { name: copy.deepcopy(result) for name, result in results.items() if result is not None }
+
+
 def save_ds_entity(kind, name, **kwargs):
   ''' Saves an entity to the datastore, optionally preventing indexing of select properties '''
   try:
@@ -48,6 +156,7 @@ def save_ds_entity(kind, name, **kwargs):
 
   logger.debug(f"store: {kind} - {name}")
   dsClient.put(m)
+  _forget_ds_entity(kind, name)
 
 
 def query_ds_entities(kind, filters=None, projection=(), order=None, limit=None, keys_only=False):
@@ -94,6 +203,7 @@ def delete_ds_entities_by_query(kind, filters=None, projection=()):
         keys.append(entity.key)
       dsClient.delete_multi(keys)
       deleted_items += len(keys)
+      _forget_ds_kind(kind)
       if more is False:
         break
     return deleted_items
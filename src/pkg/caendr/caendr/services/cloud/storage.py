@@ -191,11 +191,15 @@ def upload_blob_from_file_object(bucket_name, file, blob_name):
   blob.upload_from_file(file)
 
 
-def upload_blob_from_string(bucket_name, data, blob_name):
-  """Uploads a string to the bucket as a file."""
+def upload_blob_from_string(bucket_name, data, blob_name, if_generation_match=None):
+  """
+    Uploads a string to the bucket as a file.
+    If `if_generation_match` is provided, only uploads if the blob's current generation matches it (use 0 if the blob
+    should not exist yet), raising a `google.api_core.exceptions.PreconditionFailed` error otherwise.
+  """
   bucket = storageClient.get_bucket(bucket_name)
   blob = bucket.blob(blob_name)
-  blob.upload_from_string(data)
+  blob.upload_from_string(data, if_generation_match=if_generation_match)
 
 
 def upload_blob_from_file(bucket_name, filename, blob_name):
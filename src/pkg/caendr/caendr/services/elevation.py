@@ -1,28 +1,169 @@
+import json
 import requests
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from string import Template
-from caendr.services.cloud.secret import get_secret
-from caendr.services.logger import logger
-from diskcache import Cache
+from google.api_core.exceptions import PreconditionFailed
 
-cache = Cache("cachedir")
+from caendr.services.cloud.secret  import get_secret
+from caendr.services.cloud.storage import download_blob_as_json, get_blob, join_path, upload_blob_from_string
+from caendr.services.logger        import logger
+from caendr.utils.env              import get_env_var
 
 
 ELEVATION_API_KEY = get_secret('ELEVATION_API_KEY')
-elevation_url_template = Template('https://maps.googleapis.com/maps/api/elevation/json?locations=$lat,$lon&key=$api_key')
 
-@cache.memoize()
-def get_elevation(lat: float, lon: float):
-  logger.debug(f'Requesting elevation from Google Maps API: {lat} - {lon}')
-  url = elevation_url_template.substitute(lat=lat, lon=lon, api_key=ELEVATION_API_KEY)
-  result = requests.get(url)
+# Endpoint for the elevation API -- can be pointed at a local stub server for testing
+ELEVATION_API_URL = get_env_var('ELEVATION_API_URL', 'https://maps.googleapis.com/maps/api/elevation/json')
+
+# Maximum number of locations to request at once (the API allows up to 512, subject to a URL length limit)
+MAX_LOCATIONS_PER_REQUEST = 256
+
+# Location of the shared elevation cache
+# Bumping the version starts a fresh cache, e.g. if the source of the elevation data changes
+ELEVATION_CACHE_BUCKET  = get_env_var('MODULE_DB_OPERATIONS_BUCKET_NAME', can_be_none=True)
+ELEVATION_CACHE_PATH    = 'elevation_cache'
+ELEVATION_CACHE_VERSION = get_env_var('ELEVATION_CACHE_VERSION', 'v1')
+
+# Number of times to retry saving the cache if another process saves it first
+ELEVATION_CACHE_SAVE_ATTEMPTS = 5
+
+
+Location = Tuple[float, float]
+
+
+
+#
+# Cache
+#
+
+class ElevationCache():
+  '''
+    Shared cache of elevation lookups, stored as a JSON file in GCS so it's kept between runs (and containers).
+    If no bucket is configured, the cache only lasts as long as the object itself.
+  '''
+
+  def __init__(self, bucket: Optional[str] = ELEVATION_CACHE_BUCKET, version: str = ELEVATION_CACHE_VERSION):
+    self.bucket    = bucket
+    self.blob_name = join_path(ELEVATION_CACHE_PATH, f'{version}.json')
+
+    self._values, _ = self._download()
+    self._added     = {}
+
+
+  def __repr__(self):
+    return f'<Elevation cache gs://{self.bucket}/{self.blob_name} ({len(self._values)} locations)>'
+
+
+  @staticmethod
+  def get_key(lat, lon) -> str:
+    return f'{lat},{lon}'
+
+
+  def _download(self) -> Tuple[Dict[str, float], int]:
+    '''
+      Download the latest copy of the shared cache, along with its generation (0 if it doesn't exist yet).
+    '''
+    if not self.bucket:
+      return {}, 0
+    blob = get_blob(self.bucket, self.blob_name)
+    if blob is None:
+      return {}, 0
+    return download_blob_as_json(blob), blob.generation
+
+
+  def get(self, lat, lon) -> Optional[float]:
+    return self._values.get( self.get_key(lat, lon) )
+
+  def set(self, lat, lon, elevation: float):
+    key = self.get_key(lat, lon)
+    self._values[key] = elevation
+    self._added[key]  = elevation
+
+
+  def save(self):
+    '''
+      Upload any new entries to the shared cache.
+
+      Merges with the latest copy first, and only uploads if no other process has saved the cache since it was downloaded,
+      so entries added by other processes in the meantime aren't lost. If another process did save first, merges again.
+    '''
+    if not self.bucket or not len(self._added):
+      return
+
+    for _ in range(ELEVATION_CACHE_SAVE_ATTEMPTS):
+      values, generation = self._download()
+      values = { **values, **self._added }
+      try:
+        upload_blob_from_string(self.bucket, json.dumps(values), self.blob_name, if_generation_match=generation)
+      except PreconditionFailed:
+        logger.info(f'Elevation cache gs://{self.bucket}/{self.blob_name} was saved by another process. Merging again...')
+        continue
+
+      self._values = values
+      logger.info(f'Saved {len(self._added)} new location(s) to elevation cache gs://{self.bucket}/{self.blob_name}')
+      self._added = {}
+      return
+
+    logger.error(f'Could not save {len(self._added)} new location(s) to elevation cache gs://{self.bucket}/{self.blob_name} after {ELEVATION_CACHE_SAVE_ATTEMPTS} attempts')
+
+
+
+#
+# Requests
+#
+
+def request_elevations(locations: List[Location]) -> List[Optional[float]]:
+  '''
+    Request the elevation of multiple locations from the elevation API in a single request.
+    Returns a list of elevations in the same order as the locations, with `None` for any that couldn't be fetched.
+  '''
+  logger.debug(f'Requesting elevation for {len(locations)} location(s) from {ELEVATION_API_URL}')
+  result = requests.get(ELEVATION_API_URL, params={
+    'locations': '|'.join([ f'{lat},{lon}' for lat, lon in locations ]),
+    'key':       ELEVATION_API_KEY,
+  })
+
   if result.ok:
     try:
-      elevation = result.json()['results'][0]['elevation']
-      logger.debug(f'Elevation: {lat} - {lon}: {elevation}')
-      return elevation
-    except KeyError:
+      results = result.json()['results']
+      if len(results) == len(locations):
+        return [ r['elevation'] for r in results ]
+    except (KeyError, ValueError):
       pass
 
-  logger.error(f'Error requesting elevation data from Google Maps API: {lat} - {lon}')
-  return None
\ No newline at end of file
+  logger.error(f'Error requesting elevation data for {len(locations)} location(s): {result.status_code} {result.text[:200]}')
+  return [ None for _ in locations ]
+
+
+def get_elevations(locations: Iterable[Location], cache: ElevationCache = None) -> Dict[Location, Optional[float]]:
+  '''
+    Get the elevation of each of a set of (lat, lon) locations, keyed by location.
+
+    Cached locations are looked up directly, and the rest are requested in batches of up to
+    MAX_LOCATIONS_PER_REQUEST, then added to the cache.
+  '''
+  if cache is None:
+    cache = ElevationCache()
+
+  # Look up all unique locations in the cache
+  elevations = { location: cache.get(*location) for location in dict.fromkeys(locations) }
+  missing    = [ location for location, elevation in elevations.items() if elevation is None ]
+  logger.info(f'Found {len(elevations) - len(missing)} of {len(elevations)} location(s) in {cache}')
+
+  # Request the remaining locations in batches
+  for i in range(0, len(missing), MAX_LOCATIONS_PER_REQUEST):
+    batch = missing[i : i + MAX_LOCATIONS_PER_REQUEST]
+    for location, elevation in zip(batch, request_elevations(batch)):
+      elevations[location] = elevation
+      if elevation is not None:
+        cache.set(*location, elevation)
+
+  cache.save()
+  return elevations
+
+
+def get_elevation(lat: float, lon: float) -> Optional[float]:
+  '''
+    Get the elevation of a single location. When looking up many locations, use `get_elevations` instead.
+  '''
+  return get_elevations([ (lat, lon) ])[(lat, lon)]
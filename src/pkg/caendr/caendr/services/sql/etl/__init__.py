@@ -1,13 +1,24 @@
+import collections
+import datetime
+import json
+import multiprocessing
 import os
 import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 from logzero import logger
+from sqlalchemy import Column, Index, MetaData, PrimaryKeyConstraint, Table, func, select, text
+from sqlalchemy.sql import visitors
 
 # Local imports
-from .table_config import StrainConfig, WormbaseGeneSummaryConfig, WormbaseGeneConfig, StrainAnnotatedVariantConfig, PhenotypeDatabaseConfig, PhenotypeMetadataConfig
+from .loader       import get_loader, iter_batches, split_rows, ColumnBatch, TableLoader
+from .snapshot     import TableSnapshotWriter, read_snapshot_manifest, read_table_snapshot
+from .table_config import DEFAULT_DOWNLOAD_WORKERS, MODULE_DB_OPERATIONS_BUCKET_NAME, StrainConfig, StrainAliasConfig, WormbaseGeneSummaryConfig, WormbaseGeneConfig, StrainAnnotatedVariantConfig, PhenotypeDatabaseConfig, PhenotypeMetadataConfig
 
 from caendr.models.datastore import Species
+from caendr.models.sql       import EtlCheckpoint, EtlSourceFile
 from caendr.utils.constants  import DEFAULT_BATCH_SIZE
-from caendr.utils.data       import batch_generator
 
 
 
@@ -15,6 +26,7 @@ from caendr.utils.data       import batch_generator
 TABLE_CONFIG = {
     config.table_name: config for config in [
         StrainConfig,
+        StrainAliasConfig,
         WormbaseGeneSummaryConfig,
         WormbaseGeneConfig,
         StrainAnnotatedVariantConfig,
@@ -30,16 +42,54 @@ class ETLManager:
     # The default local directory to store all downloaded files in
     __DEFAULT_LOCAL_DIR = os.path.join('.', '.download')
 
+    # Suffix for the names of staging tables (and their indexes)
+    __STAGE_SUFFIX = '__stage'
 
-    def __init__(self, app, db, reload_files: bool = False, local_directory: str = None):
+
+    def __init__(self, app, db, reload_files: bool = False, local_directory: str = None, loader: str = None, workers: int = 1, rebuild_indexes: bool = False, shadow_load: bool = False,
+                 snapshot_release: str = None, restore_release: str = None, resume: bool = False, download_workers: int = DEFAULT_DOWNLOAD_WORKERS):
         self.app = app
         self.db  = db
 
+        # Set the strategy for inserting rows into tables
+        self.loader = get_loader(db, loader)
+        logger.info(f'Using table loader "{self.loader.name}"')
+
+        # Set the number of worker processes to use when loading multiple species
+        self.workers = self.__resolve_worker_count(workers)
+        logger.info(f'Using {self.workers} worker process(es) per table')
+
+        # Set the maximum number of source files to download at once
+        self.download_workers = max(download_workers or 1, 1)
+
+        # Whether to drop secondary indexes while loading tables, and rebuild them afterwards
+        self.rebuild_indexes = rebuild_indexes
+
+        # Whether to load into staging tables and swap them into place, so the live tables stay readable throughout
+        self.shadow_load = self.__resolve_shadow_load(shadow_load)
+
+        # Optionally write a Parquet snapshot of each loaded table, and/or load tables from an existing snapshot instead of parsing
+        self.snapshot_release = snapshot_release
+        self.restore_release  = restore_release
+        if restore_release:
+            logger.info(f'Restoring tables from snapshot "{restore_release}" instead of parsing source files')
+
+        # Whether to resume an interrupted load from the last saved checkpoints, rather than starting over
+        self.resume = self.__resolve_resume(resume)
+
+        # Source file checksums already looked up by this manager, keyed by table name & species name
+        self._checksums = {}
+
+        # Make sure the tables tracking loaded source files & load progress exist
+        EtlSourceFile.__table__.create(bind=self.db.engine, checkfirst=True)
+        EtlCheckpoint.__table__.create(bind=self.db.engine, checkfirst=True)
+
         # Set the local directory
         self._local_directory = local_directory or self.__DEFAULT_LOCAL_DIR
 
         # Prep the local directory
-        if reload_files:
+        # When resuming, keep any files downloaded by the interrupted run
+        if reload_files and not self.resume:
             self.reset_directory()
         self.ensure_directory_exists()
 
@@ -69,6 +119,26 @@ class ETLManager:
             shutil.rmtree(self._local_directory)
 
 
+    #
+    # Worker Processes
+    #
+
+    def __resolve_worker_count(self, workers):
+        '''
+            Determine the number of worker processes to use.
+            A value of zero or less means one worker per available CPU.
+        '''
+        if workers is None or workers <= 0:
+            workers = os.cpu_count() or 1
+
+        # Separate processes can't share a SQLite database (esp. in-memory), so always load serially
+        if workers > 1 and self.db.engine.dialect.name == 'sqlite':
+            logger.warning('Parallel loading is not supported for SQLite databases. Using a single worker.')
+            workers = 1
+
+        return workers
+
+
     #
     # Tables
     #
@@ -76,6 +146,19 @@ class ETLManager:
     def all_tables(self):
         return list(self.db.metadata.tables.values())
 
+    def all_models(self):
+        '''
+            Get the model for each table in the database, in dependency order.
+            Skips the tables tracking loaded source files & load progress, so these are kept when all tables are cleared.
+        '''
+        bookkeeping = [ EtlSourceFile.__table__, EtlCheckpoint.__table__ ]
+        models = {
+            model.__table__: model for model in self.db.Model.__subclasses__() if hasattr(model, '__table__')
+        }
+        return [
+            models[table] for table in self.db.metadata.sorted_tables if table in models and table not in bookkeeping
+        ]
+
     @staticmethod
     def print_tables(*tables):
         if not len(tables):
@@ -106,33 +189,685 @@ class ETLManager:
     def load_table(self, table, species_list = None):
         '''
             Load & insert data for a single SQL table.
+            Returns the number of rows inserted.
+
+            In shadow load mode, the data is loaded into a staging table, which then replaces the live table.
         '''
 
         # Get config object for the table
         config = TABLE_CONFIG[table.__tablename__]
 
+        # When restoring, make sure the snapshot is complete before touching the table
+        self.check_snapshots(table, species_list=species_list)
+
         # Initialize a count for the number of entries added
         initial_count = config.table.query.count()
         logger.info(f'Initial count for table {config.table_name}: {initial_count} entries')
 
-        # Loop through the name & Species object for each species
-        for species in Species.all().values():
+        # End the session's read transaction, so it doesn't hold a lock that blocks the DDL statements below
+        self.db.session.commit()
+
+        table_start = time.perf_counter()
+
+        # Get the list of species to load, skipping any species not in the list
+        species_to_load = [
+            species for species in Species.all().values() if not species_list or species.name in species_list
+        ]
+
+        # Get the checksum of each source file before it's fetched, to record once the load succeeds
+        # Restored tables don't correspond to the current source files, so the snapshot is recorded in their place,
+        # without a checksum (so sync operations always treat the table as changed)
+        if self.restore_release:
+            checksums = { species.name: { f'snapshot:{self.restore_release}': None } for species in species_to_load }
+        else:
+            checksums = self.get_checksums(config, species_to_load)
+
+        # Download all the source files up front, rather than one at a time as each species is parsed
+        if not self.restore_release:
+            config.prefetch(species_to_load, max_workers=self.download_workers)
+
+        # Determine the table to insert rows into
+        # In shadow load mode, the staging table is created without indexes; otherwise, optionally drop secondary indexes,
+        # so inserts don't pay for index maintenance
+        # Indexes are only dropped when reloading the whole table -- the rows of other species stay in the table,
+        # and queries against them shouldn't lose their indexes while a few species are reloaded
+        if self.shadow_load:
+            target = self.create_stage_table(config.table, species_list=species_list)
+            dropped_indexes = []
+        else:
+            target = config.table
+            dropped_indexes = self.drop_indexes(config.table) if self.rebuild_indexes and species_list is None else []
+        load_start = time.perf_counter()
+
+        # Load each species in its own worker process, or sequentially in this process
+        # Dropped indexes are always restored, even if the load fails
+        try:
+            if self.workers > 1 and len(species_to_load) > 1:
+                total_records = self.__load_species_parallel(config, species_to_load)
+            else:
+                total_records = sum([ self.load_species(config, species, target=target) for species in species_to_load ])
+            logger.info(f'Finished loading rows into table {self.get_table_name(target)} in {time.perf_counter() - load_start:.2f}s')
 
-            # Skip any species not in the list
-            if species_list and species.name not in species_list:
+        finally:
+            if len(dropped_indexes):
+                self.create_indexes(config.table, dropped_indexes)
+                self.analyze_table(config.table)
+
+        # Index the staging table and swap it into place
+        if self.shadow_load:
+            self.create_indexes(target, self.get_stage_indexes(config.table, target))
+            self.analyze_table(target)
+            self.swap_stage_table(config.table, target)
+
+        # Otherwise, create any indexes declared on the model that the live table is missing, e.g. indexes added to the
+        # model after the table was created (`create_all` only creates indexes along with new tables)
+        else:
+            missing_indexes = self.get_missing_indexes(config.table)
+            if len(missing_indexes):
+                self.create_indexes(config.table, missing_indexes)
+                self.analyze_table(config.table)
+
+        # Record the source files that were loaded
+        for species_name, species_checksums in checksums.items():
+            self.record_checksums(config.table, species_name, species_checksums)
+
+        # Print how many entries were added
+        logger.info(f'Inserted {total_records} entries into table {config.table_name} {self.format_rate(total_records, table_start)}')
+        logger.info(f'Final count for table {config.table_name}: {config.table.query.count()} entries')
+        self.db.session.commit()
+
+        return total_records
+
+
+    def check_snapshots(self, *tables, species_list = None):
+        '''
+            In restore mode, check that the snapshot being restored is complete for each of the given tables & species.
+            Raises a SnapshotNotFoundError otherwise, e.g. if the release name is wrong or the snapshot was never finished.
+
+            Tables that aren't loaded by the ETL (i.e. have no table config) are skipped.
+        '''
+        if not self.restore_release:
+            return
+
+        species_to_check = [
+            species for species in Species.all().values() if not species_list or species.name in species_list
+        ]
+        for table in tables:
+            if table.__tablename__ not in TABLE_CONFIG:
                 continue
+            for species in species_to_check:
+                manifest, _ = read_snapshot_manifest(table, species.name, self.restore_release, MODULE_DB_OPERATIONS_BUCKET_NAME)
+                logger.info(f'Found snapshot "{self.restore_release}" of table {table.__tablename__} for {species.name} ({manifest["num_rows"]} rows)')
+
+
+    def load_species(self, config, species, target = None):
+        '''
+            Load & insert data for a single species into the table defined by the given config.
+            If a target table is provided, inserts rows there instead (e.g. a staging table).
+            Returns the number of rows inserted.
+        '''
+        if target is None:
+            target = config.table
+
+        # Determine how many rows have already been loaded for this species, if resuming an interrupted load
+        checksum = self.get_source_checksum(config, species)
+        if self.resume:
+            offset = self.get_resume_offset(config.table, species.name, checksum)
+            if offset is None:
+                return 0
+        else:
+            offset = 0
+
+        # Get the rows to insert, either by parsing the source files or by reading them back from a snapshot
+        if self.restore_release:
+            rows = read_table_snapshot(config.table, species.name, self.restore_release, MODULE_DB_OPERATIONS_BUCKET_NAME, self._local_directory)
+        else:
+            rows = config.parse_for_species(species)
+
+        # Optionally write the rows to a snapshot as they're inserted
+        snapshot = None
+        if self.snapshot_release:
+            snapshot = TableSnapshotWriter(config.table, species.name, self.snapshot_release, MODULE_DB_OPERATIONS_BUCKET_NAME, self._local_directory)
+
+        species_start = time.perf_counter()
+        species_count = 0
+        try:
+
+            # Skip past the rows that were already committed
+            # These are still written to the snapshot, so it holds every row for the species, not just the ones inserted by this run
+            if offset:
+                logger.info(f'Resuming {species.name} in table {self.get_table_name(target)} after {offset} rows')
+                skipped, rows = split_rows(rows, offset)
+                if snapshot is not None:
+                    for g in iter_batches(skipped):
+                        snapshot.write(g)
+                else:
+                    collections.deque(skipped, maxlen=0)
+
+            # Every batch but the last is full, so the number of committed batches follows from the row offset
+            batches_loaded = offset // DEFAULT_BATCH_SIZE
+            self.save_checkpoint(config.table, species.name, checksum, batches_loaded = batches_loaded, rows_loaded = offset)
 
             # Load & insert table data in batches, to help reduce local memory footprint
-            logger.info(f'Inserting data for {species.name} into table {config.table_name}...')
-            for i, g in enumerate(batch_generator( config.parse_for_species(species) )):
+            logger.info(f'Inserting data for {species.name} into table {self.get_table_name(target)}...')
+            # Parsers may yield single rows, or whole column batches that the loader can write directly
+            for i, g in enumerate(iter_batches(rows)):
                 logger.debug(f'Processing {species.name} batch {i} (rows {i * DEFAULT_BATCH_SIZE}-{(i+1) * DEFAULT_BATCH_SIZE})...')
-                self.db.session.bulk_insert_mappings(config.table, g)
-                self.db.session.commit()
+                if snapshot is not None:
+                    if not isinstance(g, ColumnBatch):
+                        g = list(g)
+                    snapshot.write(g)
+                species_count  += self.loader.insert_batch(target, g)
+                batches_loaded += 1
+                self.save_checkpoint(config.table, species.name, checksum, batches_loaded = batches_loaded, rows_loaded = offset + species_count)
                 logger.debug(f'Finished inserting {species.name} batch {i}.')
 
-        # Print how many entries were added
-        total_records = config.table.query.count() - initial_count
-        logger.info(f'Inserted {total_records} entries into table {config.table_name}')
+        # Only upload the snapshot if every row was loaded
+        except:
+            if snapshot is not None:
+                snapshot.close(upload=False)
+            raise
+        if snapshot is not None:
+            snapshot.close()
+
+        # Mark the species as fully loaded, so a resumed run skips it
+        self.save_checkpoint(config.table, species.name, checksum, batches_loaded = batches_loaded, rows_loaded = offset + species_count, completed = True)
+
+        logger.info(f'Inserted {species_count} {species.name} rows into table {self.get_table_name(target)} {self.format_rate(species_count, species_start)}')
+        return species_count
+
+
+    def __load_species_parallel(self, config, species_list):
+        '''
+            Load each species into the given table in its own worker process.
+            Each worker parses its species' files and inserts the rows over its own database connection.
+            Returns the total number of rows inserted.
+        '''
+        num_workers = min(self.workers, len(species_list))
+        logger.info(f'Loading {len(species_list)} species into table {config.table_name} using {num_workers} workers...')
+
+        # Release all open connections before forking, so workers don't share sockets with this process
+        self.db.session.remove()
+        self.db.engine.dispose()
+
+        # Fork the worker processes, which inherit this manager (and the rest of the loaded state) directly
+        with multiprocessing.get_context('fork').Pool(num_workers, initializer=_init_worker, initargs=(self,)) as pool:
+            counts = pool.starmap(_load_species_worker, [ (config.table_name, species.name) for species in species_list ])
+
+        return sum(counts)
+
+
+    def format_rate(self, count, start):
+        '''
+            Format the insertion rate for a number of rows, given the (`time.perf_counter`) start time.
+        '''
+        elapsed = time.perf_counter() - start
+        rate    = count / elapsed if elapsed > 0 else 0
+        return f'in {elapsed:.2f}s ({rate:.0f} rows/sec, loader: {self.loader.name})'
+
+
+
+    #
+    # Syncing Tables
+    #
+
+    def get_checksums(self, config, species_list):
+        '''
+            Get the current checksum of each source file the given table config uses for each species, keyed by species name & resource ID.
+
+            Checksums are looked up at most once per table & species for the lifetime of the manager (i.e. a single operation),
+            so loading, resuming, and syncing all see the same values. Any that haven't been looked up yet are fetched together.
+        '''
+        missing = [ species for species in species_list if (config.table_name, species.name) not in self._checksums ]
+        if len(missing):
+            for species_name, checksums in config.get_checksums(missing, max_workers=self.download_workers).items():
+                self._checksums[(config.table_name, species_name)] = checksums
+
+        return { species.name: self._checksums[(config.table_name, species.name)] for species in species_list }
+
+
+    def get_recorded_checksums(self, table, species_name):
+        '''
+            Get the checksum of each source file last loaded into the given table for the given species, keyed by resource ID.
+        '''
+        records = EtlSourceFile.query.filter_by(table_name = table.__tablename__, species_name = species_name).all()
+        return { r.resource_id: r.checksum for r in records }
+
+
+    def record_checksums(self, table, species_name, checksums):
+        '''
+            Record the checksums of the source files loaded into the given table for the given species,
+            replacing any previous records.
+        '''
+        self.__forget_checksums(table, species_list=[species_name])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self.db.session.bulk_insert_mappings(EtlSourceFile, [
+            {
+                'table_name':   table.__tablename__,
+                'species_name': species_name,
+                'resource_id':  resource_id,
+                'checksum':     checksum,
+                'loaded_on':    now,
+            }
+                for resource_id, checksum in checksums.items()
+        ])
+        self.db.session.commit()
+
+
+    def __forget_checksums(self, table, species_list = None):
+        '''
+            Delete the source file records for the given table, optionally limited to a list of species.
+        '''
+        query = EtlSourceFile.query.filter_by(table_name = table.__tablename__)
+        if species_list is not None:
+            query = query.filter(EtlSourceFile.species_name.in_(species_list))
+        query.delete(synchronize_session=False)
+        self.db.session.commit()
+
+
+    def has_changed(self, table, species) -> bool:
+        '''
+            Check whether any source files for the given table & species have changed since they were last loaded.
+            Files that can't be checksummed (e.g. Google Sheets) always count as changed.
+        '''
+        config   = TABLE_CONFIG[table.__tablename__]
+        current  = self.get_checksums(config, [species])[species.name]
+        recorded = self.get_recorded_checksums(table, species.name)
+
+        if any( checksum is None for checksum in current.values() ):
+            return True
+        return current != recorded
+
+
+    def sync_tables(self, *tables, species_list = None):
+        '''
+            Reload one or more tables, but only for the species whose source files have changed since they were last loaded.
+
+            Tables are synced as a group: if any table's files changed for a species, that species is reloaded in all
+            of them, so tables that depend on each other stay consistent. Expects tables in dependency order (see `clear_tables`).
+
+            Returns the list of species that were reloaded.
+        '''
+        species_to_check = [
+            species for species in Species.all().values() if not species_list or species.name in species_list
+        ]
+
+        # Look up the checksums for every table & species up front, rather than one at a time as each is checked
+        for table in tables:
+            self.get_checksums(TABLE_CONFIG[table.__tablename__], species_to_check)
+
+        # Find the species with at least one changed source file
+        changed = [
+            species.name for species in species_to_check if any( self.has_changed(table, species) for table in tables )
+        ]
+        unchanged = [ species.name for species in species_to_check if species.name not in changed ]
+
+        if len(unchanged):
+            logger.info(f'Source files unchanged for species [{", ".join(unchanged)}] in { self.print_tables(*tables) }. Skipping.')
+        if not len(changed):
+            logger.info(f'No source files changed for { self.print_tables(*tables) }. Nothing to sync.')
+            return changed
+
+        # Replace the rows for the changed species only
+        logger.info(f'Source files changed for species [{", ".join(changed)}] in { self.print_tables(*tables) }. Reloading...')
+        self.clear_tables(*tables, species_list=changed)
+        self.load_tables(*tables, species_list=changed)
+        return changed
+
+
+
+    #
+    # Checkpoints
+    #
+
+    def __resolve_resume(self, resume):
+        '''
+            Determine whether an interrupted load can be resumed with the current settings.
+        '''
+        if resume and self.shadow_load:
+            logger.warning('Resuming is not supported in shadow load mode, since staging tables are rebuilt on every run. Starting over.')
+            return False
+        return resume
+
+
+    def get_source_checksum(self, config, species):
+        '''
+            Get a single checksum identifying the source files for the given table config & species,
+            so a checkpoint is only resumed if it was made from the same inputs.
+        '''
+        if self.restore_release:
+            return f'snapshot:{self.restore_release}'
+        return json.dumps(self.get_checksums(config, [species])[species.name], sort_keys=True)
+
+
+    def save_checkpoint(self, table, species_name, checksum, batches_loaded = 0, rows_loaded = 0, completed = False):
+        '''
+            Record how many rows of the given table have been committed for the given species.
+        '''
+        self.db.session.merge(EtlCheckpoint(
+            table_name     = table.__tablename__,
+            species_name   = species_name,
+            checksum       = checksum,
+            batches_loaded = batches_loaded,
+            rows_loaded    = rows_loaded,
+            completed      = completed,
+            updated_on     = datetime.datetime.now(datetime.timezone.utc),
+        ))
+        self.db.session.commit()
+
+
+    def has_checkpoints(self, table, species_list = None) -> bool:
+        '''
+            Check whether any load progress has been saved for the given table, optionally limited to a list of species.
+        '''
+        query = EtlCheckpoint.query.filter_by(table_name = table.__tablename__)
+        if species_list is not None:
+            query = query.filter(EtlCheckpoint.species_name.in_(species_list))
+        result = query.count() > 0
+        self.db.session.commit()
+        return result
+
+
+    def __forget_checkpoints(self, table, species_list = None):
+        '''
+            Delete the saved load progress for the given table, optionally limited to a list of species.
+        '''
+        query = EtlCheckpoint.query.filter_by(table_name = table.__tablename__)
+        if species_list is not None:
+            query = query.filter(EtlCheckpoint.species_name.in_(species_list))
+        query.delete(synchronize_session=False)
+        self.db.session.commit()
+
+
+    def count_species_rows(self, table, species_name) -> int:
+        '''
+            Count the rows of a table that belong to the given species.
+        '''
+        table = TableLoader.get_table(table)
+        return self.db.engine.execute(
+            select([ func.count() ]).select_from(table).where( self.get_species_clause(table, [species_name]) )
+        ).scalar()
+
+
+    def get_resume_offset(self, table, species_name, checksum):
+        '''
+            Get the number of rows to skip when resuming the load of a table for the given species,
+            or `None` if the species was already fully loaded.
+
+            The offset is taken from the rows actually committed to the table, rather than the checkpoint itself,
+            so a batch committed just before the process died isn't inserted twice.
+            If there's no usable checkpoint, any rows left over for the species are dropped, and the load starts over.
+        '''
+        checkpoint = EtlCheckpoint.query.get((table.__tablename__, species_name))
+        self.db.session.commit()
+
+        # No saved progress for this species, or the source files have changed since -- start from the beginning
+        if checkpoint is None or checkpoint.checksum != checksum:
+            if checkpoint is not None:
+                logger.info(f'Source files for {species_name} in table {table.__tablename__} changed since the last checkpoint. Starting over.')
+            self.__drop_species_rows(table, species_name)
+            return 0
+
+        if checkpoint.completed:
+            logger.info(f'Species {species_name} already loaded into table {table.__tablename__} ({checkpoint.rows_loaded} rows). Skipping.')
+            return None
+
+        # Continue from the rows that were committed
+        offset = self.count_species_rows(table, species_name)
+        if offset != checkpoint.rows_loaded:
+            logger.warning(f'Checkpoint for {species_name} in table {table.__tablename__} recorded {checkpoint.rows_loaded} rows, but {offset} were committed. Resuming from {offset}.')
+        return offset
+
+
+
+    #
+    # Indexes
+    #
+
+    @staticmethod
+    def get_secondary_indexes(table):
+        '''
+            Get the secondary indexes declared on a table's model, e.g. with `index=True`.
+            Skips unique indexes, since these may be required by foreign key constraints.
+        '''
+        return [ index for index in table.__table__.indexes if not index.unique ]
+
+
+    def get_missing_indexes(self, table):
+        '''
+            Get the indexes declared on a table's model that don't exist in the database.
+
+            Index names are read from the system catalog, since the SQLAlchemy inspector skips expression indexes
+            (e.g. on `lower(...)`) in PostgreSQL.
+        '''
+        if self.db.engine.dialect.name == 'postgresql':
+            query = text('SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = :table')
+        else:
+            query = text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table")
+
+        existing = { row[0] for row in self.db.engine.execute(query, table=table.__tablename__) }
+        return [ index for index in table.__table__.indexes if index.name not in existing ]
+
+
+    def drop_indexes(self, table):
+        '''
+            Drop all secondary indexes on the given table. Returns the list of indexes dropped.
+        '''
+        indexes  = self.get_secondary_indexes(table)
+        preparer = self.db.engine.dialect.identifier_preparer
+        start    = time.perf_counter()
+
+        logger.info(f'Dropping {len(indexes)} indexes on table {table.__tablename__}: {", ".join([ i.name for i in indexes ])}')
+        for index in indexes:
+            self.db.engine.execute(f'DROP INDEX IF EXISTS {preparer.quote(index.name)}')
+
+        logger.info(f'Dropped indexes on table {table.__tablename__} in {time.perf_counter() - start:.2f}s')
+        return indexes
+
+
+    def create_indexes(self, table, indexes):
+        '''
+            (Re)create the given indexes on a table.
+            For PostgreSQL, the indexes are built concurrently over separate connections.
+        '''
+        if not len(indexes):
+            return
+        start = time.perf_counter()
+
+        def _create(index):
+            index_start = time.perf_counter()
+            index.create(bind=self.db.engine)
+            logger.info(f'Created index {index.name} in {time.perf_counter() - index_start:.2f}s')
+
+        # SQLite only allows a single writer, so build the indexes one at a time
+        num_threads = len(indexes) if self.db.engine.dialect.name == 'postgresql' else 1
+
+        logger.info(f'Creating {len(indexes)} indexes on table {self.get_table_name(table)} ({num_threads} at a time)...')
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            list(executor.map(_create, indexes))
+
+        logger.info(f'Created indexes on table {self.get_table_name(table)} in {time.perf_counter() - start:.2f}s')
+
+
+    def analyze_table(self, table):
+        '''
+            Refresh the query planner statistics for a table.
+        '''
+        start    = time.perf_counter()
+        preparer = self.db.engine.dialect.identifier_preparer
+        # SQLAlchemy doesn't autocommit ANALYZE statements, and the new statistics are discarded if it's rolled back
+        statement = text(f'ANALYZE {preparer.format_table(TableLoader.get_table(table))}').execution_options(autocommit=True)
+        self.db.engine.execute(statement)
+        logger.info(f'Analyzed table {self.get_table_name(table)} in {time.perf_counter() - start:.2f}s')
+
+
+
+    #
+    # Staging Tables
+    #
+
+    def __resolve_shadow_load(self, shadow_load):
+        '''
+            Determine whether shadow loading can be used with the current database.
+        '''
+        if shadow_load and self.db.engine.dialect.name != 'postgresql':
+            logger.warning(f'Shadow loading is not supported for database dialect "{self.db.engine.dialect.name}". Loading live tables directly.')
+            return False
+        return shadow_load
+
+
+    @staticmethod
+    def get_table_name(table):
+        '''
+            Get the name of a table, given either a model class or a Core `Table` object.
+        '''
+        return TableLoader.get_table(table).name
+
+
+    @classmethod
+    def get_stage_table(cls, table) -> Table:
+        '''
+            Build a staging table matching the columns & primary key of the given table.
+            Indexes and foreign keys are omitted, and created when the table is swapped into place.
+
+            Always produces an equivalent object, so it can be reconstructed in worker processes.
+        '''
+        live       = table.__table__
+        stage_name = live.name + cls.__STAGE_SUFFIX
+
+        return Table(
+            stage_name, MetaData(),
+            *[ Column(col.name, col.type, nullable=col.nullable, autoincrement=col.autoincrement) for col in live.columns ],
+            PrimaryKeyConstraint(*[ col.name for col in live.primary_key.columns ], name=f'{stage_name}_pkey'),
+        )
+
+
+    @classmethod
+    def get_stage_indexes(cls, table, stage: Table) -> List[Index]:
+        '''
+            Build a copy of each index on the given table for the staging table.
+            Index names are suffixed to avoid colliding with the live indexes.
+        '''
+        live = table.__table__
+
+        # Point each index expression at the staging table, so expression indexes (e.g. on `lower(col)`) are copied as-is
+        def _to_stage_column(element):
+            if isinstance(element, Column) and element.table is live:
+                return stage.c[element.name]
+
+        return [
+            Index(
+                index.name + cls.__STAGE_SUFFIX,
+                *[ visitors.replacement_traverse(expr, {}, _to_stage_column) for expr in index.expressions ],
+                unique=index.unique,
+                **index.dialect_kwargs,
+            )
+                for index in live.indexes
+        ]
+
+
+    def create_stage_table(self, table, species_list = None) -> Table:
+        '''
+            Create an empty staging table for the given table, replacing any leftover from a previous run.
+
+            If a species list is provided, rows for all other species are copied over from the live table,
+            so they are preserved when the staging table is swapped in.
+        '''
+        live  = table.__table__
+        stage = self.get_stage_table(table)
+
+        logger.info(f'Creating staging table {stage.name}...')
+        stage.drop(bind=self.db.engine, checkfirst=True)
+        stage.create(bind=self.db.engine)
+
+        # Copy over rows for the species that aren't being reloaded
+        # IDs are copied as-is, so the rows keep the same keys (e.g. for keyset cursors & external references)
+        if species_list:
+            columns   = [ col.name for col in live.columns ]
+            statement = stage.insert().from_select(
+                columns,
+                select([ live.c[col] for col in columns ]).where( ~self.get_species_clause(live, species_list) ),
+            )
+            self.db.engine.execute(statement)
+            logger.info(f'Copied rows for species not in [{", ".join(species_list)}] from table {live.name} to {stage.name}')
+
+            # Move the staging table's sequence past the copied IDs, so rows loaded into it don't collide with them
+            if live._autoincrement_column is not None:
+                q   = self.db.engine.dialect.identifier_preparer.quote
+                col = live._autoincrement_column.name
+                seq = self.db.engine.execute(f"SELECT pg_get_serial_sequence('{q(stage.name)}', '{col}')").scalar()
+                if seq:
+                    self.db.engine.execute(
+                        f"SELECT setval('{seq}', COALESCE(MAX({q(col)}), 1), MAX({q(col)}) IS NOT NULL) FROM {q(stage.name)}"
+                    )
+
+        return stage
+
+
+    def swap_stage_table(self, table, stage: Table):
+        '''
+            Atomically replace the live table with its (fully loaded & indexed) staging table.
+
+            Renames the staging table and its indexes, primary key, and sequence to match the live table,
+            then restores any foreign keys that referenced the live table.
+        '''
+        live     = table.__table__
+        preparer = self.db.engine.dialect.identifier_preparer
+        q        = preparer.quote
+        start    = time.perf_counter()
+
+        logger.info(f'Swapping staging table {stage.name} into place as {live.name}...')
+
+        # Get the foreign keys to restore: those defined on this table, and those in other tables which reference it
+        foreign_keys = [
+            fk for t in self.db.metadata.tables.values() for fk in t.foreign_key_constraints
+                if t is live or fk.referred_table is live
+        ]
+
+        # Perform the swap in a single transaction, so readers only ever see a complete table
+        with self.db.engine.begin() as conn:
+
+            # Drop the live table, along with any foreign keys into it
+            conn.execute(f'DROP TABLE IF EXISTS {q(live.name)} CASCADE')
+
+            # Rename the staging table and its primary key
+            conn.execute(f'ALTER TABLE {q(stage.name)} RENAME TO {q(live.name)}')
+            conn.execute(f'ALTER TABLE {q(live.name)} RENAME CONSTRAINT {q(stage.name + "_pkey")} TO {q(live.name + "_pkey")}')
+
+            # Rename each index to match the name declared on the model
+            for index in live.indexes:
+                conn.execute(f'ALTER INDEX IF EXISTS {q(index.name + self.__STAGE_SUFFIX)} RENAME TO {q(index.name)}')
+
+            # Rename the sequence for the autoincrement column, if any, so the next staging table can use the original name
+            if live._autoincrement_column is not None:
+                col = live._autoincrement_column.name
+                seq = conn.execute(f"SELECT pg_get_serial_sequence('{q(live.name)}', '{col}')").scalar()
+                if seq:
+                    conn.execute(f'ALTER SEQUENCE {seq} RENAME TO {q(f"{live.name}_{col}_seq")}')
+
+            # Restore foreign keys without validating existing rows, so the swap doesn't have to scan the tables
+            restored = []
+            for fk in foreign_keys:
+                if not self.db.engine.dialect.has_table(conn, fk.table.name):
+                    continue
+                name = f'{fk.table.name}_{"_".join(fk.column_keys)}_fkey'
+                conn.execute(
+                    f'ALTER TABLE {q(fk.table.name)} ADD CONSTRAINT {q(name)} '
+                    f'FOREIGN KEY ({", ".join([ q(c) for c in fk.column_keys ])}) '
+                    f'REFERENCES {q(fk.referred_table.name)} ({", ".join([ q(e.column.name) for e in fk.elements ])}) NOT VALID'
+                )
+                restored.append((fk.table.name, name))
+
+        logger.info(f'Swapped staging table {stage.name} into place as {live.name} in {time.perf_counter() - start:.2f}s')
+
+        # Validate the restored foreign keys outside the swap transaction, since this doesn't block reads or writes
+        # If any rows no longer match a foreign key, fail the load rather than leave them pointing at nothing
+        for table_name, name in restored:
+            try:
+                self.db.engine.execute(f'ALTER TABLE {q(table_name)} VALIDATE CONSTRAINT {q(name)}')
+            except Exception as ex:
+                logger.error(f'Could not validate foreign key {name} on table {table_name}: {ex}')
+                raise
 
 
 
@@ -143,12 +878,11 @@ class ETLManager:
 
     def __drop_all(self, *tables):
         '''
-            Drop the given tables. If no tables are provided, drops all tables.
+            Drop the given tables. If no tables are provided, drops all tables except the ETL bookkeeping tables.
         '''
         if len(tables) == 0:
-            self.db.drop_all(app=self.app)
-        else:
-            self.db.metadata.drop_all(bind=self.db.engine, checkfirst=True, tables=[ t.__table__ for t in tables ])
+            tables = self.all_models()
+        self.db.metadata.drop_all(bind=self.db.engine, checkfirst=True, tables=[ t.__table__ for t in tables ])
 
     def __create_all(self, *tables):
         '''
@@ -159,11 +893,31 @@ class ETLManager:
         else:
             self.db.metadata.create_all(bind=self.db.engine, tables=[ t.__table__ for t in tables ])
 
+    @staticmethod
+    def get_species_clause(table, species_list):
+        '''
+            Get a clause matching the rows of a table that belong to any species in the given list.
+
+            If the table doesn't have a species column of its own (e.g. `phenotype_db`), matches rows
+            through a foreign key into a table that does.
+        '''
+        table = TableLoader.get_table(table)
+        if 'species_name' in table.c:
+            return table.c.species_name.in_(species_list)
+
+        for fk in table.foreign_keys:
+            referred = fk.column.table
+            if 'species_name' in referred.c:
+                return fk.parent.in_( select([ fk.column ]).where( referred.c.species_name.in_(species_list) ) )
+
+        raise ValueError(f'Cannot filter table {table.name} by species.')
+
+
     def __drop_species_rows(self, table, species):
         '''
             Drops all rows for the given species from the given table.
         '''
-        del_statement = table.__table__.delete().where(table.__table__.c.species_name == species)
+        del_statement = table.__table__.delete().where( self.get_species_clause(table, [species]) )
         self.db.engine.execute(del_statement)
 
 
@@ -179,6 +933,34 @@ class ETLManager:
                 species_list: List of species to clear the rows of. If `None`, clears *all* rows from the given tables.
         '''
 
+        # Resolve the full list of tables up front, so a full reload can be resumed like any other
+        if not len(tables):
+            tables = self.all_models()
+
+        # When restoring, make sure the snapshot can replace every table before any of them are cleared
+        self.check_snapshots(*tables, species_list=species_list)
+
+        # In shadow load mode, the live tables are replaced wholesale when loaded, so leave them in place for now
+        if self.shadow_load:
+            logger.info(f'Shadow load enabled: keeping { self.print_tables(*tables) } live until the staging tables are swapped in')
+            self.__create_all(*tables)
+            return
+
+        # When resuming, keep any tables with saved progress in place -- leftover rows are reconciled as each species is loaded
+        if self.resume and len(tables):
+            resumable = [ table for table in tables if self.has_checkpoints(table, species_list=species_list) ]
+            if len(resumable):
+                logger.info(f'Resuming: keeping { self.print_tables(*resumable) } in place')
+                tables = [ table for table in tables if table not in resumable ]
+                if not len(tables):
+                    return
+
+        # The cleared tables will need to be fully reloaded, so forget which source files they were loaded from,
+        # and any progress saved by a previous load
+        for table in tables:
+            self.__forget_checksums(table, species_list=species_list)
+            self.__forget_checkpoints(table, species_list=species_list)
+
         # If dropping all species, can perform bulk drop/create operations
         if species_list is None:
             logger.info(f'Dropping { self.print_tables(*tables) }...')
@@ -189,8 +971,6 @@ class ETLManager:
         # Otherwise, delete individual rows from tables
         else:
             logger.info(f'Dropping species [{", ".join(species_list)}] from { self.print_tables(*tables) }...')
-            if tables is None:
-                tables = self.all_tables()
 
             # Make sure all tables exist
             self.__create_all(*tables)
@@ -218,3 +998,33 @@ class ETLManager:
                 species_list: List of species to clear the rows of. If `None`, clears *all* rows from the given table.
         '''
         return self.clear_tables([table], species_list=species_list)
+
+
+
+#
+# Worker Processes
+#
+
+# The ETL manager that spawned the current worker process
+_worker_manager: ETLManager = None
+
+
+def _init_worker(manager: ETLManager):
+    '''
+        Initialize a forked worker process with the ETL manager that created it.
+    '''
+    global _worker_manager
+    _worker_manager = manager
+
+    # Give the worker its own app context, rather than relying on the one inherited from the parent
+    manager.app.app_context().push()
+
+
+def _load_species_worker(table_name: str, species_name: str) -> int:
+    '''
+        Load a single species into a single table from within a worker process.
+        Arguments are passed by name so they can be sent to the worker process.
+    '''
+    config = TABLE_CONFIG[table_name]
+    target = ETLManager.get_stage_table(config.table) if _worker_manager.shadow_load else None
+    return _worker_manager.load_species( config, Species.from_name(species_name), target=target )
@@ -65,6 +65,9 @@ def parse_homologene(species, homologene_fname: str):
   for k, v in species_set.items():
     species_set[k] = v.replace(species.homolog_prefix, '')
 
+  # Load all gene IDs for the species up front, to resolve gene names in memory rather than querying for each line
+  gene_id_lookup = WormbaseGeneSummary.get_gene_id_lookup(species.name)
+
   # Initialize counter for matching homologs
   count = 0
 
@@ -84,15 +87,14 @@ def parse_homologene(species, homologene_fname: str):
 
       # Try to resolve the wormbase WB ID if possible.
       gene_name = species_set[homolog_id]
-      gene_id = WormbaseGeneSummary.resolve_gene_id(gene_name)
-      ref = WormbaseGeneSummary.query.filter(WormbaseGeneSummary.gene_id == gene_id).first()
+      gene_id = gene_id_lookup.get(gene_name)
 
       # Progress update
       if idx % 10000 == 0:
         logger.info(f'Processed {idx} records yielding {count} inserts')
 
       # If gene matches, add it to the dataset
-      if ref:
+      if gene_id:
         count += 1
         yield {
           'gene_id':          gene_id,
@@ -0,0 +1,383 @@
+import io
+from typing import Iterable, Dict, List
+
+from caendr.services.logger import logger
+from caendr.utils.constants import DEFAULT_BATCH_SIZE
+from caendr.utils.data      import batch_generator
+
+
+
+#
+# Column batches
+#
+
+class ColumnBatch():
+  '''
+    A batch of parsed rows stored as parallel columns, mapping each column name to a list of values.
+
+    Parsers that already build whole columns (e.g. with pandas) can yield these instead of single rows,
+    so loaders that support it (see `CopyLoader`) can write the columns directly.
+    Iterating over a batch produces its rows as dicts, so any loader can still insert it.
+  '''
+
+  def __init__(self, columns: Dict[str, List]):
+    self.columns = columns
+
+
+  def __repr__(self):
+    return f'<{self.__class__.__name__} ({len(self)} rows)>'
+
+
+  def __len__(self):
+    return len(next(iter(self.columns.values()), []))
+
+
+  def __iter__(self):
+    keys = list(self.columns.keys())
+    for values in zip(*self.columns.values()):
+      yield dict(zip(keys, values))
+
+
+  def __getitem__(self, rows: slice) -> 'ColumnBatch':
+    return ColumnBatch({ key: values[rows] for key, values in self.columns.items() })
+
+
+
+def iter_batches(rows, batch_size: int = DEFAULT_BATCH_SIZE):
+  '''
+    Group a stream of parsed rows into batches to pass to `insert_batch`.
+
+    Single rows (dicts) are grouped into batches of up to `batch_size` rows, and `ColumnBatch` objects
+    are passed through as-is. The stream may mix both, e.g. if a table is parsed from several kinds of file.
+    As with `batch_generator`, each batch must be consumed before the next one is requested.
+  '''
+  rows = iter(rows)
+  item = next(rows, None)
+  while item is not None:
+
+    if isinstance(item, ColumnBatch):
+      yield item
+      item = next(rows, None)
+      continue
+
+    # Group the run of single rows starting here, up to the next column batch (if any)
+    following = []
+    def _run(first):
+      yield first
+      for row in rows:
+        if isinstance(row, ColumnBatch):
+          following.append(row)
+          return
+        yield row
+
+    yield from batch_generator(_run(item), batch_size)
+    item = following[0] if len(following) else next(rows, None)
+
+
+def split_rows(rows, offset: int):
+  '''
+    Split a stream of parsed rows (or `ColumnBatch` objects) after the first `offset` rows,
+    splitting a column batch in two if needed.
+
+    Returns two iterators, over the rows before and after the split. The first must be consumed before the second.
+  '''
+  rows      = iter(rows)
+  remainder = []
+
+  def _head():
+    count = 0
+    while count < offset:
+      item = next(rows, None)
+      if item is None:
+        return
+
+      # Single rows count as one row each; column batches are cut at the offset
+      size = len(item) if isinstance(item, ColumnBatch) else 1
+      if count + size > offset:
+        remainder.append(item[offset - count:])
+        item = item[:offset - count]
+      count += size
+      yield item
+
+  def _tail():
+    yield from remainder
+    yield from rows
+
+  return _head(), _tail()
+
+
+
+#
+# Base class definition
+#
+
+class TableLoader():
+  '''
+    Strategy for inserting a batch of parsed rows into a SQL table.
+
+    Subclasses should override `insert_batch`, and register themselves by setting the class variable `name`.
+  '''
+
+  # Identifier used to select this loader, e.g. from the environment
+  name = None
+
+
+  def __init__(self, db):
+    self.db = db
+
+
+  def __repr__(self):
+    return f'<{self.__class__.__name__}>'
+
+
+  def insert_batch(self, table, rows: Iterable[Dict]) -> int:
+    '''
+      Insert a batch of rows into the given table, and commit.
+      The table may be a model class, or a Core `Table` object (e.g. a staging table).
+      The rows may be any iterable of dicts, including a `ColumnBatch`.
+      Returns the number of rows inserted.
+    '''
+    raise NotImplementedError()
+
+
+  #
+  # Helpers
+  #
+
+  @staticmethod
+  def get_table(table):
+    '''
+      Get the Core `Table` object for a model class. Core tables are returned as-is.
+    '''
+    return getattr(table, '__table__', table)
+
+  @staticmethod
+  def get_load_columns(table, row: Dict) -> List:
+    '''
+      Get the list of SQL column objects to load for a table, given a sample row.
+
+      Skips the autoincrement column (if any) unless the row explicitly provides a value for it,
+      so the database can generate it.
+    '''
+    table = TableLoader.get_table(table)
+    autoincrement_column = table._autoincrement_column
+    return [
+      col for col in table.columns
+        if col is not autoincrement_column or col.name in row
+    ]
+
+  @staticmethod
+  def normalize_row(columns, row: Dict) -> Dict:
+    '''
+      Map a parsed row to a dict with exactly one value per column.
+      Parsed rows may contain extra keys, or be missing nullable fields.
+    '''
+    return { col.name: row.get(col.name) for col in columns }
+
+
+
+#
+# Loader definitions
+#
+
+class BulkInsertMappingsLoader(TableLoader):
+  '''
+    Insert rows using the SQLAlchemy ORM `bulk_insert_mappings` function.
+    Works with any database engine, but carries the most per-row overhead.
+  '''
+  name = 'orm'
+
+  def insert_batch(self, table, rows):
+
+    # Core tables aren't mapped to a model class, so have no ORM path
+    if not hasattr(table, '__mapper__'):
+      return ExecutemanyLoader(self.db).insert_batch(table, rows)
+
+    rows = list(rows)
+    self.db.session.bulk_insert_mappings(table, rows)
+    self.db.session.commit()
+    return len(rows)
+
+
+
+class ExecutemanyLoader(TableLoader):
+  '''
+    Insert rows with a single Core `INSERT` statement executed over the full batch (DBAPI `executemany`).
+    Skips the ORM unit-of-work bookkeeping, and works with any database engine.
+  '''
+  name = 'executemany'
+
+  def insert_batch(self, table, rows):
+    rows = iter(rows)
+
+    # Use the first row to determine which columns to populate
+    first = next(rows, None)
+    if first is None:
+      return 0
+    columns = self.get_load_columns(table, first)
+
+    # Normalize each row so they all share the same set of keys
+    values = [ self.normalize_row(columns, row) for row in (first, *rows) ]
+
+    with self.db.engine.begin() as conn:
+      conn.execute(self.get_table(table).insert(), values)
+    return len(values)
+
+
+
+class CopyLoader(TableLoader):
+  '''
+    Insert rows using PostgreSQL `COPY ... FROM STDIN`, streaming the batch through an in-memory CSV buffer.
+
+    This bypasses per-statement overhead entirely, and is by far the fastest option for large tables.
+    Only supported for PostgreSQL connections (via the psycopg2 or pg8000 drivers).
+  '''
+  name = 'copy'
+
+  # Marker for NULL values in the CSV buffer, to distinguish them from empty strings
+  # Only matched when unquoted, so string values (which are always quoted) can never be read as NULL
+  NULL_MARKER = '\\N'
+
+  SUPPORTED_DRIVERS = {'psycopg2', 'pg8000'}
+
+
+  @classmethod
+  def is_supported(cls, engine) -> bool:
+    return engine.dialect.name == 'postgresql' and engine.dialect.driver in cls.SUPPORTED_DRIVERS
+
+
+  @classmethod
+  def format_value(cls, val) -> str:
+    '''
+      Convert a Python value to its representation in a PostgreSQL CSV stream.
+
+      Strings are always quoted (doubling any embedded quotes), so delimiters, newlines, empty strings,
+      and the literal text of the NULL marker all load unchanged.
+    '''
+    if val is None:
+      return cls.NULL_MARKER
+    if isinstance(val, str):
+      return '"' + val.replace('"', '""') + '"'
+    if isinstance(val, bool):
+      return 't' if val else 'f'
+    return str(val)
+
+
+  def write_rows(self, table, rows: Iterable[Dict]):
+    '''
+      Write a batch of rows to an in-memory CSV buffer.
+      Returns the list of columns written, the buffer, and the number of rows.
+    '''
+    rows = iter(rows)
+
+    # Use the first row to determine which columns to populate
+    first = next(rows, None)
+    if first is None:
+      return [], None, 0
+    columns = self.get_load_columns(table, first)
+
+    buffer = io.StringIO()
+    count  = 0
+    for row in (first, *rows):
+      buffer.write(','.join([ self.format_value(row.get(col.name)) for col in columns ]))
+      buffer.write('\n')
+      count += 1
+    return columns, buffer, count
+
+
+  def write_columns(self, table, batch: ColumnBatch):
+    '''
+      Write a column batch to an in-memory CSV buffer, formatting each column as a whole
+      instead of building a dict for every row.
+      Returns the list of columns written, the buffer, and the number of rows.
+    '''
+    count = len(batch)
+    if not count:
+      return [], None, 0
+    columns = self.get_load_columns(table, batch.columns)
+
+    # Columns missing from the batch are NULL for every row
+    cells = [
+      list(map(self.format_value, batch.columns[col.name])) if col.name in batch.columns else [ self.NULL_MARKER ] * count
+        for col in columns
+    ]
+
+    buffer = io.StringIO()
+    for line in zip(*cells):
+      buffer.write(','.join(line))
+      buffer.write('\n')
+    return columns, buffer, count
+
+
+  def insert_batch(self, table, rows):
+
+    # Write the batch to an in-memory CSV buffer
+    if isinstance(rows, ColumnBatch):
+      columns, buffer, count = self.write_columns(table, rows)
+    else:
+      columns, buffer, count = self.write_rows(table, rows)
+    if not count:
+      return 0
+    buffer.seek(0)
+
+    # Construct the COPY statement, quoting identifiers since some column names are reserved words (e.g. "end")
+    preparer  = self.db.engine.dialect.identifier_preparer
+    statement = 'COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv, NULL \'{null}\')'.format(
+      table   = preparer.format_table(self.get_table(table)),
+      columns = ', '.join([ preparer.quote(col.name) for col in columns ]),
+      null    = self.NULL_MARKER,
+    )
+
+    # Stream the buffer into the table over a raw DBAPI connection
+    connection = self.db.engine.raw_connection()
+    try:
+      cursor = connection.cursor()
+      if self.db.engine.dialect.driver == 'psycopg2':
+        cursor.copy_expert(statement, buffer)
+      else:
+        cursor.execute(statement, stream=buffer)
+      connection.commit()
+    except:
+      connection.rollback()
+      raise
+    finally:
+      connection.close()
+
+    return count
+
+
+
+#
+# Loader selection
+#
+
+LOADERS = {
+  loader.name: loader for loader in [
+    BulkInsertMappingsLoader,
+    ExecutemanyLoader,
+    CopyLoader,
+  ]
+}
+
+DEFAULT_LOADER = CopyLoader.name
+
+
+def get_loader(db, name: str = None) -> TableLoader:
+  '''
+    Get a loader object by name. If no name is provided, uses the default loader.
+
+    If the COPY loader is requested for a database that does not support it (e.g. SQLite),
+    falls back to the executemany loader.
+  '''
+  name = name or DEFAULT_LOADER
+
+  try:
+    loader_class = LOADERS[name.lower()]
+  except KeyError:
+    raise ValueError(f'Unknown table loader "{name}". Options are: {", ".join(LOADERS.keys())}')
+
+  if loader_class is CopyLoader and not CopyLoader.is_supported(db.engine):
+    logger.warning(f'COPY loader is not supported for database dialect "{db.engine.dialect.name}". Falling back to executemany.')
+    loader_class = ExecutemanyLoader
+
+  return loader_class(db)
@@ -1,10 +1,65 @@
 import csv
 
+import numpy  as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
 from caendr.services.logger import logger
 
 from caendr.models.datastore  import Species
+from caendr.utils.constants   import DEFAULT_BATCH_SIZE
 from caendr.utils.local_files import LocalDatastoreFile
 
+from .loader import ColumnBatch
+
+
+# Number of leading columns in a bulk trait file that describe the trait, rather than holding strain values
+BULK_TRAIT_ID_COLUMNS = 3
+
+
+
+## Helper Functions ##
+
+def get_bulk_trait_name(row):
+  """
+    Generate the trait name for a row of a bulk trait file, joining 'transcript', 'WormBaseGeneID' and 'GeneName'.
+  """
+  return '_'.join(row[:BULK_TRAIT_ID_COLUMNS])
+
+
+def parse_trait_value(trait_value: str):
+  """
+    Convert a trait value from a TSV file to a float, so it's stored as a number.
+    Empty values are stored as NULL.
+  """
+  return float(trait_value) if trait_value != '' else None
+
+
+def read_bulk_trait_headers(file_path):
+  """
+    Read the header row of a bulk trait file: the trait description columns, followed by the strain names.
+  """
+  with open(file_path) as csv_file:
+    return next(csv.reader(csv_file, delimiter='\t'))
+
+
+def read_bulk_trait_ids(file_path):
+  """
+    Read the trait description columns ('transcript', 'WormBaseGeneID', 'GeneName') of each trait (row) in a bulk trait file,
+    skipping the header row. Only these leading columns are split out of each line, so the strain values are never parsed.
+  """
+  with open(file_path) as csv_file:
+    next(csv_file)
+    for line in csv_file:
+      line = line.rstrip('\r\n')
+
+      # Lines with quoted fields need the full CSV parser
+      if '"' in line:
+        yield next(csv.reader([ line ], delimiter='\t'))[:BULK_TRAIT_ID_COLUMNS]
+      else:
+        yield line.split('\t', BULK_TRAIT_ID_COLUMNS)[:BULK_TRAIT_ID_COLUMNS]
+
+
 
 
 def parse_phenotypedb_traits_data(species: Species, **files: LocalDatastoreFile):
@@ -60,55 +115,98 @@ def parse_phenotypedb_traits_data(species: Species, **files: LocalDatastoreFile)
           yield {
             'trait_name':   trait_name,
             'strain_name':  strain_name,
-            'trait_value':  trait_value
+            'trait_value':  parse_trait_value(trait_value)
           }
 
 
 
+def melt_bulk_trait_values(values: pd.DataFrame):
+  """
+    Melt a block of strain value columns from a bulk trait file, read with only 'NA' as a missing value.
+    Skips 'NA' values, and converts the rest to floats (or None, if empty) like `parse_trait_value`.
+
+    Returns the row (trait) & column (strain) index of each value kept, in row-major order, and the list of values.
+  """
+  is_numeric = np.array([ is_numeric_dtype(dtype) for dtype in values.dtypes ], dtype=bool)
+
+  # If every column holds only numbers & 'NA' (NaN), the values can be used as-is
+  if is_numeric.all():
+    numbers = values.to_numpy(dtype=float)
+    trait_idx, strain_idx = np.nonzero(~np.isnan(numbers))
+    return trait_idx, strain_idx, numbers[trait_idx, strain_idx].tolist()
+
+  trait_value = np.full(values.shape, None, dtype=object)
+  keep        = np.zeros(values.shape, dtype=bool)
+
+  # Numeric columns: keep every value but 'NA' (NaN)
+  # Storing into an object array converts numpy scalars to native Python values
+  if is_numeric.any():
+    numbers = values.iloc[:, is_numeric].to_numpy(dtype=float)
+    keep[:, is_numeric]        = ~np.isnan(numbers)
+    trait_value[:, is_numeric] = numbers
+
+  # Other columns (e.g. with empty values) are read as strings: keep every value but 'NA', converting each one to a float
+  strings   = values.iloc[:, ~is_numeric].to_numpy(dtype=object)
+  present   = pd.notna(strings)
+  has_value = present & (strings != '')
+  converted = np.full(strings.shape, None, dtype=object)
+  converted[has_value] = strings[has_value].astype(float)
+  keep[:, ~is_numeric]        = present
+  trait_value[:, ~is_numeric] = converted
+
+  trait_idx, strain_idx = np.nonzero(keep)
+  return trait_idx, strain_idx, trait_value[trait_idx, strain_idx].tolist()
+
+
+
 def parse_phenotypedb_bulk_trait_file(species: Species, **files: LocalDatastoreFile):
   """
       Parsing function for Zhang Gene Expression traits file. 
       The first 3 columns of the first row are expected to be ['transcript', 'WormBaseGeneID', 'GeneName']
       The rest of the column headers are the strain names.
       Each row represents trait value for corresponding strain.
+
+      The file is read in blocks of traits (rows), each of which is melted from wide to long format with whole-array
+      operations and yielded as a `ColumnBatch` of (trait, strain, value) rows. Blocks are sized to hold about one
+      batch of values, so memory use doesn't depend on the size of the file.
   """
 
   logger.info('Parsing extracted phenotype database bulk TSV file(s)')
 
-  # Loop through each line in each file, indexed
   for file_name, file_path in files.items():
-    with open(file_path) as csv_file:
-      for idx, row in enumerate( csv.reader(csv_file, delimiter='\t') ):
-
-        # First line is column names - don't interpret as data
-        if idx == 0:
-          logger.info(f'Column names in file "{file_name}" are: {", ".join(row)}')
-          column_header_map = { name: idx for idx, name in enumerate(row) }
-          continue
-
-        # Progress update
-        if idx % 1000000 == 0:
-          logger.debug(f"Processed {idx} lines")
-
-        # Generate trait_name joining 'transcript', 'WormBaseGeneID' and 'GeneName'
-        trait_name = '_'.join(row[:3])
-        for header, idx in column_header_map.items():
-
-          # Skip the first 3 columns, which are trait descriptions
-          if idx in (0, 1, 2):
-            continue
-
-          # Get trait value for each strain
-          strain_name = header
-          trait_value = row[column_header_map[header]]
 
-          # Skip if trait_value is 'NA'
-          if trait_value == 'NA':
-            continue
-
-          # Yield each trait measurement as a new row
-          yield {
-            'trait_name':   trait_name,
-            'strain_name':  strain_name,
-            'trait_value':  trait_value
-          }
\ No newline at end of file
+    # First line is column names - the strain names follow the trait description columns
+    headers      = read_bulk_trait_headers(file_path)
+    strain_names = np.array(headers[BULK_TRAIT_ID_COLUMNS:], dtype=object)
+    logger.info(f'Strain names in file "{file_name}" are: {", ".join(strain_names)}')
+    if not len(strain_names):
+      continue
+
+    # Only 'NA' is read as a missing value, so value columns holding only numbers & 'NA' are parsed as floats,
+    # and any other value column (e.g. with empty values) is kept as strings
+    reader = pd.read_csv(
+      file_path.__fspath__(), sep='\t', keep_default_na=False, na_values=['NA'], float_precision='round_trip',
+      dtype={ name: str for name in headers[:BULK_TRAIT_ID_COLUMNS] },
+      chunksize=max(DEFAULT_BATCH_SIZE // len(strain_names), 1),
+    )
+
+    idx = 0
+    for block in reader:
+
+      # Generate the trait name for each row in the block, restoring any 'NA' values in the description columns
+      ids         = block.iloc[:, :BULK_TRAIT_ID_COLUMNS].fillna('NA')
+      trait_names = ids.iloc[:, 0].str.cat([ ids.iloc[:, i] for i in range(1, BULK_TRAIT_ID_COLUMNS) ], sep='_').to_numpy(dtype=object)
+
+      # Melt the block, getting the position & value of each trait value to keep
+      values = block.iloc[:, BULK_TRAIT_ID_COLUMNS : BULK_TRAIT_ID_COLUMNS + len(strain_names)]
+      trait_idx, strain_idx, trait_value = melt_bulk_trait_values(values)
+
+      idx += len(block)
+      logger.debug(f"Processed {idx} traits")
+
+      if len(trait_idx):
+        yield ColumnBatch({
+          'trait_name':   trait_names[trait_idx].tolist(),
+          'strain_name':  strain_names[strain_idx].tolist(),
+          'trait_value':  trait_value,
+        })
@@ -0,0 +1,253 @@
+import datetime
+import json
+import os
+from typing import Dict, Iterable
+
+from caendr.services.logger import logger
+
+from caendr.models.error           import SnapshotNotFoundError
+from caendr.services.cloud.storage import download_blob_as_json, get_blob_list, join_path, upload_blob_from_file, upload_blob_from_string
+from caendr.utils.constants        import DEFAULT_BATCH_SIZE
+
+
+# NOTE: pyarrow is imported locally in the functions that need it, since this module is imported by the site
+#       (via the ETL table configs), but pyarrow is only installed in the db_operations module.
+
+
+# Path within the bucket to store all table snapshots
+SNAPSHOT_PATH_PREFIX = 'snapshots'
+
+# Name of each Parquet file within a partition
+SNAPSHOT_FILENAME = 'data.parquet'
+
+# Name of the manifest file for each species, listing its Parquet files & row count
+# Written after all the Parquet files are uploaded, so a snapshot without one is incomplete
+SNAPSHOT_MANIFEST_FILENAME = 'manifest.json'
+
+# Column to partition snapshots by, if a table has it (in addition to species)
+PARTITION_COLUMN = 'chrom'
+
+
+
+#
+# Paths
+#
+
+def get_snapshot_prefix(release: str, table, species_name: str = None) -> str:
+  '''
+    Get the path to a table's snapshot within the bucket, optionally narrowed to a single species.
+
+    Snapshots are partitioned Hive-style, e.g.:
+      snapshots/<release>/<table>/species_name=<species>/chrom=<chrom>/data.parquet
+  '''
+  return join_path(
+    SNAPSHOT_PATH_PREFIX, release, table.__tablename__, f'species_name={species_name}' if species_name else None
+  )
+
+
+
+#
+# Schema
+#
+
+def get_snapshot_columns(table):
+  '''
+    Get the list of columns to store in a table's snapshot.
+    The autoincrement column (if any) is generated by the database, so it's skipped.
+  '''
+  autoincrement_column = table.__table__._autoincrement_column
+  return [ col for col in table.__table__.columns if col is not autoincrement_column ]
+
+
+def get_snapshot_schema(table):
+  '''
+    Build a pyarrow schema for a table's snapshot, using the SQLAlchemy column types.
+  '''
+  import pyarrow as pa
+
+  types = {
+    int:               pa.int64(),
+    float:             pa.float64(),
+    bool:              pa.bool_(),
+    str:               pa.string(),
+    datetime.date:     pa.date32(),
+    datetime.datetime: pa.timestamp('us'),
+  }
+
+  def _get_type(col):
+    try:
+      return types.get(col.type.python_type, pa.string())
+    except NotImplementedError:
+      return pa.string()
+
+  return pa.schema([ (col.name, _get_type(col)) for col in get_snapshot_columns(table) ])
+
+
+def get_value_converter(col):
+  '''
+    Get a function to cast parsed values to the Python type of a column.
+    Parsers may produce e.g. numeric strings, which the database casts implicitly but Parquet does not.
+  '''
+  try:
+    python_type = col.type.python_type
+  except NotImplementedError:
+    python_type = None
+
+  if python_type in {int, float}:
+    return lambda v: v if v is None else python_type(v)
+  if python_type is datetime.date:
+    return lambda v: v.date() if isinstance(v, datetime.datetime) else v
+  return lambda v: v
+
+
+
+#
+# Writing
+#
+
+class TableSnapshotWriter():
+  '''
+    Write the rows loaded into a table for a single species to a Parquet snapshot, partitioned by chromosome
+    if the table has a chromosome column.
+
+    Rows are written to local files as they're received, and uploaded to the bucket on `close`.
+  '''
+
+  def __init__(self, table, species_name: str, release: str, bucket: str, local_directory: str):
+    self.table        = table
+    self.species_name = species_name
+    self.release      = release
+    self.bucket       = bucket
+
+    self._schema     = get_snapshot_schema(table)
+    self._converters = { col.name: get_value_converter(col) for col in get_snapshot_columns(table) }
+    self._partition  = PARTITION_COLUMN if PARTITION_COLUMN in self._converters else None
+    self._writers    = {}
+
+    # Number of rows written so far, to record in the manifest
+    self.num_rows = 0
+
+    self._local_directory = os.path.join(local_directory, get_snapshot_prefix(release, table, species_name))
+
+
+  def __repr__(self):
+    return f'<Snapshot of {self.table.__tablename__} for {self.species_name} ({self.release})>'
+
+
+  def _get_partition_path(self, partition_value) -> str:
+    if self._partition is None:
+      return ''
+    return f'{self._partition}={partition_value}'
+
+
+  def _get_writer(self, partition_path: str):
+    import pyarrow.parquet as pq
+
+    if partition_path not in self._writers:
+      local_path = os.path.join(self._local_directory, partition_path)
+      os.makedirs(local_path, exist_ok=True)
+      self._writers[partition_path] = pq.ParquetWriter(os.path.join(local_path, SNAPSHOT_FILENAME), self._schema)
+    return self._writers[partition_path]
+
+
+  def write(self, rows: Iterable[Dict]):
+    '''
+      Write a batch of rows to the snapshot.
+    '''
+    import pyarrow as pa
+
+    # Group the rows by partition, casting each value to its column's type
+    partitions = {}
+    for row in rows:
+      record = { name: convert(row.get(name)) for name, convert in self._converters.items() }
+      partitions.setdefault( self._get_partition_path(record.get(self._partition)), [] ).append(record)
+      self.num_rows += 1
+
+    # Write each group to the appropriate file
+    for partition_path, records in partitions.items():
+      self._get_writer(partition_path).write_table( pa.Table.from_pylist(records, schema=self._schema) )
+
+
+  def close(self, upload: bool = True):
+    '''
+      Close all open files, and optionally upload them to the bucket.
+    '''
+    for writer in self._writers.values():
+      writer.close()
+
+    if not upload:
+      return
+
+    prefix = get_snapshot_prefix(self.release, self.table, self.species_name)
+    for partition_path in self._writers.keys():
+      local_path = os.path.join(self._local_directory, partition_path, SNAPSHOT_FILENAME)
+      blob_name  = join_path(prefix, partition_path, SNAPSHOT_FILENAME)
+      upload_blob_from_file(self.bucket, local_path, blob_name)
+
+    # Mark the snapshot as complete
+    manifest = {
+      'table':        self.table.__tablename__,
+      'species_name': self.species_name,
+      'release':      self.release,
+      'num_rows':     self.num_rows,
+      'files':        [ join_path(partition_path, SNAPSHOT_FILENAME) for partition_path in self._writers.keys() ],
+    }
+    upload_blob_from_string(self.bucket, json.dumps(manifest, indent=2), join_path(prefix, SNAPSHOT_MANIFEST_FILENAME))
+
+    logger.info(f'Uploaded {len(self._writers)} snapshot file(s) for {self.species_name} to gs://{self.bucket}/{get_snapshot_prefix(self.release, self.table, self.species_name)}')
+
+
+
+#
+# Reading
+#
+
+def read_snapshot_manifest(table, species_name: str, release: str, bucket: str):
+  '''
+    Get the manifest of a table's snapshot for a single species, along with the blob for each file it lists.
+    Raises a SnapshotNotFoundError if the snapshot is missing or incomplete.
+  '''
+  prefix = get_snapshot_prefix(release, table, species_name)
+  blobs  = { blob.name: blob for blob in get_blob_list(bucket, prefix) }
+
+  # The manifest is only written once every file has been uploaded
+  manifest_blob = blobs.get( join_path(prefix, SNAPSHOT_MANIFEST_FILENAME) )
+  if manifest_blob is None:
+    raise SnapshotNotFoundError(table.__tablename__, species_name, release, f'no manifest found in gs://{bucket}/{prefix}')
+  manifest = download_blob_as_json(manifest_blob)
+
+  # Make sure every file in the manifest still exists
+  missing = [ f for f in manifest['files'] if join_path(prefix, f) not in blobs ]
+  if len(missing):
+    raise SnapshotNotFoundError(table.__tablename__, species_name, release, f'missing file(s) {", ".join(missing)} in gs://{bucket}/{prefix}')
+
+  return manifest, [ blobs[ join_path(prefix, f) ] for f in manifest['files'] ]
+
+
+def read_table_snapshot(table, species_name: str, release: str, bucket: str, local_directory: str, batch_size: int = DEFAULT_BATCH_SIZE):
+  '''
+    Read the rows of a table for a single species back from a Parquet snapshot, yielding each row as a dict.
+    Rows are read in batches, so memory usage doesn't depend on the size of the snapshot.
+
+    Raises a SnapshotNotFoundError if the snapshot is missing or incomplete, or doesn't contain the number of rows in its manifest.
+  '''
+  import pyarrow.parquet as pq
+
+  prefix = get_snapshot_prefix(release, table, species_name)
+  manifest, blobs = read_snapshot_manifest(table, species_name, release, bucket)
+
+  logger.info(f'Restoring {len(blobs)} snapshot file(s) ({manifest["num_rows"]} rows) for {species_name} from gs://{bucket}/{prefix}')
+  num_rows = 0
+  for blob in blobs:
+
+    # Download the file into the same relative location it was written from
+    local_path = os.path.join(local_directory, blob.name)
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    blob.download_to_filename(local_path)
+
+    for batch in pq.ParquetFile(local_path).iter_batches(batch_size=batch_size):
+      num_rows += batch.num_rows
+      yield from batch.to_pylist()
+
+  if num_rows != manifest['num_rows']:
+    raise SnapshotNotFoundError(table.__tablename__, species_name, release, f'expected {manifest["num_rows"]} rows, but found {num_rows}')
@@ -3,12 +3,22 @@ import csv
 import gzip
 import re
 
+import numpy  as np
+import pandas as pd
+
 from caendr.services.logger import logger
 from sqlalchemy.sql.expression import null
 
 from caendr.models.datastore  import Species
+from caendr.utils.constants   import DEFAULT_BATCH_SIZE
 from caendr.utils.local_files import LocalDatastoreFile
 
+from .loader import ColumnBatch
+
+
+# Consequence values that refer to another row's consequence by ID, e.g. '@123'
+TARGET_CONSEQUENCE_PATTERN = '^@[0-9]+$'
+
 
 
 def parse_strain_variant_annotation_data(species: Species, SVA_CSVGZ: LocalDatastoreFile):
@@ -64,7 +74,7 @@ def parse_strain_variant_annotation_data(species: Species, SVA_CSVGZ: LocalDatas
 
       target_consequence = None
       consequence = row.get('CONSEQUENCE')
-      alt_target = re.match('^@[0-9]*$', consequence)
+      alt_target = re.match(TARGET_CONSEQUENCE_PATTERN, consequence)
       if alt_target:
         target_consequence = int(consequence[1:])
         consequence = None
@@ -102,7 +112,7 @@ def parse_strain_variant_annotation_data(species: Species, SVA_CSVGZ: LocalDatas
       }
 
   # In Python, loop vars maintain their final value after the loop ends
-  print(f'Processed {idx} lines total for {species.name}')
+  logger.info(f'Processed {idx} lines total for {species.name}')
 
 
 def get_row(row, key, nullable=False, map=None):
@@ -127,3 +137,123 @@ def get_row(row, key, nullable=False, map=None):
     return map(val)
 
   return val
+
+
+
+def parse_strain_variant_annotation_data_chunked(species: Species, SVA_CSVGZ: LocalDatastoreFile, chunksize: int = DEFAULT_BATCH_SIZE):
+  """
+      Load strain variant annotation table data, reading the file in chunks of rows with pandas.
+
+      Produces the same rows as `parse_strain_variant_annotation_data`, but performs the NA -> NULL conversion,
+      the target consequence split, and the numeric casts as whole-column operations on each chunk.
+      Each chunk is yielded as a `ColumnBatch`, so the loader can write the columns without building a dict per row.
+  """
+  logger.info('Parsing extracted strain variant annotation TSV file (chunked)')
+
+  # Read every value as a raw string, so 'NA' & empty values are handled the same way as the row-based parser
+  reader = pd.read_csv(
+    SVA_CSVGZ.__fspath__(), sep='\t', compression='gzip', dtype=str, na_filter=False, chunksize=chunksize,
+
+    # If testing, finish early
+    nrows = 10 if os.getenv("USE_MOCK_DATA") else None,
+  )
+
+  # Track the line index of the first row in each chunk, skipping the header line
+  idx = 0
+  for chunk_num, chunk in enumerate(reader):
+    if chunk_num == 0:
+      logger.info(f'Column names in file "{SVA_CSVGZ}" are: {", ".join(chunk.columns)}')
+
+    n = len(chunk)
+    get_column = lambda key: chunk[key] if key in chunk else None
+
+    # Split alternate target references (e.g. '@123') out of the consequence column
+    consequence, target_consequence = split_target_consequence( get_column('CONSEQUENCE'), n )
+
+    # Map the chunk to columns of the output table
+    # Each column is converted to a list of native Python values
+    columns = {
+
+      # These two fields form the primary key, i.e. the combination of both must be unique within the table
+      'id':                 list(range(idx + 1, idx + n + 1)),
+      'species_name':       [ species.name ] * n,
+
+      'chrom':              get_column_list(chunk, 'CHROM', n),
+      'pos':                get_column_list(chunk, 'POS',   n, map=int),
+      'ref_seq':            get_column_list(chunk, 'REF',   n),
+      'alt_seq':            get_column_list(chunk, 'ALT',   n),
+      'consequence':        consequence,
+      'target_consequence': target_consequence,
+      'gene_id':            get_column_list(chunk, 'WORMBASE_ID', n, nullable=True),
+      'transcript':         get_column_list(chunk, 'TRANSCRIPT',  n),
+      'biotype':            get_column_list(chunk, 'BIOTYPE',     n),
+
+      # strand takes a single character in the SQL schema, and can be nullable. Convert R's NA to NULL
+      'strand':             get_column_list(chunk, 'STRAND', n, nullable=True),
+
+      'amino_acid_change':  get_column_list(chunk, 'AMINO_ACID_CHANGE', n),
+      'dna_change':         get_column_list(chunk, 'DNA_CHANGE',        n),
+      'strains':            get_column_list(chunk, 'Strains',           n),
+      'blosum':             get_column_list(chunk, 'BLOSUM',          n, nullable=True, map=int),
+      'grantham':           get_column_list(chunk, 'Grantham',        n, nullable=True, map=int),
+      'percent_protein':    get_column_list(chunk, 'Percent_Protein', n, nullable=True, map=float),
+      'gene':               get_column_list(chunk, 'GENE',           n),
+      'variant_impact':     get_column_list(chunk, 'VARIANT_IMPACT', n),
+      'divergent':          (get_column('DIVERGENT') == 'D').tolist() if 'DIVERGENT' in chunk else [ False ] * n,
+      'release':            get_column_list(chunk, 'RELEASE', n),
+    }
+
+    yield ColumnBatch(columns)
+
+    idx += n
+    logger.debug(f"Processed {idx} lines")
+
+  logger.info(f'Processed {idx} lines total for {species.name}')
+
+
+def get_column_list(chunk: pd.DataFrame, key, n, nullable=False, map=None):
+  '''
+    Get a column from a chunk of rows as a list of Python values. Vectorized equivalent of `get_row`.
+
+    Arguments:
+      chunk (DataFrame): The chunk of rows, with all values as strings.
+      key: The name of the column.
+      n (int): The number of rows in the chunk.
+      nullable (bool): Whether values in this column can be null ('NA'). Converts null values to None.
+      map (type): A type to cast all non-null values to.
+  '''
+
+  # Missing columns are null for every row
+  if key not in chunk:
+    return [ None ] * n
+  col = chunk[key]
+
+  # If no conversion needed, return the raw values
+  if not nullable and map is None:
+    return col.tolist()
+
+  # Cast the non-null values, and leave the rest as None
+  # Storing into an object array converts numpy scalars to native Python values
+  mask   = (col == 'NA').to_numpy() if nullable else np.zeros(n, dtype=bool)
+  result = np.full(n, None, dtype=object)
+  result[~mask] = col[~mask].astype(map) if map is not None else col[~mask]
+  return result.tolist()
+
+
+def split_target_consequence(consequence: pd.Series, n):
+  '''
+    Split alternate target references (e.g. '@123') out of a consequence column.
+    Returns the consequence and target consequence columns as lists.
+  '''
+  if consequence is None:
+    return [ None ] * n, [ None ] * n
+
+  is_target = consequence.str.match(TARGET_CONSEQUENCE_PATTERN).to_numpy()
+
+  target_consequence = np.full(n, None, dtype=object)
+  target_consequence[is_target] = consequence[is_target].str[1:].astype(int)
+
+  consequence = consequence.to_numpy(dtype=object, copy=True)
+  consequence[is_target] = None
+
+  return consequence.tolist(), target_consequence.tolist()
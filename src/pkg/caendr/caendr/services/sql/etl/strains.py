@@ -7,24 +7,32 @@ from caendr.utils.constants   import GOOGLE_SHEET_NULL_VALUES
 
 
 
-elevation_cache = {}
-
+# Local get_elevations import because this module is also used in the site
+# (to check required files for database operations), which doesn't need the elevation service or its API key.
+def fetch_elevations(records):
+  """
+    Look up the elevation of every record with a location, in as few requests as possible.
+    Returns a dict of elevations keyed by (latitude, longitude).
+  """
+  from caendr.services.elevation import get_elevations
+  return get_elevations([
+    (record['latitude'], record['longitude']) for record in records if record['latitude'] and record['longitude']
+  ])
 
-# Local get_elevation import because this module is now used in the site
-# (to check required files for database operations),
-# but DiskCache (imported by services.elevation) is not used in the site.
-# TODO: Fix, somehow... Do we even need DiskCache? We're already caching in this file
-def fetch_elevation(lat, lon):
-  from caendr.services.elevation import get_elevation
 
-  key = f'{lat}_{lon}'
-  elevation = elevation_cache.get(key, None)
-  if not elevation:
-    elevation = get_elevation(lat, lon)
-    if elevation:
-      elevation_cache[key] = elevation
-  
-  return elevation
+def normalize_strain_record(record):
+  """
+    Lowercase the keys of a strain record, convert NA values to None, and parse datetime values.
+  """
+  record = {k.lower(): v for k, v in record.items()}
+  for k, v in record.items():
+    # Set NA to None
+    if v in GOOGLE_SHEET_NULL_VALUES:
+      v = None
+      record[k] = v
+    if k in ['sampling_date'] and v:
+      record[k] = parser.parse(v)
+  return record
 
 
 def fetch_andersen_strains(species: Species, STRAINS: LocalGoogleSheet):
@@ -44,20 +52,16 @@ def fetch_andersen_strains(species: Species, STRAINS: LocalGoogleSheet):
   # Only take records with a release reported
   strain_records = list(filter(lambda x: x.get('release') not in GOOGLE_SHEET_NULL_VALUES, strain_records))
 
+  # Normalize every record before fetching elevations, so all locations can be looked up together
+  strain_records = [ normalize_strain_record(record) for record in strain_records ]
+  elevations = fetch_elevations(strain_records)
+
   for n, record in enumerate(strain_records):
-    record = {k.lower(): v for k, v in record.items()}
-    for k, v in record.items():
-      # Set NA to None
-      if v in GOOGLE_SHEET_NULL_VALUES:
-        v = None
-        record[k] = v
-      if k in ['sampling_date'] and v:
-        record[k] = parser.parse(v)
 
     if record['latitude'] and record['longitude']:
       # Round elevation
-      elevation = fetch_elevation(record['latitude'], record['longitude'])
-      if elevation:
+      elevation = elevations.get((record['latitude'], record['longitude']))
+      if elevation is not None:
         record['elevation'] = round(elevation)
     if n % 50 == 0:
       logger.debug(f"Loaded {n} strains")
@@ -90,3 +94,20 @@ def fetch_andersen_strains(species: Species, STRAINS: LocalGoogleSheet):
 
     # Yield the record to be appended to the db
     yield record
+
+
+def parse_strain_aliases(species: Species):
+  """
+    Build the alias records for each strain of a species from the strain table:
+    one for the strain's current name, and one for each of its previous names.
+
+    Reads the strain table, so expects it to have been loaded first.
+  """
+  from caendr.models.sql import Strain
+
+  query = Strain.query.with_entities( Strain.strain, Strain.previous_names ).filter( Strain.species_name == species.name )
+  for strain, previous_names in query:
+    yield { 'alias': strain, 'strain': strain, 'species_name': species.name, 'is_current': True }
+    for alias in Strain.split_previous_names(previous_names):
+      if alias != strain:
+        yield { 'alias': alias, 'strain': strain, 'species_name': species.name, 'is_current': False }
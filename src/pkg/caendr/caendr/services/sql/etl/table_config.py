@@ -1,17 +1,19 @@
-from typing import Dict, List
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 
 from caendr.utils.env              import get_env_var
 from caendr.services.cloud.secret  import get_secret
 from caendr.services.logger        import logger
 
 # Local imports
-from .strains                      import fetch_andersen_strains
+from .strains                      import fetch_andersen_strains, parse_strain_aliases
 from .wormbase                     import parse_gene_gtf, parse_gene_gff_summary
-from .strain_annotated_variants    import parse_strain_variant_annotation_data
+from .strain_annotated_variants    import parse_strain_variant_annotation_data, parse_strain_variant_annotation_data_chunked
 from .phenotype_db                 import parse_phenotypedb_traits_data, parse_phenotypedb_bulk_trait_file
 from .phenotype_metadata           import parse_phenotype_metadata
 
-from caendr.models.sql             import Strain, WormbaseGeneSummary, WormbaseGene, StrainAnnotatedVariant, PhenotypeDatabase, PhenotypeMetadata
+from caendr.models.sql             import Strain, StrainAlias, WormbaseGeneSummary, WormbaseGene, StrainAnnotatedVariant, PhenotypeDatabase, PhenotypeMetadata
 from caendr.models.datastore       import Species, TraitFile
 from caendr.services.cloud.storage import BlobURISchema
 from caendr.models.datastore       import Species
@@ -34,6 +36,12 @@ GENE_GTF_FILENAME = get_env_var('GENE_GTF_FILENAME',  as_template=True)
 GENE_IDS_FILENAME = get_env_var('GENE_IDS_FILENAME',  as_template=True)
 SVA_FILENAME      = get_env_var('SVA_CSVGZ_FILENAME', as_template=True)
 
+# Maximum number of source files to download at once
+DEFAULT_DOWNLOAD_WORKERS = 8
+
+# Parser for the strain annotated variants file: 'chunked' (vectorized, with pandas) or 'csv' (row by row)
+SVA_PARSER = get_env_var('SVA_PARSER', 'chunked')
+
 
 # Get list of Google Sheet IDs for each species
 # Expects secret names with prefix "ANDERSEN_LAB_STRAIN_SHEET_" and species ID in all caps
@@ -110,6 +118,58 @@ class TableConfig():
     return resources
 
 
+  def get_checksums(self, species_list, max_workers: int = DEFAULT_DOWNLOAD_WORKERS) -> Dict[str, Dict[str, Optional[str]]]:
+    '''
+      Get the current checksum of each source file this table uses for each of the given species, keyed by species name & resource ID.
+      Each checksum is a separate metadata request, so they're looked up several at a time, like the files in `prefetch`.
+    '''
+    resources = [
+      (species.name, template.resource_id, template.get_for_species(species))
+        for species in species_list for template in self.all_resources if template.has_for_species(species)
+    ]
+
+    checksums = { species.name: {} for species in species_list }
+    if not len(resources):
+      return checksums
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+      values = list(executor.map(lambda r: r[2].get_checksum(), resources))
+
+    for (species_name, resource_id, _), checksum in zip(resources, values):
+      checksums[species_name][resource_id] = checksum
+    return checksums
+
+
+  def prefetch(self, species_list, max_workers: int = DEFAULT_DOWNLOAD_WORKERS):
+    '''
+      Download all the source files this table uses for the given species up front, several at a time.
+      Files already downloaded are verified against the datastore, and only downloaded again if they've changed.
+    '''
+    resources = [
+      template.get_for_species(species)
+        for species in species_list for template in self.all_resources if template.has_for_species(species)
+    ]
+    if not len(resources):
+      return
+
+    def _prefetch(resource):
+      try:
+        return resource.prefetch()
+      except ForeignResourceMissingError as ex:
+        logger.error(f'Skipping {resource}: {ex}')
+        return 0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+      sizes = list(executor.map(_prefetch, resources))
+    elapsed = time.perf_counter() - start
+
+    # Report aggregate throughput
+    total_mb = sum(sizes) / (1 << 20)
+    rate     = total_mb / elapsed if elapsed > 0 else 0
+    logger.info(f'Prefetched {len([ s for s in sizes if s ])} of {len(resources)} files for table {self.table_name} ({total_mb:.1f} MB) in {elapsed:.2f}s ({rate:.1f} MB/s, {max_workers} at a time)')
+
+
   def parse_for_species(self, species):
     '''
       Apply all parsing functions in this config to their associated files,
@@ -132,6 +192,14 @@ StrainConfig = TableConfig(
   ),
 )
 
+# Derived from the strain table rather than a source file, so should be loaded (and synced) along with it
+StrainAliasConfig = TableConfig(
+  StrainAlias,
+  ParseConfig(
+    parse_strain_aliases,
+  ),
+)
+
 WormbaseGeneSummaryConfig = TableConfig(
   WormbaseGeneSummary,
   ParseConfig(
@@ -152,7 +220,7 @@ WormbaseGeneConfig = TableConfig(
 StrainAnnotatedVariantConfig = TableConfig(
   StrainAnnotatedVariant,
   ParseConfig(
-    parse_strain_variant_annotation_data,
+    parse_strain_variant_annotation_data if SVA_PARSER == 'csv' else parse_strain_variant_annotation_data_chunked,
     LocalDatastoreFileTemplate( 'SVA_CSVGZ', MODULE_DB_OPERATIONS_BUCKET_NAME, SVA_FILEPATH, SVA_FILENAME ),
   ),
 )
@@ -2,7 +2,6 @@ import csv
 import gzip
 import os
 
-from gtfparse import read_gtf_as_dataframe
 from caendr.services.logger import logger
 
 from caendr.api.gene import remove_prefix
@@ -14,6 +13,10 @@ from caendr.models.datastore  import Species
 from caendr.utils.local_files import LocalDatastoreFile
 
 
+# GTF attributes loaded into the wormbase_gene table
+# Like `gtfparse`, rows without one of these attributes get an empty string for it
+GTF_ATTRIBUTE_COLUMNS = [ 'gene_id', 'gene_biotype', 'transcript_id', 'transcript_biotype', 'exon_id', 'exon_number', 'protein_id' ]
+
 
 ## Helper Functions ##
 
@@ -33,6 +36,24 @@ def get_gene_ids(species: Species, GENE_IDS: LocalDatastoreFile):
   return { x[0]: remove_prefix(x[1], species.gene_prefix) for x in results }
 
 
+def parse_gtf_attributes(attributes: str):
+  """
+      Parse the attributes column of a GTF line into a dict, e.g.:
+        'gene_id "WBGene00010195"; exon_number "1";' --> { 'gene_id': 'WBGene00010195', 'exon_number': '1' }
+
+      Matches the attribute parsing in the `gtfparse` package, including joining the values of a repeated key with commas.
+  """
+  # Catch mistaken semicolons by replacing "xyz;" with "xyz"
+  attributes = attributes.replace(';\"', '\"').replace(';-', '-')
+
+  result = {}
+  for kv in attributes.split(';'):
+    if len(kv) > 2 and ' ' in kv:
+      key, value = kv.strip().split(' ', 2)[:2]
+      value = value.replace('"', '')
+      result[key] = f'{result[key]},{value}' if key in result else value
+  return result
+
 
 ## File Parsing Generator Functions ##
 
@@ -41,49 +62,75 @@ def parse_gene_gtf(species: Species, GENE_GTF: LocalDatastoreFile, GENE_IDS: Loc
       LOADS wormbase_gene
       This function fetches and parses the canonical geneset GTF
       and yields a dictionary for each row.
+
+      The file is streamed one line at a time, computing the derived fields for each row as it's read,
+      so memory usage doesn't depend on the size of the annotation.
   """
-  gene_gtf = read_gtf_as_dataframe(GENE_GTF.__fspath__())
   gene_ids = get_gene_ids(species, GENE_IDS)
 
-  # Rename seqname to chrom
-  gene_gtf = gene_gtf.rename({'seqname': 'chrom'}, axis='columns')
+  # Open the file, decompressing if necessary
+  gtf_fname = GENE_GTF.__fspath__()
+  if gtf_fname.endswith('gz') or gtf_fname.endswith('gzip'):
+    f = gzip.open(gtf_fname, 'rt')
+  else:
+    f = open(gtf_fname, 'r')
+
+  with f:
+    idx = 0
+    for line in f:
+
+      # Skip comments and blank lines
+      if not line.strip() or line.startswith('#'):
+        continue
 
-  # Add locus column
-  gene_gtf = gene_gtf.assign(locus=[gene_ids.get(x) for x in gene_gtf.gene_id])
+      # If testing, finish early
+      if os.getenv('USE_MOCK_DATA') and idx > 10:
+        logger.warn("USE_MOCK_DATA Early Return!!!")
+        return
 
-  # Convert chromosomes from roman numerals to integers
-  gene_gtf = gene_gtf.assign(chrom_num=[CHROM_NUMERIC[x] for x in gene_gtf.chrom])
+      # Progress update
+      if idx % 10000 == 0:
+        logger.info(f"Processed {idx} lines")
 
-  # Compute gene position and add as column
-  gene_gtf = gene_gtf.assign(pos=(((gene_gtf.end - gene_gtf.start)/2) + gene_gtf.start).map(int))
+      # Split the line into the standard GTF fields
+      chrom, source, feature, start, end, score, strand, frame, attributes = line.rstrip('\n').split('\t', 8)
+      start, end = int(start), int(end)
 
-  # Remove optional "Gene" prefix from gene IDs to match the wormbase_gene_summary table
-  gene_gtf.gene_id = gene_gtf.gene_id.apply(lambda x: remove_prefix(x, 'Gene:'))
+      # Compute gene position
+      pos = int(((end - start) / 2) + start)
 
-  # Convert empty markers to None
-  gene_gtf.frame = gene_gtf.frame.apply(lambda x: x if x != "." else None)
-  gene_gtf.exon_number = gene_gtf.exon_number.apply(lambda x: x if x != "" else None)
+      # Expand the attributes column into individual fields
+      row = { key: '' for key in GTF_ATTRIBUTE_COLUMNS }
+      row.update(parse_gtf_attributes(attributes))
 
-  # Compute whether gene is on arm or center
-  gene_gtf['arm_or_center'] = gene_gtf.apply(lambda row: arm_or_center(row['chrom'], row['pos']), axis=1)
+      row.update({
+        'chrom':         chrom,
+        'source':        source,
+        'feature':       feature,
+        'start':         start,
+        'end':           end,
+        'score':         float(score) if score != '.' else float('nan'),
+        'strand':        strand,
 
-  # Add column for species name
-  gene_gtf['species_name'] = species.name
+        # Convert empty markers to None
+        'frame':         frame if frame != '.' else None,
+        'exon_number':   row['exon_number'] if row['exon_number'] != '' else None,
 
-  # Loop through and yield all records
-  for idx, row in enumerate(gene_gtf.to_dict('records')):
+        # Add locus, and convert chromosomes from roman numerals to integers
+        'locus':         gene_ids.get(row['gene_id']),
+        'chrom_num':     CHROM_NUMERIC[chrom],
 
-    # If testing, finish early
-    if os.getenv('USE_MOCK_DATA') and idx > 10:
-      logger.warn("USE_MOCK_DATA Early Return!!!")
-      return
+        # Compute whether gene is on arm or center
+        'arm_or_center': arm_or_center(chrom, pos),
+        'species_name':  species.name,
+      })
 
-    # Progress update
-    if idx % 10000 == 0:
-      logger.info(f"Processed {idx} lines")
+      # Remove optional "Gene" prefix from gene IDs to match the wormbase_gene_summary table
+      row['gene_id'] = remove_prefix(row['gene_id'], 'Gene:')
 
-    # Yield the row
-    yield row
+      # Yield the row
+      yield row
+      idx += 1
 
   logger.debug(f"Processed {idx} lines total for {species.name}")
 
@@ -164,48 +211,48 @@ def parse_orthologs(species, orthologs_fname: str):
       LOADS (part of) homologs
       Fetches orthologs from WormBase, to be stored in the homolog table.
   """
-  csv_out = list(csv.reader(open(orthologs_fname, 'r'), delimiter='\t'))
+  # Load the set of all gene IDs for the species up front, to match genes in memory rather than querying for each line
+  gene_ids = WormbaseGeneSummary.get_gene_ids(species.name)
 
   # Initialize var to track matching ortholog genes
   count = 0
 
-  # Loop through each line in the file
+  # Loop through each line in the file, streaming rather than reading the whole file into memory
   # TODO: idx is the number of lines processed, which is not the same as the number of records (as claimed in logger statement).
   #       This likely doesn't matter, since it's not used in any actual data, but it's still technically not correct.
-  for idx, line in enumerate(csv_out):
-    size_of_line = len(line)
-
-    # Skip lines that don't specify an ortholog
-    if size_of_line < 2:
-      continue
-
-    # Update to next gene
-    elif size_of_line == 2:
-      wb_id, locus_name = line
-
-    # Parse ortholog
-    else:
-      ref = WormbaseGeneSummary.query.filter(WormbaseGeneSummary.gene_id == wb_id).first()
+  with open(orthologs_fname, 'r') as f:
+    for idx, line in enumerate(csv.reader(f, delimiter='\t')):
+      size_of_line = len(line)
 
-      # If testing, finish early
-      if os.getenv("USE_MOCK_DATA") and idx > 10:
-        logger.warn("USE_MOCK_DATA Early Return!!!")
-        return
+      # Skip lines that don't specify an ortholog
+      if size_of_line < 2:
+        continue
 
-      # Progress update
-      if idx % 10000 == 0:
-        logger.info(f'Processed {idx} records yielding {count} inserts')
-
-      # If gene matches, add it to the dataset
-      if ref:
-        count += 1
-        yield {
-          'gene_id':          wb_id,
-          'gene_name':        locus_name,
-          'homolog_species':  line[0],
-          'homolog_taxon_id': None,
-          'homolog_gene':     line[2],
-          'homolog_source':   line[3],
-          'is_ortholog':      line[0] == species.scientific_name,
-          'species_name':     species.name,
-        }
+      # Update to next gene
+      elif size_of_line == 2:
+        wb_id, locus_name = line
+
+      # Parse ortholog
+      else:
+        # If testing, finish early
+        if os.getenv("USE_MOCK_DATA") and idx > 10:
+          logger.warn("USE_MOCK_DATA Early Return!!!")
+          return
+
+        # Progress update
+        if idx % 10000 == 0:
+          logger.info(f'Processed {idx} records yielding {count} inserts')
+
+        # If gene matches, add it to the dataset
+        if wb_id in gene_ids:
+          count += 1
+          yield {
+            'gene_id':          wb_id,
+            'gene_name':        locus_name,
+            'homolog_species':  line[0],
+            'homolog_taxon_id': None,
+            'homolog_gene':     line[2],
+            'homolog_source':   line[3],
+            'is_ortholog':      line[0] == species.scientific_name,
+            'species_name':     species.name,
+          }
@@ -1,85 +1,403 @@
 from abc import ABC, abstractmethod
 import csv
-from typing import Callable, Optional, Union
+import hashlib
+import io
+import os
+from typing import Callable, List, Optional, Union
+
+import pandas as pd
 
 from caendr.models.error import DataFormatError
-from caendr.api.strain   import query_strains
-from caendr.api.isotype  import get_distinct_isotypes
+from caendr.api.strain   import StrainNameRegistry
 from caendr.utils.data   import join_commas_and
+from caendr.utils.env    import get_env_var
+
+
+
+# Maximum number of distinct values to track for each column of an uploaded file
+MAX_TRACKED_VALUES = 1000
+
+# Maximum number of problems to list in the error message when validating a file as whole columns
+MAX_REPORTED_ERRORS = 100
+
+# Largest file (in bytes) to validate as whole columns by default
+# Larger files are validated line by line, so their memory use doesn't grow with the file size
+VALIDATE_VECTORIZED_MAX_BYTES = get_env_var('VALIDATE_VECTORIZED_MAX_BYTES', 32 * 1024 * 1024, var_type=int)
+
+
+
+#
+# File Summary
+#
+
+class ColumnSummary():
+  '''
+    Running summary of the values in one column of an uploaded file.
+
+    Distinct values are only tracked up to MAX_TRACKED_VALUES, so memory use doesn't depend on the size of the file.
+    If a column has more than that, `has_more_values` will be set and `unique_values` will be incomplete.
+  '''
+
+  def __init__(self, header: str):
+    self.header      = header
+    self.num_values  = 0
+    self.num_blank   = 0
+    self.first_value = None
+    self.last_value  = None
+
+    self.unique_values   = set()
+    self.has_more_values = False
+
 
+  def __repr__(self):
+    return f'<Column "{self.header}" ({self.num_values} values, {self.num_unique}{"+" if self.has_more_values else ""} unique)>'
 
 
-def validate_file(local_path_or_file, validators, delimiter='\t', unique_rows=False):
+  @property
+  def num_unique(self) -> int:
+    '''
+      The number of distinct values in the column. If `has_more_values` is set, this is a lower bound.
+    '''
+    return len(self.unique_values)
+
+
+  @classmethod
+  def from_values(cls, header: str, values: pd.Series) -> 'ColumnSummary':
+    '''
+      Summarize a full column of values at once.
+    '''
+    summary = cls(header)
+    summary.num_values = len(values)
+    summary.num_blank  = int( (values == '').sum() )
+    if len(values):
+      summary.first_value = values.iloc[0]
+      summary.last_value  = values.iloc[-1]
+
+    unique_values = values.unique()
+    summary.unique_values   = set( unique_values[:MAX_TRACKED_VALUES] )
+    summary.has_more_values = len(unique_values) > MAX_TRACKED_VALUES
+    return summary
+
+
+  def add(self, value: str):
+    self.num_values += 1
+    if value == '':
+      self.num_blank += 1
+    if self.first_value is None:
+      self.first_value = value
+    self.last_value = value
+
+    if value not in self.unique_values:
+      if len(self.unique_values) < MAX_TRACKED_VALUES:
+        self.unique_values.add(value)
+      else:
+        self.has_more_values = True
+
+
+
+class FileSummary():
+  '''
+    Summary of an uploaded file, collected by `validate_file` in the same pass used to validate it.
+
+    Fields:
+      - headers:   The header row.
+      - columns:   A ColumnSummary for each column, in order.
+      - num_rows:  The number of data rows (not including the header).
+      - num_bytes: The size of the file in bytes.
+      - hash:      The full sha1 hash of the file's contents, matching `get_file_hash`.
+  '''
+
+  def __init__(self, headers: List[str], columns: List[ColumnSummary], num_rows: int, num_bytes: int, hash: str):
+    self.headers   = headers
+    self.columns   = columns
+    self.num_rows  = num_rows
+    self.num_bytes = num_bytes
+    self.hash      = hash
+
+
+  def __repr__(self):
+    return f'<File summary ({self.num_rows} rows, {len(self.columns)} columns, {self.num_bytes} bytes)>'
+
+
+  def get_hash(self, length=10) -> str:
+    '''
+      Get the first `length` characters of the file hash, like `get_file_hash`.
+    '''
+    return self.hash[0:length]
+
+
+
+class HashingReader(io.RawIOBase):
+  '''
+    Wrap a binary file object to compute the sha1 hash and size of all bytes read from it.
+  '''
+
+  def __init__(self, raw):
+    self._raw      = raw
+    self.hasher    = hashlib.sha1()
+    self.num_bytes = 0
+
+  def readable(self):
+    return True
+
+  def readinto(self, buffer):
+    num_read = self._raw.readinto(buffer)
+    if num_read:
+      self.hasher.update( memoryview(buffer)[:num_read] )
+      self.num_bytes += num_read
+    return num_read
+
+
+
+#
+# File Validation
+#
+
+def get_row_digest(csv_row: List[str]) -> bytes:
+  '''
+    Get a short digest identifying the contents of a row, for detecting duplicate rows without storing the full rows.
+  '''
+  return hashlib.blake2b( '\t'.join(csv_row).encode('utf-8'), digest_size=16 ).digest()
+
+
+def validate_file(local_path_or_file, validators, delimiter='\t', unique_rows=False, vectorized=None) -> FileSummary:
+  '''
+    Validate an uploaded file, reading it exactly once.
+
+    Each column is checked by the corresponding validator, and the file is hashed and summarized along the way,
+    so callers don't need to read the file again.
+
+    By default, lines are validated one at a time, and a DataFormatError is raised as soon as a problem is found.
+    If `vectorized` is set, the data are loaded into columns and each validator checks its whole column at once,
+    which is much faster for large files. In this mode, every problem in the file is collected and raised together:
+    the error has the same message as the one that would have been raised first, with all the others in its `errors`
+    field (and listed in its full message body).
+
+    If `vectorized` is not given, it is chosen by file size: files up to `VALIDATE_VECTORIZED_MAX_BYTES` are loaded
+    into columns, and larger files are streamed line by line so memory use stays bounded.
+
+    Returns:
+      A FileSummary object.
+  '''
+
+  # Only load the whole file into memory if it's small enough
+  if vectorized is None:
+    vectorized = os.path.getsize(local_path_or_file) <= VALIDATE_VECTORIZED_MAX_BYTES
+
+  # Read the file in binary, hashing the raw bytes as they're decoded
+  with open(local_path_or_file, 'rb') as raw:
+    reader = HashingReader(raw)
+    f = io.TextIOWrapper(io.BufferedReader(reader), encoding='utf-8-sig')
+    csv_reader = csv.reader(f, delimiter=delimiter)
 
+    # Validate the header line, then the rest of the file
+    csv_headings = read_headers(csv_reader, validators)
+    if vectorized:
+      columns, num_rows = validate_columns(csv_reader, validators, csv_headings, unique_rows=unique_rows)
+    else:
+      columns, num_rows = validate_lines(csv_reader, validators, csv_headings, unique_rows=unique_rows)
+
+    # Make sure any trailing bytes the CSV reader didn't need have been hashed
+    f.read()
+
+  return FileSummary(csv_headings, columns, num_rows, reader.num_bytes, reader.hasher.hexdigest())
+
+
+def read_headers(csv_reader, validators) -> List[str]:
+  '''
+    Read the header line from a CSV reader, and check it against the column validators.
+  '''
+  num_cols = len(validators)
+
+  # Get the header line, throwing an empty file error if not found
+  try:
+    csv_headings  = next(csv_reader)
+  except StopIteration:
+    raise DataFormatError('The file is empty. Please edit the file to include your data.')
+
+  # Check that first line has correct number of columns
+  if len(csv_headings) != num_cols:
+    raise DataFormatError(f'The file contains an incorrect number of columns. Please edit the file to ensure it contains { num_cols } columns.', 1)
+
+  # Check first line for column headers
+  invalid_headers = []
+  for col, (validator, header) in enumerate(zip(validators, csv_headings)):
+    if not validator.read_header(header):
+      invalid_headers.append(col)
+
+  # If one header was incorrect, flag it
+  if len(invalid_headers) == 1:
+    col = invalid_headers[0]
+    raise DataFormatError(f'The file contains an incorrect column header. Column #{ col + 1 } should be { validators[col].expected_header }.', 1)
+
+  # If multiple headers were incorrect, flag all of them at once
+  elif len(invalid_headers) > 1:
+    cs = join_commas_and([ f'#{c + 1}' for c in invalid_headers ])
+    hs = join_commas_and([ c.expected_header for c in validators ])
+    raise DataFormatError(f'The file contains incorrect headers in columns { cs }. The full set of headers should be: { hs }.', 1)
+
+  return csv_headings
+
+
+def validate_lines(csv_reader, validators, csv_headings, unique_rows=False):
+  '''
+    Validate the data lines from a CSV reader one at a time, raising an error as soon as a problem is found.
+    Returns a ColumnSummary for each column, and the number of data lines.
+  '''
   num_cols = len(validators)
   rows = {}
 
-  # Read first line from tsv
-  with open(local_path_or_file, 'r', encoding='utf-8-sig') as f:
-    csv_reader = csv.reader(f, delimiter=delimiter)
+  columns = [ ColumnSummary(header) for header in csv_headings ]
 
-    # Get the header line, throwing an empty file error if not found
-    try:
-      csv_headings  = next(csv_reader)
-    except StopIteration:
-      raise DataFormatError('The file is empty. Please edit the file to include your data.')
+  # Loop through all remaining lines in the file
+  num_rows = 0
+  for line, csv_row in enumerate(csv_reader, start=2):
+
+    # Check for empty lines
+    if ''.join(csv_row).strip() == '':
+      raise DataFormatError(f'Rows cannot be blank. Please check line #{ line } to ensure valid data have been entered.', line)
 
-    # Check that first line has correct number of columns
-    if len(csv_headings) != num_cols:
-      raise DataFormatError(f'The file contains an incorrect number of columns. Please edit the file to ensure it contains { num_cols } columns.', 1)
+    # Check that line has the correct number of columns
+    if len(csv_row) != num_cols:
+      raise DataFormatError(f'File contains incorrect number of columns. Please edit the file to ensure it contains { num_cols } columns.', line)
+
+    # If desired, check that this row is unique
+    if unique_rows:
+      digest = get_row_digest(csv_row)
+      prev_line = rows.get(digest)
+      if prev_line is not None:
+        raise DataFormatError(f'Line #{ line } is a duplicate of line #{ prev_line }. Please ensure that each row contains unique values.')
+      else:
+        rows[digest] = line
 
-    # Check first line for column headers
-    invalid_headers = []
-    for col, (validator, header) in enumerate(zip(validators, csv_headings)):
-      if not validator.read_header(header):
-        invalid_headers.append(col)
+    # Check that all columns have valid data
+    for validator, column, value in zip(validators, columns, csv_row):
+      value = value.strip()
+      validator.read_line( value, line )
+      column.add( value )
 
-    # If one header was incorrect, flag it
-    if len(invalid_headers) == 1:
-      col = invalid_headers[0]
-      raise DataFormatError(f'The file contains an incorrect column header. Column #{ col + 1 } should be { validators[col].expected_header }.', 1)
+    # Track the number of lines of data parsed properly
+    num_rows += 1
 
-    # If multiple headers were incorrect, flag all of them at once
-    elif len(invalid_headers) > 1:
-      cs = join_commas_and([ f'#{c + 1}' for c in invalid_headers ])
-      hs = join_commas_and([ c.expected_header for c in validators ])
-      raise DataFormatError(f'The file contains incorrect headers in columns { cs }. The full set of headers should be: { hs }.', 1)
+  # Check that the loop ran at least once (i.e. is not just headers)
+  if not num_rows:
+    raise DataFormatError('The file is empty. Please edit the file to include your data.')
 
-    # Loop through all remaining lines in the file
-    has_data = False
-    for line, csv_row in enumerate(csv_reader, start=2):
+  # Run each validator's "finish" function at the end, in case any of the "read_line" validators were accumulating values
+  for validator in validators:
+    validator.finish()
 
-      # Check for empty lines
-      if ''.join(csv_row).strip() == '':
-        raise DataFormatError(f'Rows cannot be blank. Please check line #{ line } to ensure valid data have been entered.', line)
+  return columns, num_rows
 
-      # Check that line has the correct number of columns
-      if len(csv_row) != num_cols:
-        raise DataFormatError(f'File contains incorrect number of columns. Please edit the file to ensure it contains { num_cols } columns.', line)
 
-      # If desired, check that this row is unique
-      if unique_rows:
-        as_string = '\t'.join(csv_row)
-        prev_line = rows.get(as_string)
-        if prev_line is not None:
-          raise DataFormatError(f'Line #{ line } is a duplicate of line #{ prev_line }. Please ensure that each row contains unique values.')
-        else:
-          rows[as_string] = line
+def validate_columns(csv_reader, validators, csv_headings, unique_rows=False):
+  '''
+    Validate the data lines from a CSV reader as whole columns, collecting every problem in the file.
+    Returns a ColumnSummary for each column, and the number of data lines.
+
+    Raises a single DataFormatError containing all problems found, ordered so the first is the same error
+    `validate_lines` would have raised.
+  '''
+  num_cols = len(validators)
+  # Problems found in specific lines, stored with a key to sort them in the order the line-by-line validation would find them
+  line_errors = []
+
+  # Check the shape of each line, keeping the ones with the right number of columns (indexed by line number) to be validated as columns
+  data, lines = [], []
+  for line, csv_row in enumerate(csv_reader, start=2):
+    if len(csv_row) == num_cols:
+      data.append(csv_row)
+      lines.append(line)
+
+    # Check for empty lines
+    elif ''.join(csv_row).strip() == '':
+      line_errors.append(( (line, 0), DataFormatError(f'Rows cannot be blank. Please check line #{ line } to ensure valid data have been entered.', line) ))
+
+    # Check that line has the correct number of columns
+    else:
+      line_errors.append(( (line, 0), DataFormatError(f'File contains incorrect number of columns. Please edit the file to ensure it contains { num_cols } columns.', line) ))
+
+  # Load the data into a table of strings, then encode each column as a categorical of its distinct values,
+  # so checks only need to look at each distinct value once
+  # The codes of the raw values are kept to check for duplicate rows, since these compare the values before stripping
+  frame = pd.DataFrame(data, index=lines, columns=range(num_cols), dtype=object)
+  raw_codes, values = zip(*[ factorize_column(frame[col]) for col in range(num_cols) ])
+  raw_codes = pd.DataFrame(dict(enumerate(raw_codes)), index=frame.index)
+  values    = list(values)
+
+  # Check for empty lines with the right number of (blank) columns, and remove them from the table
+  blank = pd.concat([ v == '' for v in values ], axis=1).all(axis=1)
+  if blank.any():
+    for line in raw_codes.index[blank]:
+      line_errors.append(( (line, 0), DataFormatError(f'Rows cannot be blank. Please check line #{ line } to ensure valid data have been entered.', line) ))
+    raw_codes = raw_codes[~blank]
+    values    = [ v[~blank] for v in values ]
+
+  # Check that the file had at least one line (i.e. is not just headers)
+  if not len(raw_codes) and not len(line_errors):
+    raise DataFormatError('The file is empty. Please edit the file to include your data.')
+
+  # If desired, check that each row is unique, pointing each duplicate to the first line with the same values
+  if unique_rows and len(raw_codes):
+    duplicates = raw_codes.duplicated(keep='first')
+    if duplicates.any():
+      first_lines = raw_codes.index.to_series().groupby([ raw_codes[col] for col in raw_codes.columns ], sort=False).transform('first')
+      for line, prev_line in first_lines[duplicates].items():
+        line_errors.append(( (line, 1), DataFormatError(f'Line #{ line } is a duplicate of line #{ prev_line }. Please ensure that each row contains unique values.') ))
+
+  # Check all columns have valid data
+  for col, validator in enumerate(validators):
+    for ex in validator.read_column( values[col] ):
+      line_errors.append(( (ex.line, 2 + col), ex ))
+
+  # Run each validator's "finish" function, collecting any problems found from the full column
+  errors = [ ex for _, ex in sorted(line_errors, key=lambda e: e[0]) ]
+  for validator in validators:
+    errors += validator.finish_all()
+
+  if len(errors):
+    raise combine_errors(errors)
+
+  columns = [ ColumnSummary.from_values(header, column) for header, column in zip(csv_headings, values) ]
+  return columns, len(raw_codes)
+
+
+def factorize_column(values: pd.Series):
+  '''
+    Encode a column of strings as integer codes, one for each distinct value.
+
+    Returns the codes of the raw values, and the values with surrounding whitespace stripped as a categorical Series.
+    Stripping is only applied once to each distinct value, rather than to every line.
+  '''
+  codes, uniques = pd.factorize(values)
+  stripped_codes, stripped = pd.factorize( pd.Index(uniques, dtype=object).str.strip() )
+  return codes, pd.Series( pd.Categorical.from_codes(stripped_codes[codes], categories=stripped), index=values.index )
+
 
-      # Check that all columns have valid data
-      for validator, value in zip(validators, csv_row):
-        validator.read_line( value.strip(), line )
+def combine_errors(errors: List[DataFormatError]) -> DataFormatError:
+  '''
+    Combine a list of problems into a single error, using the message of the first one.
+    The full message body lists all problems (up to MAX_REPORTED_ERRORS).
+  '''
+  first = errors[0]
+  if len(errors) == 1:
+    return first
 
-      # Track that we parsed at least one line of data properly
-      has_data = True
+  # Describe each problem on its own line
+  def describe(ex):
+    msg = ex.msg if ex.line is None else f'Line #{ ex.line }: { ex.msg }'
+    return msg if ex.full_msg_body is None else f'{ msg } ({ ex.full_msg_body })'
 
-    # Check that the loop ran at least once (i.e. is not just headers)
-    if not has_data:
-      raise DataFormatError('The file is empty. Please edit the file to include your data.')
+  body = [ describe(ex) for ex in errors[:MAX_REPORTED_ERRORS] ]
+  if len(errors) > MAX_REPORTED_ERRORS:
+    body.append(f'...and { len(errors) - MAX_REPORTED_ERRORS } more.')
 
-    # Run each validator's "finish" function at the end, in case any of the "read_line" validators were accumulating values
-    for validator in validators:
-      validator.finish()
+  return DataFormatError(
+    first.msg, first.line,
+    full_msg_link=f'View all { len(errors) } problems found in the file.',
+    full_msg_body='\n'.join(body),
+    errors=errors,
+  )
 
 
 
@@ -157,12 +475,38 @@ class ColumnValidator(ABC):
     '''
     pass
 
+  def read_column(self, values: pd.Series) -> List[DataFormatError]:
+    '''
+      Validate a full column of values at once, indexed by line number.
+      Returns a list of errors for individual lines, and can record errors to return in `finish_all()`.
+
+      By default, runs `read_line` on each value. Subclasses should override this with whole-column operations.
+    '''
+    errors = []
+    for line, value in values.items():
+      try:
+        self.read_line(value, line)
+      except DataFormatError as ex:
+        errors.append(ex)
+    return errors
+
   def finish(self):
     '''
       Called at the end of the file.
     '''
     pass
 
+  def finish_all(self) -> List[DataFormatError]:
+    '''
+      Called at the end of the file when validating whole columns.
+      Returns a list of all errors found, instead of raising the first.
+    '''
+    try:
+      self.finish()
+    except DataFormatError as ex:
+      return [ex]
+    return []
+
 
 
 #
@@ -201,6 +545,23 @@ class NumberValidator(ColumnValidator):
       if not (self.accept_na and value == 'NA'):
         raise DataFormatError(f'Column { self.header } is not a valid { self.data_type }. Please edit { self.header } to ensure only { self.data_type } values are included.', line)
 
+  def read_column(self, values):
+
+    # Only need to check each distinct value once
+    uniques = pd.Series( values.unique(), dtype=object )
+    parsed  = pd.to_numeric(uniques, errors='coerce')
+
+    # Find the values that can't be parsed by the fast, vectorized checks
+    # This may include some valid values (e.g. 'NA'), so these are checked again one at a time
+    if self.accept_float:
+      unparsed = uniques[ parsed.isna() ]
+    elif parsed.dtype.kind in 'iu':
+      unparsed = uniques[ [] ]
+    else:
+      unparsed = uniques[ ~uniques.str.fullmatch(r'[+-]?\d+').astype(bool) ]
+
+    return super().read_column( values[ values.isin(unparsed) ] )
+
 
 
 #
@@ -222,19 +583,14 @@ class StrainValidator(ColumnValidator):
     self._force_unique      = force_unique
     self._force_unique_msgs = force_unique_msgs
 
-    # Get the list of all valid strain names for this species
-    # Pull from strain names & isotype names, to allow for isotypes with no strain of the same name
-    self._valid_names_species = {
-      *query_strains(all_strain_names=True, species=species.name),
-      *get_distinct_isotypes(species=species.name),
-    }
+    # Get the set of all valid strain names for this species
+    # Includes strain names & isotype names, to allow for isotypes with no strain of the same name
+    registry = StrainNameRegistry.get()
+    self._valid_names_species = registry.get_names(species.name)
 
-    # Get the list of all valid strain names for all species
+    # Get the set of all valid strain names for all species
     # Used to provide more informative error messages
-    self._valid_names_all = {
-      *query_strains(all_strain_names=True),
-      *get_distinct_isotypes(),
-    }
+    self._valid_names_all = registry.get_names()
 
     # Dict to track the first line each strain occurs on
     # Used to ensure strains are unique, if applicable
@@ -297,35 +653,53 @@ class StrainValidator(ColumnValidator):
       )
 
 
-  # Validator function run at the end of the file
-  def finish(self):
+  # Checks run at the end of the file, in order
+  # Each raises an error if any lines matched its condition
+  def _finish_checks(self):
 
     # Wrong species #
-    self.check_strain_list(self._problems['wrong_species'], {
+    yield lambda: self.check_strain_list(self._problems['wrong_species'], {
       'single':  lambda x: f'The strain { x } is not a valid strain for { self.species.short_name } in our current dataset. Please enter a valid { self.species.short_name } strain.',
       'few':     lambda x: f'The strains { x } are not valid strains for { self.species.short_name } in our current dataset. Please enter valid { self.species.short_name } strains.',
       'default': lambda x: f'Multiple strains are not valid for { self.species.short_name } in our current dataset.',
     })
 
     # Blank lines #
-    if len(self._problems['blank_line']) > 0:
-      line_str = join_commas_and([ p['line'] for p in self._problems['blank_line'] ])
-      raise DataFormatError(f'Strain values cannot be blank. Please check line(s) { line_str } to ensure valid strains have been entered.')
+    def check_blank_lines():
+      if len(self._problems['blank_line']) > 0:
+        line_str = join_commas_and([ p['line'] for p in self._problems['blank_line'] ])
+        raise DataFormatError(f'Strain values cannot be blank. Please check line(s) { line_str } to ensure valid strains have been entered.')
+    yield check_blank_lines
 
     # Unknown strains #
-    self.check_strain_list(self._problems['unknown_strain'], {
+    yield lambda: self.check_strain_list(self._problems['unknown_strain'], {
       'single':  lambda x: f'The strain { x } is not a valid strain name in our current dataset. Please enter valid strain names.',
       'few':     lambda x: f'The strains { x } are not valid strain names in our current dataset. Please enter valid strain names.',
       'default': lambda x: f'Multiple strains are not valid in our current dataset.',
     })
 
     # Duplicate strains #
-    self.check_strain_list(self._problems['duplicates'], self._force_unique_msgs or {
+    yield lambda: self.check_strain_list(self._problems['duplicates'], self._force_unique_msgs or {
       'single':  lambda x: f'Multiple lines contain duplicate values for the strain { x }. Please ensure that only one unique value exists per strain.',
       'default': lambda x: f'Multiple lines contain duplicate values for the same strain. Please ensure that only one unique value exists per strain.',
     })
 
 
+  # Validator function run at the end of the file
+  def finish(self):
+    for check in self._finish_checks():
+      check()
+
+  def finish_all(self):
+    errors = []
+    for check in self._finish_checks():
+      try:
+        check()
+      except DataFormatError as ex:
+        errors.append(ex)
+    return errors
+
+
   # Validator function run on each individual line
   # Keeps track of all errors, which are then run at the end by func_final
   def read_line(self, value, line):
@@ -349,6 +723,29 @@ class StrainValidator(ColumnValidator):
         self._strain_line_numbers[value] = line
 
 
+  # Validator function run on the full column at once
+  # Records the same problems as `read_line`, but checks strain membership for the whole column
+  def read_column(self, values):
+    blank      = values == ''
+    in_species = values.isin(list(self._valid_names_species))
+    in_all     = values.isin(list(self._valid_names_all))
+
+    def record(problem, matches):
+      self._problems[problem] += [ {'value': value, 'line': line} for line, value in values[matches].items() ]
+
+    record('blank_line',     blank)
+    record('wrong_species',  ~blank & ~in_species & in_all)
+    record('unknown_strain', ~blank & ~in_all)
+
+    # If desired, keep track of list of strains and record any duplicates
+    if self._force_unique:
+      duplicates = values.duplicated(keep='first') | values.isin(list(self._strain_line_numbers))
+      record('duplicates', duplicates)
+      self._strain_line_numbers.update( (value, line) for line, value in values[~duplicates].items() )
+
+    return []
+
+
 
 #
 # Traits
@@ -378,3 +775,15 @@ class TraitValidator(ColumnValidator):
     # If the trait name has been set, ensure this line matches it
     elif value != self._trait_name:
       raise DataFormatError(f'The data contain multiple unique trait name values. Only one trait name may be tested per file.', line)
+
+
+  def read_column(self, values):
+
+    # If no trait name has been set, use the first value
+    if self._trait_name is None and len(values):
+      self._trait_name = values.iloc[0]
+
+    return [
+      DataFormatError('The data contain multiple unique trait name values. Only one trait name may be tested per file.', line)
+        for line in values.index[ values != self._trait_name ]
+    ]
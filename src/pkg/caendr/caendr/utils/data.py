@@ -1,5 +1,10 @@
+import csv
+import io
+import json
 import yaml
 import hashlib
+import tempfile
+import zlib
 import uuid
 import string
 import numpy  as np
@@ -84,6 +89,41 @@ def convert_query_to_data_table(query, columns):
   )
 
 
+def stream_rows_as_column_json(rows, columns, fill_value=None, chunk_size=2**16):
+  """
+    Convert an iterable of row tuples into a column-oriented JSON object (`{ column: [ values ] }`),
+    yielding the output in chunks of text. Yields an empty object if there are no rows.
+
+    Each column is spooled to a temporary file as the rows are read, so memory usage stays constant
+    no matter how many rows there are. Missing values are replaced with `fill_value`.
+  """
+  files = [ tempfile.TemporaryFile(mode='w+') for _ in columns ]
+  try:
+
+    # Append each value to the file for its column
+    sep = ''
+    for row in rows:
+      for f, val in zip(files, row):
+        f.write(sep + json.dumps(fill_value if val is None else val))
+      sep = ','
+
+    if not sep:
+      yield '{}'
+      return
+
+    # Write out each column in turn
+    for i, (col, f) in enumerate(zip(columns, files)):
+      yield ('{' if i == 0 else ',') + json.dumps(col) + ':['
+      f.seek(0)
+      yield from iter(lambda: f.read(chunk_size), '')
+      yield ']'
+    yield '}'
+
+  finally:
+    for f in files:
+      f.close()
+
+
 def convert_data_to_download_file(data, columns, file_ext='csv'):
 
   # Interpret the desired output file format
@@ -95,6 +135,43 @@ def convert_data_to_download_file(data, columns, file_ext='csv'):
   return pd.DataFrame(data, columns=columns).to_csv(index=False, sep=format_params['sep'])
 
 
+def stream_rows_as_download_file(rows, columns, file_ext='csv', compress=False, chunk_size=2**16):
+  """
+    Convert an iterable of row tuples into a CSV/TSV file with a header row, yielding the output in chunks of bytes.
+    If `compress` is set, the output is gzipped as it's written.
+
+    Rows are written to a small buffer which is flushed every `chunk_size` characters,
+    so memory usage stays constant no matter how many rows there are.
+  """
+
+  # Interpret the desired output file format
+  format_params = get_file_format(file_ext)
+  if format_params is None:
+    raise ValueError(f'Cannot convert data to file format "{file_ext}".')
+
+  # Use the gzip container format (wbits=31), so the output can be opened with standard tools
+  compressor = zlib.compressobj(wbits=31) if compress else None
+  def flush(buffer, final=False):
+    data = buffer.getvalue().encode()
+    buffer.seek(0)
+    buffer.truncate()
+    if compressor is None:
+      return data
+    return compressor.compress(data) + (compressor.flush() if final else b'')
+
+  buffer = io.StringIO()
+  writer = csv.writer(buffer, delimiter=format_params['sep'], lineterminator='\n')
+  writer.writerow(columns)
+  for row in rows:
+    writer.writerow(row)
+    if buffer.tell() >= chunk_size:
+      chunk = flush(buffer)
+      if chunk:
+        yield chunk
+
+  yield flush(buffer, final=True)
+
+
 def get_file_format(file_ext, valid_formats=None):
 
   # Screen out invalid formats
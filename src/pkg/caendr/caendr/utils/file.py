@@ -1,3 +1,4 @@
+import base64
 import gzip
 import os
 import hashlib
@@ -30,6 +31,29 @@ def get_file_hash(path_or_file: os.PathLike, length=10):
   return hasher.hexdigest()[0:length]
 
 
+def get_file_checksum(path_or_file: os.PathLike, algorithm: str = 'md5') -> str:
+  '''
+    Generates the checksum of a file's contents, base64-encoded to match the hashes in Google Cloud Storage blob metadata.
+    Supports 'md5' and 'crc32c' (the latter requires the `google-crc32c` package, installed with `google-cloud-storage`).
+  '''
+  BLOCKSIZE = 1 << 20
+  if algorithm == 'md5':
+    hasher = hashlib.md5()
+  elif algorithm == 'crc32c':
+    import google_crc32c
+    hasher = google_crc32c.Checksum()
+  else:
+    raise ValueError(f'Unsupported checksum algorithm "{algorithm}"')
+
+  with open(path_or_file, 'rb') as afile:
+    buf = afile.read(BLOCKSIZE)
+    while len(buf) > 0:
+      hasher.update(buf)
+      buf = afile.read(BLOCKSIZE)
+
+  return base64.b64encode(hasher.digest()).decode('utf-8')
+
+
 def download_file(url: str, fname: str):
   '''
     download_file [Downloads a file as a stream to minimize resources]
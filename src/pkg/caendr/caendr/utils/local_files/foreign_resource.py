@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from typing import Optional
 
 from caendr.models.datastore import Species
 
@@ -41,6 +42,22 @@ class ForeignResource(ABC):
     '''
     pass
 
+  def prefetch(self) -> int:
+    '''
+      Make the resource available locally ahead of time, so it doesn't have to be fetched when it's used.
+      Returns the number of bytes downloaded.
+
+      By default, does nothing -- resources that aren't files (e.g. sheets) are fetched when they're used.
+    '''
+    return 0
+
+  def get_checksum(self) -> Optional[str]:
+    '''
+      Get a string identifying the current contents of the resource, without fetching it.
+      Returns `None` if the resource can't be checksummed, in which case it should always be treated as changed.
+    '''
+    return None
+
 
 
 class ForeignResourceTemplate(ABC):
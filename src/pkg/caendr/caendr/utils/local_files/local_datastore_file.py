@@ -1,5 +1,6 @@
 import os
 import pathlib
+from typing import Optional
 
 from caendr.services.logger        import logger
 
@@ -7,9 +8,9 @@ from .foreign_resource             import ForeignResource, ForeignResourceTempla
 
 from caendr.models.datastore       import Species, FileRecordEntity
 from caendr.models.error           import NotFoundError, ForeignResourceMissingError, ForeignResourceUndefinedError
-from caendr.services.cloud.storage import BlobURISchema, generate_blob_uri, download_blob_to_file, join_path, check_blob_exists
+from caendr.services.cloud.storage import BlobURISchema, generate_blob_uri, download_blob_to_file, join_path, check_blob_exists, get_blob
 from caendr.utils.tokens           import TokenizedString
-from caendr.utils.file             import get_zipped_file_ext
+from caendr.utils.file             import get_file_checksum, get_zipped_file_ext
 
 
 
@@ -167,6 +168,63 @@ class LocalDatastoreFile(os.PathLike, ForeignResource):
     return self.__fspath__()
 
 
+  def matches_blob(self, blob) -> bool:
+    '''
+      Check whether the local copy of the file has the same contents as the given blob, using the blob's MD5 hash.
+      Composite objects don't have an MD5 hash, so fall back to the CRC32C checksum for those.
+    '''
+    if not self.exists_local():
+      return False
+    try:
+      if blob.md5_hash:
+        return get_file_checksum(self.get_local_filepath(), 'md5') == blob.md5_hash
+      if blob.crc32c:
+        return get_file_checksum(self.get_local_filepath(), 'crc32c') == blob.crc32c
+    except ImportError:
+      pass
+    return False
+
+
+  def prefetch(self) -> int:
+    '''
+      Download the file ahead of time, unless an up-to-date copy is already cached locally.
+      Unlike `fetch`, a cached copy is verified against the checksum in the datastore, and replaced if it doesn't match.
+
+      Returns the number of bytes downloaded (zero if the cached copy was used).
+
+      Raises:
+        - `ForeignResourceMissingError`: The file does not exist in the datastore.
+    '''
+    blob = get_blob(self._bucket, *self._path)
+    if blob is None:
+      raise ForeignResourceMissingError(self)
+
+    # Skip the download if the cached file is up to date
+    if self.matches_blob(blob):
+      logger.info(f'Verified cached datastore file [{self.resource_id}]:\n\t{ self.__print_locations() }')
+      return 0
+
+    # Download to a temporary file, so an interrupted download is never mistaken for a cached copy
+    os.makedirs(self._local_path, exist_ok=True)
+    local_path = self.get_local_filepath()
+    blob.download_to_filename(local_path + '.part')
+    os.replace(local_path + '.part', local_path)
+
+    logger.info(f'Prefetched datastore file [{self.resource_id}] ({blob.size} bytes):\n\t{ self.__print_locations() }')
+    return blob.size or 0
+
+
+  def get_checksum(self) -> Optional[str]:
+    '''
+      Get the MD5 hash of the file in the datastore, from the blob metadata.
+      Composite objects don't have an MD5 hash, so fall back to the blob generation for those.
+    '''
+    blob = get_blob(self._bucket, *self._path)
+    if blob is None:
+      return None
+    return blob.md5_hash or f'generation:{blob.generation}'
+
+
 
 class LocalDatastoreFileTemplate(ForeignResourceTemplate):
   '''
@@ -0,0 +1,177 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from google.api_core.exceptions import PreconditionFailed
+
+# The API key is read from the environment when set, rather than from Secret Manager
+os.environ.setdefault('ELEVATION_API_KEY', 'test-key')
+
+from caendr.services import elevation
+from caendr.services.elevation import ElevationCache, get_elevations, request_elevations
+
+
+
+#
+# Stub Elevation Server
+#
+# Answers elevation requests like the Google Elevation API, with each location's elevation set to lat + lon.
+# Requests for locations with a latitude of 99 fail, to test error handling.
+#
+
+class StubElevationHandler(BaseHTTPRequestHandler):
+
+  def do_GET(self):
+    params = parse_qs(urlparse(self.path).query)
+    self.server.requests.append(params)
+
+    locations = [ tuple(map(float, loc.split(','))) for loc in params['locations'][0].split('|') ]
+    if any( lat == 99 for lat, _ in locations ):
+      self.send_response(400)
+      body = { 'status': 'INVALID_REQUEST', 'results': [] }
+    else:
+      self.send_response(200)
+      body = {
+        'status':  'OK',
+        'results': [ { 'elevation': lat + lon, 'location': { 'lat': lat, 'lng': lon } } for lat, lon in locations ],
+      }
+
+    self.send_header('Content-Type', 'application/json')
+    self.end_headers()
+    self.wfile.write(json.dumps(body).encode('utf-8'))
+
+  def log_message(self, *args):
+    pass
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+  server = HTTPServer(('127.0.0.1', 0), StubElevationHandler)
+  server.requests = []
+  thread = threading.Thread(target=server.serve_forever, daemon=True)
+  thread.start()
+
+  monkeypatch.setattr(elevation, 'ELEVATION_API_URL', f'http://127.0.0.1:{server.server_port}/elevation/json')
+  yield server
+
+  server.shutdown()
+  server.server_close()
+
+
+
+#
+# Stub Bucket
+#
+# Stands in for the cache file in GCS, tracking the generation of the blob like GCS does
+#
+
+class StubBlob():
+  def __init__(self, data, generation):
+    self.data       = data
+    self.generation = generation
+
+
+class StubBucket():
+  def __init__(self):
+    self.blob    = None
+    self.uploads = 0
+
+    # Optional hook to run just before each upload, e.g. to simulate another process saving first
+    self.before_upload = None
+
+  def get_blob(self, bucket_name, blob_name):
+    return self.blob
+
+  def upload(self, bucket_name, data, blob_name, if_generation_match=None):
+    if self.before_upload is not None:
+      self.before_upload()
+    generation = self.blob.generation if self.blob is not None else 0
+    if if_generation_match is not None and if_generation_match != generation:
+      raise PreconditionFailed('generation mismatch')
+    self.blob     = StubBlob(data, generation + 1)
+    self.uploads += 1
+
+
+@pytest.fixture
+def stub_bucket(monkeypatch):
+  bucket = StubBucket()
+  monkeypatch.setattr(elevation, 'get_blob',                bucket.get_blob)
+  monkeypatch.setattr(elevation, 'download_blob_as_json',   lambda blob: json.loads(blob.data))
+  monkeypatch.setattr(elevation, 'upload_blob_from_string', bucket.upload)
+  return bucket
+
+
+
+#
+# Tests
+#
+
+def test_request_elevations(stub_server):
+  assert request_elevations([ (1.0, 2.0), (3.5, -1.5) ]) == [ 3.0, 2.0 ]
+
+  [ params ] = stub_server.requests
+  assert params['locations'] == [ '1.0,2.0|3.5,-1.5' ]
+  assert params['key']       == [ 'test-key' ]
+
+
+def test_request_elevations_error(stub_server):
+  assert request_elevations([ (1.0, 2.0), (99.0, 0.0) ]) == [ None, None ]
+
+
+def test_get_elevations_batches(stub_server, monkeypatch):
+  monkeypatch.setattr(elevation, 'MAX_LOCATIONS_PER_REQUEST', 2)
+  cache = ElevationCache(bucket=None)
+  cache.set(0.0, 0.0, 10.0)
+
+  # Duplicate & cached locations aren't requested
+  locations = [ (0.0, 0.0), (1.0, 1.0), (2.0, 2.0), (1.0, 1.0), (3.0, 3.0), (4.0, 4.0), (5.0, 5.0) ]
+  result = get_elevations(locations, cache=cache)
+
+  assert result == { (0.0, 0.0): 10.0, (1.0, 1.0): 2.0, (2.0, 2.0): 4.0, (3.0, 3.0): 6.0, (4.0, 4.0): 8.0, (5.0, 5.0): 10.0 }
+  assert [ len(params['locations'][0].split('|')) for params in stub_server.requests ] == [ 2, 2, 1 ]
+
+  # Fetched locations are cached
+  stub_server.requests.clear()
+  assert get_elevations([ (1.0, 1.0), (5.0, 5.0) ], cache=cache) == { (1.0, 1.0): 2.0, (5.0, 5.0): 10.0 }
+  assert stub_server.requests == []
+
+
+def test_get_elevations_failed_batch(stub_server, monkeypatch):
+  monkeypatch.setattr(elevation, 'MAX_LOCATIONS_PER_REQUEST', 2)
+  cache = ElevationCache(bucket=None)
+
+  # Only the batch with the failed location is missing, and it isn't cached
+  result = get_elevations([ (1.0, 1.0), (99.0, 0.0), (2.0, 2.0) ], cache=cache)
+  assert result == { (1.0, 1.0): None, (99.0, 0.0): None, (2.0, 2.0): 4.0 }
+  assert cache.get(1.0, 1.0) is None
+
+
+def test_cache_save(stub_bucket):
+  cache = ElevationCache(bucket='bucket')
+  cache.set(1.0, 1.0, 2.0)
+  cache.save()
+
+  assert json.loads(stub_bucket.blob.data) == { '1.0,1.0': 2.0 }
+  assert ElevationCache(bucket='bucket').get(1.0, 1.0) == 2.0
+
+
+def test_cache_save_concurrent(stub_bucket):
+  stub_bucket.blob = StubBlob(json.dumps({ '0.0,0.0': 0.0 }), 1)
+  cache_1 = ElevationCache(bucket='bucket')
+  cache_2 = ElevationCache(bucket='bucket')
+  cache_1.set(1.0, 1.0, 2.0)
+  cache_2.set(2.0, 2.0, 4.0)
+
+  # The other process saves between this process downloading the cache and uploading it
+  def save_other():
+    stub_bucket.before_upload = None
+    cache_2.save()
+  stub_bucket.before_upload = save_other
+  cache_1.save()
+
+  # The first upload attempt is rejected, and the retry keeps both processes' entries
+  assert json.loads(stub_bucket.blob.data) == { '0.0,0.0': 0.0, '1.0,1.0': 2.0, '2.0,2.0': 4.0 }
+  assert stub_bucket.uploads == 2
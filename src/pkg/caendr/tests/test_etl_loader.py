@@ -0,0 +1,194 @@
+from types import SimpleNamespace
+
+from sqlalchemy import Boolean, Column, Float, Integer, MetaData, String, Table
+from sqlalchemy.dialects.postgresql import psycopg2 as pg_psycopg2, pg8000 as pg_pg8000
+
+from caendr.services.sql.etl.loader import ColumnBatch, CopyLoader, ExecutemanyLoader, get_loader, iter_batches, split_rows
+
+
+
+#
+# Stub Database
+#
+# Stands in for the database server: records each COPY statement and the CSV payload streamed to it
+#
+
+class StubCursor():
+  def __init__(self, connection):
+    self.connection = connection
+
+  def copy_expert(self, statement, buffer):
+    self.connection.copies.append((statement, buffer.read()))
+
+  def execute(self, statement, stream=None):
+    self.connection.copies.append((statement, stream.read()))
+
+
+class StubConnection():
+  def __init__(self):
+    self.copies    = []
+    self.committed = False
+    self.closed    = False
+
+  def cursor(self):
+    return StubCursor(self)
+
+  def commit(self):
+    self.committed = True
+
+  def rollback(self):
+    pass
+
+  def close(self):
+    self.closed = True
+
+
+class StubEngine():
+  def __init__(self, dialect):
+    self.dialect    = dialect
+    self.connection = StubConnection()
+
+  def raw_connection(self):
+    return self.connection
+
+
+def stub_db(dialect=None):
+  return SimpleNamespace(engine=StubEngine(dialect or pg_psycopg2.dialect()))
+
+
+table = Table(
+  'variant', MetaData(),
+  Column('id',    Integer, primary_key=True),
+  Column('chrom', String),
+  Column('end',   Integer),
+  Column('note',  String),
+  Column('score', Float),
+  Column('flag',  Boolean),
+)
+
+
+
+#
+# Tests
+#
+
+def test_copy_statement():
+  db = stub_db()
+  CopyLoader(db).insert_batch(table, [{ 'chrom': 'I', 'end': 1, 'note': 'a', 'score': 1.5, 'flag': True }])
+
+  # The autoincrement ID is left to the database, and reserved words are quoted
+  [(statement, _)] = db.engine.connection.copies
+  assert statement == 'COPY variant (chrom, "end", note, score, flag) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')'
+  assert db.engine.connection.committed
+  assert db.engine.connection.closed
+
+
+def test_copy_payload():
+  db = stub_db()
+  count = CopyLoader(db).insert_batch(table, [
+    { 'chrom': 'I',  'end': 100,  'note': 'plain',           'score': 0.25, 'flag': True  },
+    { 'chrom': 'II', 'end': None, 'note': None,              'score': None, 'flag': False },
+    { 'chrom': 'V',  'end': 3,    'note': '',                'score': -2.0                },
+    { 'chrom': 'X',  'end': 4,    'note': 'a, "quoted"\nrow', 'score': 1e-10, 'flag': None },
+    { 'chrom': 'X',  'end': 5,    'note': '\\N',              'score': 1,    'flag': True, 'extra': 'ignored' },
+  ])
+
+  assert count == 5
+  [(_, payload)] = db.engine.connection.copies
+  assert payload == (
+    '"I",100,"plain",0.25,t\n'
+    '"II",\\N,\\N,\\N,f\n'
+    '"V",3,"",-2.0,\\N\n'
+    '"X",4,"a, ""quoted""\nrow",1e-10,\\N\n'
+    '"X",5,"\\N",1,t\n'
+  )
+
+
+def test_copy_column_batch():
+  rows = [
+    { 'chrom': 'I',  'end': 100,  'note': 'a, "quoted"\nrow', 'score': 0.25, 'flag': True  },
+    { 'chrom': 'II', 'end': None, 'note': '\\N',              'score': None, 'flag': False },
+    { 'chrom': 'V',  'end': 3,    'note': '',                 'score': -2.0, 'flag': None  },
+  ]
+  batch = ColumnBatch({ key: [ row[key] for row in rows ] for key in [ 'chrom', 'end', 'note', 'score', 'flag' ] })
+
+  # Writing the columns directly produces the same statement & payload as writing the rows
+  db_rows, db_cols = stub_db(), stub_db()
+  assert CopyLoader(db_rows).insert_batch(table, rows)  == 3
+  assert CopyLoader(db_cols).insert_batch(table, batch) == 3
+  assert db_cols.engine.connection.copies == db_rows.engine.connection.copies
+
+  # Columns missing from the batch are NULL
+  db = stub_db()
+  CopyLoader(db).insert_batch(table, ColumnBatch({ 'chrom': [ 'I', 'X' ], 'end': [ 1, 2 ] }))
+  [(statement, payload)] = db.engine.connection.copies
+  assert statement.startswith('COPY variant (chrom, "end", note, score, flag) ')
+  assert payload == '"I",1,\\N,\\N,\\N\n"X",2,\\N,\\N,\\N\n'
+
+
+def test_copy_explicit_id():
+  db = stub_db()
+  CopyLoader(db).insert_batch(table, [{ 'id': 7, 'chrom': 'I' }])
+
+  [(statement, payload)] = db.engine.connection.copies
+  assert statement.startswith('COPY variant (id, chrom, "end", note, score, flag) ')
+  assert payload == '7,"I",\\N,\\N,\\N,\\N\n'
+
+
+def test_copy_pg8000_stream():
+  db = stub_db(pg_pg8000.dialect())
+  CopyLoader(db).insert_batch(table, [{ 'chrom': 'I', 'note': None }])
+
+  [(_, payload)] = db.engine.connection.copies
+  assert payload == '"I",\\N,\\N,\\N,\\N\n'
+
+
+def test_copy_empty_batch():
+  db = stub_db()
+  assert CopyLoader(db).insert_batch(table, []) == 0
+  assert db.engine.connection.copies == []
+
+
+def test_column_batch_rows():
+  batch = ColumnBatch({ 'a': [ 1, 2, 3 ], 'b': [ 'x', 'y', 'z' ] })
+  assert len(batch) == 3
+  assert list(batch) == [{ 'a': 1, 'b': 'x' }, { 'a': 2, 'b': 'y' }, { 'a': 3, 'b': 'z' }]
+  assert list(batch[1:]) == [{ 'a': 2, 'b': 'y' }, { 'a': 3, 'b': 'z' }]
+
+
+def test_iter_batches():
+  rows = [ { 'a': i } for i in range(5) ]
+  assert [ list(g) for g in iter_batches(rows, batch_size=2) ] == [ rows[0:2], rows[2:4], rows[4:5] ]
+
+  # Column batches are passed through as-is
+  batches = [ ColumnBatch({ 'a': [ 0, 1 ] }), ColumnBatch({ 'a': [ 2 ] }) ]
+  assert list(iter_batches(batches, batch_size=1)) == batches
+
+  assert list(iter_batches([])) == []
+
+  # Single rows between column batches are grouped separately
+  mixed = [ batches[0], *rows[:3], batches[1], *rows[3:] ]
+  result = [ g if isinstance(g, ColumnBatch) else list(g) for g in iter_batches(mixed, batch_size=2) ]
+  assert result == [ batches[0], rows[0:2], rows[2:3], batches[1], rows[3:5] ]
+
+
+def test_split_rows():
+  rows = [ { 'a': i } for i in range(5) ]
+  head, tail = split_rows(rows, 2)
+  assert list(head) == rows[:2]
+  assert list(tail) == rows[2:]
+
+  # Column batches are cut at the offset
+  head, tail = split_rows([ ColumnBatch({ 'a': [ 0, 1, 2 ] }), ColumnBatch({ 'a': [ 3, 4 ] }) ], 4)
+  assert [ b.columns for b in head ] == [{ 'a': [ 0, 1, 2 ] }, { 'a': [ 3 ] }]
+  assert [ b.columns for b in tail ] == [{ 'a': [ 4 ] }]
+
+  # Offsets past the end of the stream leave nothing after the split
+  head, tail = split_rows([ ColumnBatch({ 'a': [ 0, 1 ] }) ], 5)
+  assert [ b.columns for b in head ] == [{ 'a': [ 0, 1 ] }]
+  assert list(tail) == []
+
+
+def test_copy_fallback():
+  db = stub_db(SimpleNamespace(name='sqlite', driver='pysqlite'))
+  assert isinstance(get_loader(db, 'copy'), ExecutemanyLoader)